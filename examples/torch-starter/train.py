@@ -20,7 +20,7 @@ from jacinle.utils.imp import load_source
 from jacinle.utils.tqdm import tqdm_pbar
 
 from jactorch.cli import escape_desc_name, ensure_path, dump_metainfo
-from jactorch.cuda.copy import async_copy_to
+from jactorch.data.prefetch import BatchPrefetcher
 from jactorch.train import TrainerEnv
 
 logger = get_logger(__file__)
@@ -180,40 +180,41 @@ def train_epoch(epoch, trainer, train_dataloader, meters):
     meters.update(epoch=epoch)
 
     trainer.trigger_event('epoch:before', trainer, epoch)
-    train_iter = iter(train_dataloader)
-
-    end = time.time()
-    with tqdm_pbar(total=nr_iters) as pbar:
-        for i in range(nr_iters):
-            feed_dict = next(train_iter)
-
-            if args.use_gpu:
-                if not args.gpu_parallel:
-                    feed_dict = async_copy_to(feed_dict, 0)
-
-            data_time = time.time() - end; end = time.time()
-
-            loss, monitors, output_dict, extra_info = trainer.step(feed_dict)
-            step_time = time.time() - end; end = time.time()
-
-            # TODO(Jiayuan Mao @ 04/23): normalize the loss/monitors by adding n=xxx if applicable.
-            meters.update(loss=loss)
-            meters.update(monitors)
-            meters.update({'time/data': data_time, 'time/step': step_time})
-
-            if args.use_tb:
-                meters.flush()
-
-            # TODO(Jiayuan Mao @ 04/23): customize the logger. 
-            pbar.set_description(meters.format_simple(
-                'Epoch {}'.format(epoch),
-                {k: v for k, v in meters.val.items() if k.startswith('loss') or k.startswith('time')},
-                compressed=True
-            ))
-            pbar.update()
-
-            end = time.time()
-
+    # Load (and copy to the GPU) the next batches in the background, while the current batch is being processed.
+    device = 0 if args.use_gpu and not args.gpu_parallel else None
+    prefetcher = BatchPrefetcher(train_dataloader, nr_prefetch=2, device=device)
+    train_iter = iter(prefetcher)
+
+    try:
+        end = time.time()
+        with tqdm_pbar(total=nr_iters) as pbar:
+            for i in range(nr_iters):
+                feed_dict = next(train_iter)
+
+                data_time = time.time() - end; end = time.time()
+
+                loss, monitors, output_dict, extra_info = trainer.step(feed_dict)
+                step_time = time.time() - end; end = time.time()
+
+                # TODO(Jiayuan Mao @ 04/23): normalize the loss/monitors by adding n=xxx if applicable.
+                meters.update(loss=loss)
+                meters.update(monitors)
+                meters.update({'time/data': data_time, 'time/step': step_time})
+
+                if args.use_tb:
+                    meters.flush()
+
+                # TODO(Jiayuan Mao @ 04/23): customize the logger. 
+                pbar.set_description(meters.format_simple(
+                    'Epoch {}'.format(epoch),
+                    {k: v for k, v in meters.val.items() if k.startswith('loss') or k.startswith('time')},
+                    compressed=True
+                ))
+                pbar.update()
+
+                end = time.time()
+    finally:
+        prefetcher.close()
     trainer.trigger_event('epoch:after', trainer, epoch)
 
 
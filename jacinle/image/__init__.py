@@ -9,6 +9,8 @@
 # Distributed under terms of the MIT license.
 
 
+from .cache import *
 from .codecs import *
+from .decode import *
 from .imgio import *
 from .imgproc import *
@@ -0,0 +1,329 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : cache.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+"""
+An on-disk cache of preprocessed (e.g., resized and cropped) images.
+
+The images are keyed by a hash of the source path, its modification time and size, and the specification of the
+preprocessing. The arrays are stored in sharded, append-only pack files; the index (the location of each image in the
+pack files, and its last access time) is stored in an SQLite database, which also serializes the writers. Thus, the
+cache can be shared by multiple processes (e.g., DataLoader workers). When the total size exceeds the budget, the
+least recently used images are evicted, and the pack files with too much dead space are compacted.
+"""
+
+import os
+import os.path as osp
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextlib
+
+import numpy as np
+
+from . import imgio, imgproc
+
+__all__ = ['PreprocessedImageCache']
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, shard INTEGER, generation INTEGER, offset INTEGER, '
+    'length INTEGER, dtype TEXT, shape TEXT, atime REAL)',
+    'CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)',
+    'CREATE TABLE IF NOT EXISTS shards (shard INTEGER PRIMARY KEY, generation INTEGER, size INTEGER, live INTEGER)'
+]
+
+
+class _SharedFD(object):
+    """A file descriptor shared by the reader threads. A retired descriptor is closed once all readers release it."""
+
+    __slots__ = ('generation', 'fd', 'refcount', 'retired')
+
+    def __init__(self, generation, fd):
+        self.generation = generation
+        self.fd = fd
+        self.refcount = 0
+        self.retired = False
+
+
+class PreprocessedImageCache(object):
+    """
+    An on-disk, multi-process safe cache of preprocessed images. See the module docstring for details.
+
+    Example:
+        >>> cache = PreprocessedImageCache('/tmp/imgcache', max_size=10 * 1024 ** 3)
+        >>> img = cache.imread('a.jpg', [('resize_minmax', 256), ('center_crop', 224)])
+    """
+
+    def __init__(self, root, max_size=4 * 1024 ** 3, nr_shards=16, compact_ratio=0.5, touch_interval=64):
+        """
+        Args:
+            root (str): the directory of the cache.
+            max_size (int): the size budget (in bytes) of the cached arrays.
+            nr_shards (int): the number of pack files.
+            compact_ratio (float): a pack file is compacted when the fraction of its dead space exceeds this ratio.
+            touch_interval (int): the access times are written to the index in batches of this size.
+        """
+        self.root = root
+        self.max_size = max_size
+        self.nr_shards = nr_shards
+        self.compact_ratio = compact_ratio
+        self.touch_interval = touch_interval
+
+        os.makedirs(root, exist_ok=True)
+        self._local = threading.local()
+        self._touches = dict()
+        self._touches_lock = threading.Lock()
+        self._files = dict()
+        self._files_lock = threading.Lock()
+        self._pid = os.getpid()
+
+        with self._transaction() as c:
+            for stmt in _SCHEMA:
+                c.execute(stmt)
+
+    @property
+    def _conn(self):
+        # Connections (and file descriptors) are not shared across processes or threads.
+        self._check_pid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != self._pid:
+            conn = sqlite3.connect(osp.join(self.root, 'index.sqlite'), timeout=120, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, self._pid
+        return conn
+
+    def _check_pid(self):
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._touches = dict()
+            self._files = dict()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """A write transaction. `BEGIN IMMEDIATE` takes the write lock of the database, serializing all writers."""
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def _shard_path(self, shard, generation):
+        return osp.join(self.root, 'shard-{:03d}.{}.pack'.format(shard, generation))
+
+    @contextlib.contextmanager
+    def _open_shard(self, shard, generation):
+        """
+        Borrow the file descriptor of a pack file. When a shard is compacted, the descriptor of the old generation is
+        retired, and closed only after all threads reading from it have released it.
+        """
+        with self._files_lock:
+            entry = self._files.get(shard)
+            if entry is None or entry.generation != generation:
+                fd = os.open(self._shard_path(shard, generation), os.O_RDONLY)
+                if entry is not None:
+                    self._retire_fd(entry)
+                entry = self._files[shard] = _SharedFD(generation, fd)
+            entry.refcount += 1
+        try:
+            yield entry.fd
+        finally:
+            with self._files_lock:
+                entry.refcount -= 1
+                if entry.retired and entry.refcount == 0:
+                    os.close(entry.fd)
+
+    def _retire_fd(self, entry):
+        # Must be called with the files lock.
+        entry.retired = True
+        if entry.refcount == 0:
+            os.close(entry.fd)
+
+    @staticmethod
+    def make_key(path, spec):
+        """Make the cache key of a source image and the specification of the preprocessing (a JSON-serializable value)."""
+        st = os.stat(path)
+        payload = json.dumps([osp.abspath(path), st.st_mtime_ns, st.st_size, spec], sort_keys=True, default=repr)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key, default=None):
+        """Get a cached array by its key."""
+        row = self._conn.execute(
+            'SELECT shard, generation, offset, length, dtype, shape FROM entries WHERE key = ?', (key, )
+        ).fetchone()
+        if row is None:
+            return default
+        shard, generation, offset, length, dtype, shape = row
+        value = np.empty(json.loads(shape), dtype=dtype)
+        try:
+            with self._open_shard(shard, generation) as fd:
+                if os.preadv(fd, [memoryview(value).cast('B')], offset) != length:
+                    return default
+        except FileNotFoundError:  # the shard has just been compacted.
+            return default
+        self._touch(key)
+        return value
+
+    def put(self, key, value):
+        """Put an array into the cache."""
+        value = np.ascontiguousarray(value)
+        assert value.dtype != object, 'Object arrays can not be cached.'
+        data = value.tobytes()
+        self._flush_touches()
+        with self._transaction() as c:
+            if c.execute('SELECT 1 FROM entries WHERE key = ?', (key, )).fetchone() is not None:
+                return
+            shard = int(key[:8], 16) % self.nr_shards
+            row = c.execute('SELECT generation FROM shards WHERE shard = ?', (shard, )).fetchone()
+            if row is None:
+                c.execute('INSERT INTO shards VALUES (?, 0, 0, 0)', (shard, ))
+                generation = 0
+            else:
+                generation = row[0]
+            with open(self._shard_path(shard, generation), 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(data)
+            c.execute('UPDATE shards SET size = ?, live = live + ? WHERE shard = ?', (offset + len(data), len(data), shard))
+            c.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                key, shard, generation, offset, len(data), value.dtype.str, json.dumps(value.shape), time.time()
+            ))
+            removed = self._evict(c)
+        for path in removed:
+            os.remove(path)
+
+    def get_or_compute(self, key, compute):
+        """Get a cached array, or compute and cache it. A None value (e.g., an unreadable image) is not cached."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def imread(self, path, transforms=(), spec=None):
+        """
+        Read an image and preprocess it, using the cache.
+
+        Args:
+            path (str): the path of the image.
+            transforms (list): the preprocessing steps. Each step is either a tuple of (the name of a function in
+                :mod:`jacinle.image.imgproc`, its arguments), where the arguments is a dict of keyword arguments, a
+                tuple of positional arguments, or a single argument; or a callable that takes and returns an image.
+            spec: the specification of the preprocessing, used in the cache key. It is required if any of the
+                transforms is a callable; default to the transforms themselves.
+
+        Returns:
+            np.ndarray: the preprocessed image, or None if the image can not be read.
+        """
+        if spec is None:
+            assert not any(callable(t) for t in transforms), 'spec is required when using callable transforms.'
+            spec = [list(t) for t in transforms]
+        if not osp.exists(path):
+            return None
+
+        def compute():
+            img = imgio.imread(path)
+            if img is None:
+                return None
+            for t in transforms:
+                if callable(t):
+                    img = t(img)
+                    continue
+                name, args = t
+                func = getattr(imgproc, name)
+                if isinstance(args, dict):
+                    img = func(img, **args)
+                elif isinstance(args, tuple):
+                    img = func(img, *args)
+                else:
+                    img = func(img, args)
+            return img
+
+        return self.get_or_compute(self.make_key(path, spec), compute)
+
+    def _touch(self, key):
+        with self._touches_lock:
+            self._touches[key] = time.time()
+            flush = len(self._touches) >= self.touch_interval
+        if flush:
+            self._flush_touches()
+
+    def _flush_touches(self):
+        with self._touches_lock:
+            touches, self._touches = self._touches, dict()
+        if len(touches) > 0:
+            with self._transaction() as c:
+                c.executemany('UPDATE entries SET atime = max(atime, ?) WHERE key = ?', [(t, k) for k, t in touches.items()])
+
+    def _evict(self, c):
+        """Evict the least recently used entries if the size exceeds the budget. Returns the files to be removed."""
+        total = c.execute('SELECT COALESCE(SUM(live), 0) FROM shards').fetchone()[0]
+        if total <= self.max_size:
+            return []
+
+        # Evict down to 90% of the budget, so that the eviction does not happen on every put.
+        target = total - int(self.max_size * 0.9)
+        evicted = []
+        for key, shard, length in c.execute('SELECT key, shard, length FROM entries ORDER BY atime'):
+            if target <= 0:
+                break
+            evicted.append((key, shard, length))
+            target -= length
+        c.executemany('DELETE FROM entries WHERE key = ?', [(e[0], ) for e in evicted])
+        c.executemany('UPDATE shards SET live = live - ? WHERE shard = ?', [(e[2], e[1]) for e in evicted])
+
+        removed = []
+        for shard in sorted({e[1] for e in evicted}):
+            generation, size, live = c.execute('SELECT generation, size, live FROM shards WHERE shard = ?', (shard, )).fetchone()
+            if size > 0 and (size - live) / size > self.compact_ratio:
+                removed.append(self._compact(c, shard, generation))
+        return removed
+
+    def _compact(self, c, shard, generation):
+        """Rewrite the live entries of a shard into a new pack file. Returns the old file."""
+        old_path, new_path = self._shard_path(shard, generation), self._shard_path(shard, generation + 1)
+        rows = c.execute('SELECT key, offset, length FROM entries WHERE shard = ? ORDER BY offset', (shard, )).fetchall()
+        updates = []
+        with open(old_path, 'rb') as fin, open(new_path, 'wb') as fout:
+            for key, offset, length in rows:
+                fin.seek(offset)
+                updates.append((generation + 1, fout.tell(), key))
+                fout.write(fin.read(length))
+            size = fout.tell()
+        c.executemany('UPDATE entries SET generation = ?, offset = ? WHERE key = ?', updates)
+        c.execute('UPDATE shards SET generation = ?, size = ?, live = ? WHERE shard = ?', (generation + 1, size, size, shard))
+        return old_path
+
+    @property
+    def size(self):
+        """The total size of the cached arrays."""
+        return self._conn.execute('SELECT COALESCE(SUM(live), 0) FROM shards').fetchone()[0]
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def __contains__(self, key):
+        return self._conn.execute('SELECT 1 FROM entries WHERE key = ?', (key, )).fetchone() is not None
+
+    def close(self):
+        self._flush_touches()
+        with self._files_lock:
+            for entry in self._files.values():
+                self._retire_fd(entry)
+            self._files = dict()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
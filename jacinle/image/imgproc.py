@@ -24,7 +24,8 @@ __all__ = [
     'dimshuffle',
     'clip', 'clip_decorator',
     'grayscale',
-    'brightness', 'contrast', 'saturation'
+    'brightness', 'contrast', 'saturation',
+    'color_transform'
 ]
 
 
@@ -183,3 +184,49 @@ def saturation(img, alpha):
     gs = grayscale(img)
     img = img * alpha + gs * (1 - alpha)
     return img
+
+
+def color_transform(img, matrix, offset=None, out=None, chunk_size=8):
+    """
+    Apply an affine color transform `y = matrix @ x + offset` to all pixels, and clip the result into [0, 255].
+
+    The input can be a single image of shape `[H, W, C]` (with a `[C, C]` matrix and a `[C]` offset), or a batch of
+    shape `[N, H, W, C]` (with per-image `[N, C, C]` matrices and `[N, C]` offsets). The transform is computed in
+    float32, `chunk_size` images at a time. For uint8 inputs and outputs with diagonal matrices, it is applied with
+    per-channel lookup tables instead. The output has the dtype of `out` (default: the dtype of the input); `out`
+    can be the input itself.
+    """
+    batched = img.ndim == 4
+    imgs = img if batched else img[np.newaxis]
+    n, c = imgs.shape[0], imgs.shape[-1]
+    matrix = np.broadcast_to(np.asarray(matrix, dtype='float32').reshape(-1, c, c), (n, c, c))
+    if offset is None:
+        offset = np.zeros((n, c), dtype='float32')
+    offset = np.broadcast_to(np.asarray(offset, dtype='float32').reshape(-1, c), (n, c))
+    if out is None:
+        out = np.empty_like(imgs)
+    elif not batched:
+        out = out[np.newaxis]
+
+    diagonal = np.diagonal(matrix, axis1=1, axis2=2)
+    if imgs.dtype == np.uint8 and out.dtype == np.uint8 and np.array_equal(matrix, diagonal[:, :, np.newaxis] * np.eye(c, dtype='float32')):
+        lut = np.arange(256, dtype='float32') * diagonal[:, :, np.newaxis] + offset[:, :, np.newaxis]
+        lut = np.clip(lut, 0, 255, out=lut).astype('uint8')
+        for i in range(n):
+            for j in range(c):
+                np.take(lut[i, j], imgs[i, ..., j], out=out[i, ..., j], mode='clip')
+    else:
+        buffer, result = None, None
+        for begin in range(0, n, chunk_size):
+            end = min(begin + chunk_size, n)
+            x = imgs[begin:end].reshape(end - begin, -1, c)
+            if buffer is None or len(buffer) != end - begin:
+                buffer = np.empty(x.shape, dtype='float32')
+                result = np.empty(x.shape, dtype='float32')
+            np.copyto(buffer, x, casting='unsafe')
+            np.matmul(buffer, matrix[begin:end].transpose(0, 2, 1), out=result)
+            result += offset[begin:end, np.newaxis]
+            np.clip(result, 0, 255, out=result)
+            np.copyto(out[begin:end], result.reshape(out[begin:end].shape), casting='unsafe')
+
+    return out if batched else out[0]
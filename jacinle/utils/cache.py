@@ -8,38 +8,80 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
+import os
+import time
+import enum
+import pickle
+import hashlib
+import inspect
+import tempfile
 import functools
 import collections
+import dataclasses
 import os.path as osp
 import threading
 
+import numpy as np
+
 import jacinle.io as io
 from .meta import synchronized
 
-__all__ = ['cached_property', 'cached_result', 'fs_cached_result']
+__all__ = ['cached_property', 'cached_result', 'fs_cached_result', 'stable_hash', 'memoize', 'CacheInfo']
 
 
 class cached_property:
+    """
+    A property that is computed once per instance. The value is stored in the `__dict__` of the instance under the
+    name of the property, so that later accesses do not go through the descriptor at all. The computation is protected
+    by a per-instance lock (double-checked), which is stored in the instance and dropped once the value is computed.
+    Use `reset` (e.g., `type(obj).prop.reset(obj)`) to drop the cached value. Accessing the property on the class
+    returns the descriptor itself (not `fget`).
+    """
+
     def __init__(self, fget):
         self.fget = fget
         self.__module__ = fget.__module__
         self.__name__ = fget.__name__
         self.__doc__ = fget.__doc__
-        self.__cache_key = '__result_cache_{}_{}'.format(
-            fget.__name__, id(fget))
-        self.__mutex = collections.defaultdict(threading.Lock)
+        self.__lock_key = '__cached_property_lock_{}'.format(fget.__name__)
+        self.__mutex = threading.Lock()
+
+    def __set_name__(self, owner, name):
+        self.__name__ = name
+        self.__lock_key = '__cached_property_lock_{}'.format(name)
 
     def __get__(self, instance, owner):
-        with self.__mutex[instance]:
-            if instance is None:
-                return self.fget
-            v = getattr(instance, self.__cache_key, None)
-            if v is not None:
+        if instance is None:
+            return self
+
+        d = instance.__dict__
+        try:
+            return d[self.__name__]
+        except KeyError:
+            pass
+
+        # The mutex only guards the creation of the per-instance lock.
+        with self.__mutex:
+            lock = d.get(self.__lock_key)
+            if lock is None:
+                lock = d[self.__lock_key] = threading.Lock()
+        with lock:
+            try:
+                return d[self.__name__]
+            except KeyError:
+                pass
+            try:
+                v = self.fget(instance)
+                assert v is not None
+                d[self.__name__] = v
                 return v
-            v = self.fget(instance)
-            assert v is not None
-            setattr(instance, self.__cache_key, v)
-            return v
+            finally:
+                # Also drop the lock if fget fails, so that the instance stays picklable.
+                d.pop(self.__lock_key, None)
+
+    def reset(self, instance):
+        """Drop the cached value of the instance; it will be recomputed on the next access."""
+        instance.__dict__.pop(self.__name__, None)
 
 
 def cached_result(func):
@@ -73,3 +115,240 @@ def fs_cached_result(filename, force_update=False):
         return wrapped_func
     return wrapper
 
+
+
+def _hash_update(h, obj):
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes)):
+        h.update(b'P' + type(obj).__name__.encode() + b':' + repr(obj).encode('utf-8') + b';')
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            h.update(b'O' + repr(obj.shape).encode() + b'[')
+            for x in obj.flat:
+                _hash_update(h, x)
+            h.update(b']')
+        else:
+            h.update(b'A' + obj.dtype.str.encode() + repr(obj.shape).encode() + b':')
+            if obj.dtype.kind in 'mM':  # datetime64 and timedelta64 arrays do not support the buffer protocol.
+                obj = obj.view(np.int64)
+            h.update(np.ascontiguousarray(obj).data.cast('B'))
+            h.update(b';')
+    elif isinstance(obj, np.generic):
+        h.update(b'S' + obj.dtype.str.encode() + b':' + obj.tobytes() + b';')
+    elif isinstance(obj, (tuple, list)):
+        h.update(b'L' + type(obj).__name__.encode() + b'[')
+        for x in obj:
+            _hash_update(h, x)
+        h.update(b']')
+    elif isinstance(obj, collections.abc.Mapping):
+        # Mappings and sets are hashed regardless of the order of their items.
+        items = sorted(stable_hash(k) + stable_hash(v) for k, v in obj.items())
+        h.update(b'D' + type(obj).__name__.encode() + b'{' + ','.join(items).encode() + b'}')
+    elif isinstance(obj, (set, frozenset)):
+        items = sorted(stable_hash(x) for x in obj)
+        h.update(b'T' + type(obj).__name__.encode() + b'{' + ','.join(items).encode() + b'}')
+    elif isinstance(obj, enum.Enum):
+        h.update(b'E' + type(obj).__qualname__.encode() + b'.' + obj.name.encode() + b';')
+    elif dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        h.update(b'C' + type(obj).__module__.encode() + b'.' + type(obj).__qualname__.encode() + b'(')
+        for field in dataclasses.fields(obj):
+            h.update(field.name.encode() + b'=')
+            _hash_update(h, getattr(obj, field.name))
+        h.update(b')')
+    elif hasattr(obj, 'detach') and hasattr(obj, 'cpu') and hasattr(obj, 'numpy'):  # torch.Tensor.
+        _hash_update(h, obj.detach().cpu().numpy())
+    else:
+        h.update(b'K' + pickle.dumps(obj, protocol=4) + b';')
+
+
+def stable_hash(obj):
+    """
+    Compute a hash of an object that is stable across processes and runs (unlike the builtin `hash`).
+    Supports None, numbers, strings, bytes, tuples, lists, dicts, sets, enums, ndarrays (hashed by their dtype, shape and
+    content), dataclasses and torch tensors. Other objects are hashed by their pickled bytes.
+
+    Returns:
+        str: the hex digest.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    _hash_update(h, obj)
+    return h.hexdigest()
+
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'disk_hits', 'misses', 'maxsize', 'currsize'])
+
+
+class _MemoizedFunction(object):
+    def __init__(self, func, maxsize, ttl, disk_dir, disk_max_size, disk_ttl, version):
+        self.func = func
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_size = disk_max_size
+        self.disk_ttl = disk_ttl
+        self.version = version
+
+        self._signature = inspect.signature(func)
+        self._name = '{}.{}'.format(func.__module__, func.__qualname__)
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._disk_hits = self._misses = 0
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        functools.update_wrapper(self, func)
+
+    def make_key(self, *args, **kwargs):
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return stable_hash((self._name, self.version, tuple(bound.arguments.items())))
+
+    def __call__(self, *args, **kwargs):
+        key = self.make_key(*args, **kwargs)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, timestamp = entry
+                if self.ttl is None or now - timestamp <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._memory[key]
+
+        if self.disk_dir is not None:
+            found, value = self._disk_get(key, now)
+            if found:
+                with self._lock:
+                    self._disk_hits += 1
+                self._memory_put(key, value, now)
+                return value
+
+        with self._lock:
+            self._misses += 1
+        # The value is computed without holding the lock; concurrent callers may compute the same value.
+        value = self.func(*args, **kwargs)
+        self._memory_put(key, value, now)
+        if self.disk_dir is not None:
+            self._disk_put(key, value, now)
+        return value
+
+    def _memory_put(self, key, value, timestamp):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._memory[key] = (value, timestamp)
+            self._memory.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._memory) > self.maxsize:
+                    self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        return osp.join(self.disk_dir, key + '.pkl')
+
+    def _disk_get(self, key, now):
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                created, value = pickle.load(f)
+            # The TTL is based on the creation time stored in the file, since the modification time is bumped on
+            # every hit: it is used as the access time for the LRU eviction.
+            if self.disk_ttl is not None and now - created > self.disk_ttl:
+                os.remove(path)
+                return False, None
+            os.utime(path)
+            return True, value
+        except (FileNotFoundError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+            return False, None
+
+    def _disk_put(self, key, value, created):
+        # Write to a temporary file and rename it, so that other processes never see partial files.
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((created, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._disk_path(key))
+        except BaseException:
+            if osp.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.disk_max_size is not None:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.pkl'):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.disk_max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self._hits, self._disk_hits, self._misses, self.maxsize, len(self._memory))
+
+    def cache_clear(self, disk=False):
+        """Clear the in-memory cache (and the on-disk cache, if `disk` is True). The statistics are also reset."""
+        with self._lock:
+            self._memory.clear()
+            self._hits = self._disk_hits = self._misses = 0
+        if disk and self.disk_dir is not None:
+            for entry in os.scandir(self.disk_dir):
+                if entry.name.endswith('.pkl'):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def invalidate(self, *args, **kwargs):
+        """Remove the cached result of the given arguments from both tiers."""
+        key = self.make_key(*args, **kwargs)
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.disk_dir is not None:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return functools.partial(self, instance)
+
+
+def memoize(maxsize=128, ttl=None, disk_dir=None, disk_max_size=None, disk_ttl=None, version=None):
+    """
+    Memoize a function by its arguments. The arguments are bound to the signature of the function (so that `f(1, b=2)`
+    and `f(1, 2)` share the same entry) and hashed with :func:`stable_hash`.
+
+    Args:
+        maxsize (int): the size of the in-memory LRU cache. None for unlimited, 0 to disable the in-memory cache.
+        ttl (float): the time-to-live (in seconds) of the in-memory entries.
+        disk_dir (str): optional, the directory of the on-disk cache. The results are pickled into files named by the
+            hash of the arguments. The directory can be shared across processes and runs.
+        disk_max_size (int): the size budget (in bytes) of the on-disk cache; the least recently used files are removed.
+        disk_ttl (float): the time-to-live (in seconds) of the on-disk entries.
+        version: included in the keys; change it to invalidate the results computed by an older implementation.
+
+    The memoized function has `cache_info()`, `cache_clear(disk=False)` and `invalidate(*args, **kwargs)` methods.
+
+    Example:
+        >>> @memoize(maxsize=1024, disk_dir='/tmp/features')
+        >>> def extract_features(image, config):
+        >>>     ...
+    """
+    def wrapper(func):
+        return _MemoizedFunction(func, maxsize, ttl, disk_dir, disk_max_size, disk_ttl, version)
+    return wrapper
@@ -11,7 +11,7 @@
 
 import fnmatch
 import re
-import collections
+import collections.abc
 
 __all__ = ['NameMatcher']
 
@@ -23,11 +23,13 @@ class NameMatcher(object):
         elif isinstance(rules, dict):
             self._rules = list(rules.items())
         else:
-            assert isinstance(rules, collections.Iterable)
+            assert isinstance(rules, collections.abc.Iterable)
             self._rules = list(rules)
 
         self._map = {}
         self._compiled_rules = []
+        self._compiled_pattern = None
+        self._cache = {}
         self._compiled = False
 
         self._matched = []
@@ -44,12 +46,15 @@ class NameMatcher(object):
 
     def append_rule(self, rule):
         self._rules.append(tuple(rule))
+        self._compiled = False
 
     def insert_rule(self, index, rule):
-        self._rules.insert(index, rule)
+        self._rules.insert(index, tuple(rule))
+        self._compiled = False
 
     def pop_rule(self, index=None):
         self._rules.pop(index)
+        self._compiled = False
 
     def begin(self, *, force_compile=False):
         if not self._compiled or force_compile:
@@ -58,28 +63,74 @@ class NameMatcher(object):
         self._unused = set(range(len(self._compiled_rules)))
 
     def end(self):
+        if not self._compiled:
+            self.compile()
         return self._matched, {self._compiled_rules[i][0] for i in self._unused}
 
+    def _match_index(self, k):
+        i = self._cache.get(k)
+        if i is None:
+            m = self._compiled_pattern.match(k)
+            if m is None:
+                i = -1
+            else:
+                name = m.lastgroup
+                if name is None or not name.startswith('_rule'):
+                    name = next(n for n, v in m.groupdict().items() if v is not None)
+                i = int(name[5:])
+            self._cache[k] = i
+        return i
+
     def match(self, k):
-        for i, (r, p, v) in enumerate(self._compiled_rules):
-            if p.match(k):
-                if i in self._unused:
-                    self._unused.remove(i)
-                self._matched.append((k, r, v))
-                return v
-        return None
+        if not self._compiled:
+            self.compile()
+        i = self._match_index(k)
+        if i < 0:
+            return None
+        r, v = self._compiled_rules[i][0], self._compiled_rules[i][2]
+        self._unused.discard(i)
+        self._matched.append((k, r, v))
+        return v
+
+    def match_all(self, names):
+        """Match a list of names. Returns the list of matched values (None for names that match no rule)."""
+        if not self._compiled:
+            self.compile()
+        indices = [self._match_index(k) for k in names]
+        self._unused.difference_update(indices)
+        rules = self._compiled_rules
+        self._matched.extend((k, rules[i][0], rules[i][2]) for k, i in zip(names, indices) if i >= 0)
+        return [rules[i][2] if i >= 0 else None for i in indices]
 
     def compile(self):
+        """
+        Compile all rules into a single regex: an alternation of the rules (in order), each in a named group. Since
+        Python regexes try the alternatives from left to right, the first matching rule wins, as if the rules were
+        tried one by one. The results are cached for each name.
+
+        When the rules are changed during a matching session (between `begin` and `end`), the set of unused rules is
+        recomputed for the new rules, keeping the rules that have already been matched in this session as used.
+        """
         self._map = dict()
         self._compiled_rules = []
+        self._cache = dict()
 
         for r, v in self._rules:
             self._map[r] = v
             p = fnmatch.translate(r)
             p = re.compile(p, flags=re.IGNORECASE)
             self._compiled_rules.append((r, p, v))
+
+        if len(self._compiled_rules) > 0:
+            combined = '|'.join('(?P<_rule{}>{})'.format(i, p.pattern) for i, (r, p, v) in enumerate(self._compiled_rules))
+            self._compiled_pattern = re.compile(combined, flags=re.IGNORECASE)
+        else:
+            self._compiled_pattern = re.compile(r'(?!)')
         self._compiled = True
 
+        used = {r for _, r, _ in self._matched}
+        self._unused = {i for i, (r, _, _) in enumerate(self._compiled_rules) if r not in used}
+
     def __enter__(self):
         self.begin()
         return self
@@ -12,6 +12,7 @@ import functools
 import operator
 import six
 import collections
+import collections.abc
 import threading
 import contextlib
 
@@ -31,9 +32,9 @@ __all__ = [
 
 
 def gofor(v):
-    if isinstance(v, collections.Mapping):
+    if isinstance(v, collections.abc.Mapping):
         return v.items()
-    assert_instance(v, collections.Iterable)
+    assert_instance(v, collections.abc.Iterable)
     return enumerate(v)
 
 
@@ -70,11 +71,11 @@ def filter_exec(func, iterable):
 def stmap(func, iterable):
     if isinstance(iterable, six.string_types):
         return func(iterable)
-    elif isinstance(iterable, (collections.Sequence, collections.UserList)):
+    elif isinstance(iterable, (collections.abc.Sequence, collections.UserList)):
         return [stmap(func, v) for v in iterable]
-    elif isinstance(iterable, collections.Set):
+    elif isinstance(iterable, collections.abc.Set):
         return {stmap(func, v) for v in iterable}
-    elif isinstance(iterable, (collections.Mapping, collections.UserDict)):
+    elif isinstance(iterable, (collections.abc.Mapping, collections.UserDict)):
         return {k: stmap(func, v) for k, v in iterable.items()}
     else:
         return func(iterable)
@@ -142,13 +143,13 @@ def dict_deep_update(a, b):
 
 def dict_deep_kv(d, sort=True, sep='.', allow_dict=False):
     # Not using collections.Sequence to avoid infinite recursion.
-    assert isinstance(d, (tuple, list, collections.Mapping))
+    assert isinstance(d, (tuple, list, collections.abc.Mapping))
     result = list()
 
     def _dfs(current, prefix=None):
         for key, value in gofor(current):
             current_key = key if prefix is None else prefix + sep + str(key)
-            if isinstance(current[key], (tuple, list, collections.Mapping)):
+            if isinstance(current[key], (tuple, list, collections.abc.Mapping)):
                 if allow_dict:
                     result.append((current_key, value))
                 _dfs(current[key], current_key)
@@ -6,6 +6,7 @@ import time
 from collections import defaultdict
 from . import mask as maskUtils
 import copy
+import multiprocessing
 
 class COCOeval:
     # Interface for evaluating detection on the Microsoft COCO dataset.
@@ -15,6 +16,7 @@ class COCOeval:
     #  E = CocoEval(cocoGt,cocoDt); # initialize CocoEval object
     #  E.params.recThrs = ...;      # set parameters as desired
     #  E.evaluate();                # run per image evaluation
+    #                               # (E.evaluate(nrWorkers=N) shards the images across N processes)
     #  E.accumulate();              # accumulate per image results
     #  E.summarize();               # display summary metrics of results
     # For example usage see evalDemo.m and http://mscoco.org/.
@@ -119,9 +121,10 @@ class COCOeval:
         self.evalImgs = defaultdict(list)   # per-image per-category evaluation results
         self.eval     = {}                  # accumulated evaluation results
 
-    def evaluate(self):
+    def evaluate(self, nrWorkers=0):
         '''
         Run per image evaluation on given images and store results (a list of dict) in self.evalImgs
+        :param nrWorkers: if larger than 1, shard the images across a pool of nrWorkers processes
         :return: None
         '''
         tic = time.time()
@@ -142,25 +145,117 @@ class COCOeval:
         # loop through images, area range, max detection number
         catIds = p.catIds if p.useCats else [-1]
 
-        if p.iouType == 'segm' or p.iouType == 'bbox':
-            computeIoU = self.computeIoU
-        elif p.iouType == 'keypoints':
-            computeIoU = self.computeOks
-        self.ious = {(imgId, catId): computeIoU(imgId, catId) \
-                        for imgId in p.imgIds
-                        for catId in catIds}
-
-        evaluateImg = self.evaluateImg
-        maxDet = p.maxDets[-1]
-        self.evalImgs = [evaluateImg(imgId, catId, areaRng, maxDet)
+        if nrWorkers > 1 and len(p.imgIds) > 1:
+            # shard the images across worker processes; each shard carries only its own gts and dts
+            shards = [list(s) for s in np.array_split(np.array(p.imgIds), min(nrWorkers, len(p.imgIds)))]
+            jobs = []
+            for imgIds in shards:
+                imgSet = set(imgIds)
+                gts = {k: v for k, v in self._gts.items() if k[0] in imgSet}
+                dts = {k: v for k, v in self._dts.items() if k[0] in imgSet}
+                jobs.append((p, gts, dts, imgIds))
+            with multiprocessing.Pool(len(jobs)) as pool:
+                results = pool.map(_evaluateShard, jobs)
+        else:
+            results = [self._evaluateImgs(p.imgIds)]
+
+        self.ious = dict()
+        evalImgs = dict()
+        for ious, e in results:
+            self.ious.update(ious)
+            evalImgs.update(e)
+        self.evalImgs = [evalImgs[catId, a, imgId]
                  for catId in catIds
-                 for areaRng in p.areaRng
+                 for a in range(len(p.areaRng))
                  for imgId in p.imgIds
              ]
         self._paramsEval = copy.deepcopy(self.params)
         toc = time.time()
         print('DONE (t={:0.2f}s).'.format(toc-tic))
 
+    def _evaluateImgs(self, imgIds):
+        '''
+        Compute the ious and evaluate all (image, category) pairs of the given images, at all area ranges
+        :return: ious (dict), evalImgs (dict indexed by (catId, areaRng index, imgId))
+        '''
+        p = self.params
+        catIds = p.catIds if p.useCats else [-1]
+        keys = [(imgId, catId) for imgId in imgIds for catId in catIds]
+        if p.iouType == 'bbox':
+            self.ious = self.computeBatchIoU(keys)
+        elif p.iouType == 'segm':
+            self.ious = {k: self.computeIoU(*k) for k in keys}
+        elif p.iouType == 'keypoints':
+            self.ious = {k: self.computeOks(*k) for k in keys}
+
+        evalImgs = dict()
+        for (imgId, catId), es in zip(keys, self.evaluateImgsAreas(keys, p.maxDets[-1])):
+            for a, e in enumerate(es):
+                evalImgs[catId, a, imgId] = e
+        return self.ious, evalImgs
+
+    def _getGtDt(self, imgId, catId):
+        p = self.params
+        if p.useCats:
+            gt = self._gts[imgId,catId]
+            dt = self._dts[imgId,catId]
+        else:
+            gt = [_ for cId in p.catIds for _ in self._gts[imgId,cId]]
+            dt = [_ for cId in p.catIds for _ in self._dts[imgId,cId]]
+        return gt, dt
+
+    def computeBatchIoU(self, keys):
+        '''
+        Compute the bbox ious of all (imgId, catId) pairs at once. Identical to computeIoU with iouType == 'bbox'.
+        :param keys: list of (imgId, catId)
+        :return: dict of ious, indexed by (imgId, catId)
+        '''
+        p = self.params
+        dBoxes, gBoxes, crowds, shapes = [], [], [], []
+        for imgId, catId in keys:
+            gt, dt = self._getGtDt(imgId, catId)
+            inds = np.argsort([-d['score'] for d in dt], kind='mergesort')
+            dt = [dt[i] for i in inds[0:p.maxDets[-1]]]
+            dBoxes.extend(d['bbox'] for d in dt)
+            gBoxes.extend(g['bbox'] for g in gt)
+            crowds.extend(int(g['iscrowd']) for g in gt)
+            shapes.append((len(dt), len(gt)))
+
+        shapes = np.array(shapes, dtype=np.int64).reshape(-1, 2)
+        dBoxes = np.array(dBoxes, dtype=np.float64).reshape(-1, 4)
+        gBoxes = np.array(gBoxes, dtype=np.float64).reshape(-1, 4)
+        crowds = np.array(crowds, dtype=bool)
+        # flat indices of all (dt, gt) pairs: pair j of key k is (dStart[k] + j // G, gStart[k] + j % G)
+        sizes = shapes[:, 0] * shapes[:, 1]
+        dStart = np.cumsum(shapes[:, 0]) - shapes[:, 0]
+        gStart = np.cumsum(shapes[:, 1]) - shapes[:, 1]
+        pairStart = np.cumsum(sizes) - sizes
+        keyOfPair = np.repeat(np.arange(len(keys)), sizes)
+        j = np.arange(sizes.sum()) - pairStart[keyOfPair]
+        G = shapes[keyOfPair, 1]
+        di = dStart[keyOfPair] + j // np.maximum(G, 1)
+        gi = gStart[keyOfPair] + j % np.maximum(G, 1)
+
+        # the same arithmetic as bbIou in maskApi.c
+        d, g = dBoxes[di], gBoxes[gi]
+        da = d[:, 2] * d[:, 3]
+        ga = g[:, 2] * g[:, 3]
+        w = np.minimum(d[:, 2] + d[:, 0], g[:, 2] + g[:, 0]) - np.maximum(d[:, 0], g[:, 0])
+        h = np.minimum(d[:, 3] + d[:, 1], g[:, 3] + g[:, 1]) - np.maximum(d[:, 1], g[:, 1])
+        i = w * h
+        u = np.where(crowds[gi], da, da + ga - i)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            o = np.where((w > 0) & (h > 0), i / u, 0)
+
+        ious = dict()
+        for k, key in enumerate(keys):
+            D, G = shapes[k]
+            if D == 0 or G == 0:
+                ious[key] = []
+            else:
+                ious[key] = o[pairStart[k]:pairStart[k] + D * G].reshape(D, G)
+        return ious
+
     def computeIoU(self, imgId, catId):
         p = self.params
         if p.useCats:
@@ -313,6 +408,145 @@ class COCOeval:
                 'dtIgnore':     dtIg,
             }
 
+    def evaluateImgAreas(self, imgId, catId, maxDet):
+        '''
+        perform evaluation for single category and image at all area ranges. The results are identical to
+        [evaluateImg(imgId, catId, aRng, maxDet) for aRng in params.areaRng].
+        :return: list of dict (single image results), one for each area range
+        '''
+        return self.evaluateImgsAreas([(imgId, catId)], maxDet)[0]
+
+    def evaluateImgsAreas(self, keys, maxDet, chunkSize=1<<22):
+        '''
+        perform evaluation for multiple (imgId, catId) pairs at all area ranges. The greedy matching is run on
+        padded arrays of shape [pairs, area ranges, iou thresholds, gts], one detection (in the score order) at a time,
+        so the Python loop runs over detections instead of over pairs, area ranges, thresholds, and gts.
+        :param keys: list of (imgId, catId)
+        :param chunkSize: max number of elements of the padded iou array of a batch
+        :return: list of list of dict (single image results), one list for each pair
+        '''
+        p = self.params
+        A = len(p.areaRng)
+        T = len(p.iouThrs)
+        aRng = np.array(p.areaRng, dtype=np.float64).reshape(A, 2)
+
+        pairs = [self._preparePair(imgId, catId, maxDet, aRng) for imgId, catId in keys]
+        # only pairs with both gts and dts need to be matched; batch pairs of similar sizes together
+        todo = [i for i, r in enumerate(pairs) if r is not None and r['ious'] is not None]
+        todo.sort(key=lambda i: pairs[i]['ious'].shape[1:])
+        b = 0
+        while b < len(todo):
+            D, G = pairs[todo[b]]['ious'].shape[1:]
+            e = b + 1
+            while e < len(todo):
+                d, g = pairs[todo[e]]['ious'].shape[1:]
+                if (e - b + 1) * A * max(D, d) * max(G, g) > chunkSize:
+                    break
+                D, G = max(D, d), max(G, g)
+                e += 1
+            self._matchPairs([pairs[i] for i in todo[b:e]], D, G)
+            b = e
+
+        results = []
+        for (imgId, catId), r in zip(keys, pairs):
+            if r is None:
+                results.append([None] * A)
+                continue
+            D, G = len(r['dt']), len(r['gtIds'][0])
+            if r['ious'] is None:
+                r['dtm'], r['gtm'], r['dtIg'] = np.zeros((A,T,D)), np.zeros((A,T,G)), np.zeros((A,T,D), dtype=bool)
+            # set unmatched detections outside of area range to ignore
+            dtArea = np.array([d['area'] for d in r['dt']], dtype=np.float64)
+            a = ((dtArea[None] < aRng[:, 0:1]) | (dtArea[None] > aRng[:, 1:2]))[:, None, :]
+            dtIg = np.logical_or(r['dtIg'], np.logical_and(r['dtm']==0, a))
+            dtIds = [d['id'] for d in r['dt']]
+            dtScores = [d['score'] for d in r['dt']]
+            # store results for given image and category
+            results.append([{
+                    'image_id':     imgId,
+                    'category_id':  catId,
+                    'aRng':         p.areaRng[k],
+                    'maxDet':       maxDet,
+                    'dtIds':        dtIds,
+                    'gtIds':        r['gtIds'][k].tolist(),
+                    'dtMatches':    r['dtm'][k],
+                    'gtMatches':    r['gtm'][k],
+                    'dtScores':     dtScores,
+                    'gtIgnore':     r['gtIg'][k].astype(int),
+                    'dtIgnore':     dtIg[k],
+                } for k in range(A)])
+        return results
+
+    def _preparePair(self, imgId, catId, maxDet, aRng):
+        gt, dt = self._getGtDt(imgId, catId)
+        if len(gt) == 0 and len(dt) ==0:
+            return None
+        A = len(aRng)
+        G = len(gt)
+        gtArea = np.array([g['area'] for g in gt], dtype=np.float64)
+        gtIg = np.array([bool(g['ignore']) for g in gt], dtype=bool)[None] | \
+            (gtArea[None] < aRng[:, 0:1]) | (gtArea[None] > aRng[:, 1:2])
+
+        # sort dt highest score first, sort gt ignore last (for each area range)
+        gtind = np.argsort(gtIg, axis=1, kind='mergesort')
+        rows = np.arange(A)[:, None]
+        dtind = np.argsort([-d['score'] for d in dt], kind='mergesort')
+        dt = [dt[i] for i in dtind[0:maxDet]]
+        ious = self.ious[imgId, catId]
+        if len(ious) == 0 or len(dt) == 0:
+            ious = None
+        else:
+            # [A, D, G], the gts of each area range in its own order
+            ious = np.asarray(ious)[:len(dt)][:, gtind].transpose(1, 0, 2)
+        return {
+            'dt': dt,
+            'gtIds': np.array([g['id'] for g in gt], dtype=np.float64)[gtind].reshape(A, G),
+            'gtIg': gtIg[rows, gtind],
+            'iscrowd': np.array([bool(o['iscrowd']) for o in gt], dtype=bool)[gtind].reshape(A, G),
+            'ious': ious,
+        }
+
+    def _matchPairs(self, pairs, D, G):
+        # greedy matching of a batch of pairs, padded to D dts and G gts. Padded entries have iou -1 and never match.
+        p = self.params
+        P, A, T = len(pairs), len(p.areaRng), len(p.iouThrs)
+        ious = -np.ones((P, A, D, G))
+        gtIg = np.zeros((P, A, G), dtype=bool)
+        iscrowd = np.zeros((P, A, G), dtype=bool)
+        gtIds = np.zeros((P, A, G))
+        dtIds = np.zeros((P, D))
+        for i, r in enumerate(pairs):
+            d, g = r['ious'].shape[1:]
+            ious[i, :, :d, :g] = r['ious']
+            gtIg[i, :, :g] = r['gtIg']
+            iscrowd[i, :, :g] = r['iscrowd']
+            gtIds[i, :, :g] = r['gtIds']
+            dtIds[i, :d] = [x['id'] for x in r['dt']]
+
+        gtm  = np.zeros((P,A,T,G))
+        dtm  = np.zeros((P,A,T,D))
+        dtIg = np.zeros((P,A,T,D), dtype=bool)
+        thrs = np.minimum(p.iouThrs, 1-1e-10)[:, None]
+        regularGt = ~gtIg[:, :, None, :]
+        crowd = iscrowd[:, :, None, :]
+        for dind in range(D):
+            iou = ious[:, :, dind][:, :, None, :]
+            # gts available for matching: not matched yet (or crowd), with iou no less than the threshold
+            valid = ((gtm <= 0) | crowd) & (iou >= thrs)
+            # prefer the best regular gt; fall back to the best ignored gt. ties go to the last gt, as in evaluateImg
+            regular = valid & regularGt
+            valid = np.where(regular.any(axis=3, keepdims=True), regular, valid)
+            m = G - 1 - np.argmax(np.where(valid, iou, -1)[..., ::-1], axis=3)
+            mP, mA, mT = np.nonzero(valid.any(axis=3))
+            mG = m[mP, mA, mT]
+            dtIg[mP, mA, mT, dind] = gtIg[mP, mA, mG]
+            dtm[mP, mA, mT, dind]  = gtIds[mP, mA, mG]
+            gtm[mP, mA, mT, mG]    = dtIds[mP, dind]
+
+        for i, r in enumerate(pairs):
+            d, g = r['ious'].shape[1:]
+            r['dtm'], r['gtm'], r['dtIg'] = dtm[i, :, :, :d], gtm[i, :, :, :g], dtIg[i, :, :, :d]
+
     def accumulate(self, p = None):
         '''
         Accumulate per image evaluation results and store the result in self.eval
@@ -376,39 +610,28 @@ class COCOeval:
                     tps = np.logical_and(               dtm,  np.logical_not(dtIg) )
                     fps = np.logical_and(np.logical_not(dtm), np.logical_not(dtIg) )
 
-                    tp_sum = np.cumsum(tps, axis=1).astype(dtype=np.float)
-                    fp_sum = np.cumsum(fps, axis=1).astype(dtype=np.float)
-                    for t, (tp, fp) in enumerate(zip(tp_sum, fp_sum)):
-                        tp = np.array(tp)
-                        fp = np.array(fp)
-                        nd = len(tp)
-                        rc = tp / npig
-                        pr = tp / (fp+tp+np.spacing(1))
-                        q  = np.zeros((R,))
-                        ss = np.zeros((R,))
-
-                        if nd:
-                            recall[t,k,a,m] = rc[-1]
-                        else:
-                            recall[t,k,a,m] = 0
-
-                        # numpy is slow without cython optimization for accessing elements
-                        # use python array gets significant speed improvement
-                        pr = pr.tolist(); q = q.tolist()
-
-                        for i in range(nd-1, 0, -1):
-                            if pr[i] > pr[i-1]:
-                                pr[i-1] = pr[i]
-
-                        inds = np.searchsorted(rc, p.recThrs, side='left')
-                        try:
-                            for ri, pi in enumerate(inds):
-                                q[ri] = pr[pi]
-                                ss[ri] = dtScoresSorted[pi]
-                        except:
-                            pass
-                        precision[t,:,k,a,m] = np.array(q)
-                        scores[t,:,k,a,m] = np.array(ss)
+                    tp_sum = np.cumsum(tps, axis=1).astype(dtype=float)
+                    fp_sum = np.cumsum(fps, axis=1).astype(dtype=float)
+                    nd = tp_sum.shape[1]
+                    rc = tp_sum / npig
+                    pr = tp_sum / (fp_sum+tp_sum+np.spacing(1))
+                    if nd:
+                        recall[:,k,a,m] = rc[:, -1]
+                    else:
+                        recall[:,k,a,m] = 0
+                        precision[:,:,k,a,m] = 0
+                        scores[:,:,k,a,m] = 0
+                        continue
+
+                    # make the precision monotonically decreasing (from the right)
+                    pr = np.maximum.accumulate(pr[:, ::-1], axis=1)[:, ::-1]
+                    for t in range(T):
+                        inds = np.searchsorted(rc[t], p.recThrs, side='left')
+                        # recall thresholds beyond the max recall get zero precision
+                        valid = inds < nd
+                        inds = np.minimum(inds, nd-1)
+                        precision[t,:,k,a,m] = np.where(valid, pr[t, inds], 0)
+                        scores[t,:,k,a,m] = np.where(valid, dtScoresSorted[inds], 0)
         self.eval = {
             'params': p,
             'counts': [T, R, K, A, M],
@@ -496,6 +719,15 @@ class COCOeval:
     def __str__(self):
         self.summarize()
 
+def _evaluateShard(args):
+    # worker of COCOeval.evaluate(nrWorkers=...)
+    params, gts, dts, imgIds = args
+    E = COCOeval(iouType=params.iouType)
+    E.params = params
+    E._gts = defaultdict(list, gts)
+    E._dts = defaultdict(list, dts)
+    return E._evaluateImgs(imgIds)
+
 class Params:
     '''
     Params for coco evaluation api
@@ -504,8 +736,8 @@ class Params:
         self.imgIds = []
         self.catIds = []
         # np.arange causes trouble.  the data point on arange is slightly larger than the true value
-        self.iouThrs = np.linspace(.5, 0.95, np.round((0.95 - .5) / .05) + 1, endpoint=True)
-        self.recThrs = np.linspace(.0, 1.00, np.round((1.00 - .0) / .01) + 1, endpoint=True)
+        self.iouThrs = np.linspace(.5, 0.95, int(np.round((0.95 - .5) / .05)) + 1, endpoint=True)
+        self.recThrs = np.linspace(.0, 1.00, int(np.round((1.00 - .0) / .01)) + 1, endpoint=True)
         self.maxDets = [1, 10, 100]
         self.areaRng = [[0 ** 2, 1e5 ** 2], [0 ** 2, 32 ** 2], [32 ** 2, 96 ** 2], [96 ** 2, 1e5 ** 2]]
         self.areaRngLbl = ['all', 'small', 'medium', 'large']
@@ -515,8 +747,8 @@ class Params:
         self.imgIds = []
         self.catIds = []
         # np.arange causes trouble.  the data point on arange is slightly larger than the true value
-        self.iouThrs = np.linspace(.5, 0.95, np.round((0.95 - .5) / .05) + 1, endpoint=True)
-        self.recThrs = np.linspace(.0, 1.00, np.round((1.00 - .0) / .01) + 1, endpoint=True)
+        self.iouThrs = np.linspace(.5, 0.95, int(np.round((0.95 - .5) / .05)) + 1, endpoint=True)
+        self.recThrs = np.linspace(.0, 1.00, int(np.round((1.00 - .0) / .01)) + 1, endpoint=True)
         self.maxDets = [20]
         self.areaRng = [[0 ** 2, 1e5 ** 2], [32 ** 2, 96 ** 2], [96 ** 2, 1e5 ** 2]]
         self.areaRngLbl = ['all', 'medium', 'large']
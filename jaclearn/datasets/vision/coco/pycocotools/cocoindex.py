@@ -0,0 +1,382 @@
+__author__ = 'jiayuanm'
+
+# Columnar annotation index for the COCO API.
+#
+# COCOIndex stores the annotations of a COCO dataset in NumPy columns (id, image id, category id, area, bbox,
+# iscrowd), sorted offsets per image and per category, and the segmentations in flat arrays. Queries such as
+# getAnnIds/getImgIds are answered with vectorized operations, annotation dicts are only built (and
+# segmentations only decoded) when they are loaded, and the whole index can be saved as a binary cache so that
+# later loads skip the JSON parsing.
+#
+# IndexedCOCO is a drop-in replacement of the COCO class backed by a COCOIndex:
+#  coco = IndexedCOCO('instances_train2017.json', cache_file='instances_train2017.npz')
+# The first call parses the JSON file and writes the cache; later calls only read the cache.
+
+import json
+import os
+import time
+import numpy as np
+from collections.abc import Mapping, Sequence
+
+from .coco import COCO, _isArrayLike
+
+__all__ = ['COCOIndex', 'IndexedCOCO']
+
+_ANN_COLUMNS = ('id', 'image_id', 'category_id', 'area', 'iscrowd')
+_SEG_POLYGON, _SEG_JSON, _SEG_NONE = 0, 1, 2
+
+
+def _pack_strings(strings):
+    """Pack a list of strings into a uint8 array and offsets."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_string(data, offsets, i):
+    return data[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+
+def _group_offsets(keys):
+    """Sort the rows by keys (stable). Returns the order, the unique keys and the offsets of each key."""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    unique, starts = np.unique(sorted_keys, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.int64)
+    return order, unique, offsets
+
+
+class COCOIndex:
+    def __init__(self, columns, meta):
+        """
+        Use COCOIndex.fromDataset or COCOIndex.load to create an index.
+        :param columns (dict of np.ndarray): the annotation columns and the segmentation storage
+        :param meta (dict): all non-annotation parts of the dataset (images, categories, info, etc.)
+        """
+        self.columns = columns
+        self.meta = meta
+        self._buildGroups()
+
+    @classmethod
+    def fromDataset(cls, dataset):
+        anns = dataset.get('annotations', [])
+        n = len(anns)
+        columns = dict()
+        columns['id'] = np.array([ann['id'] for ann in anns], dtype=np.int64)
+        columns['image_id'] = np.array([ann['image_id'] for ann in anns], dtype=np.int64)
+        columns['category_id'] = np.array([ann.get('category_id', 0) for ann in anns], dtype=np.int64)
+        columns['area'] = np.array([ann.get('area', 0) for ann in anns], dtype=np.float64)
+        columns['iscrowd'] = np.array([ann.get('iscrowd', 0) for ann in anns], dtype=np.uint8)
+        columns['bbox'] = np.array([ann['bbox'] if 'bbox' in ann else [0, 0, 0, 0] for ann in anns], dtype=np.float64).reshape(n, 4)
+
+        # Keys that are present in the annotation, encoded as bits: bbox, category_id, area, iscrowd.
+        columns['has_key'] = np.array([
+            ('bbox' in ann) | ('category_id' in ann) << 1 | ('area' in ann) << 2 | ('iscrowd' in ann) << 3
+            for ann in anns
+        ], dtype=np.uint8)
+
+        # Segmentations: polygons are stored as flat coordinates; everything else (e.g., RLE) as JSON strings.
+        seg_kind = np.full(n, _SEG_NONE, dtype=np.uint8)
+        coords, poly_lengths, seg_lengths, seg_json, seg_json_rows = [], [], np.zeros(n, dtype=np.int64), [], []
+        # Extra keys (e.g., keypoints, caption) are stored as JSON strings.
+        extras = []
+        known_keys = set(_ANN_COLUMNS) | {'bbox', 'segmentation'}
+        for i, ann in enumerate(anns):
+            segm = ann.get('segmentation', None)
+            if 'segmentation' not in ann:
+                pass
+            elif type(segm) == list and all(type(poly) == list for poly in segm):
+                seg_kind[i] = _SEG_POLYGON
+                seg_lengths[i] = len(segm)
+                for poly in segm:
+                    coords.extend(poly)
+                    poly_lengths.append(len(poly))
+            else:
+                seg_kind[i] = _SEG_JSON
+                seg_json_rows.append(i)
+                seg_json.append(json.dumps(segm))
+            extra = {k: v for k, v in ann.items() if k not in known_keys}
+            extras.append(json.dumps(extra) if len(extra) > 0 else '')
+
+        columns['seg_kind'] = seg_kind
+        columns['seg_coords'] = np.array(coords, dtype=np.float64)
+        columns['seg_poly_offsets'] = np.append(0, np.cumsum(poly_lengths, dtype=np.int64))
+        columns['seg_offsets'] = np.append(0, np.cumsum(seg_lengths))
+        columns['seg_json_rows'] = np.array(seg_json_rows, dtype=np.int64)
+        columns['seg_json'], columns['seg_json_offsets'] = _pack_strings(seg_json)
+        columns['extra'], columns['extra_offsets'] = _pack_strings(extras)
+
+        meta = {k: v for k, v in dataset.items() if k != 'annotations'}
+        return cls(columns, meta)
+
+    def _buildGroups(self):
+        c = self.columns
+        self.nrAnns = len(c['id'])
+        self.imgOrder, self.imgKeys, self.imgOffsets = _group_offsets(c['image_id'])
+        self.catOrder, self.catKeys, self.catOffsets = _group_offsets(c['category_id'])
+        self.idOrder = np.argsort(c['id'], kind='stable')
+        self.sortedIds = c['id'][self.idOrder]
+        self._segJsonIndex = {int(r): i for i, r in enumerate(c['seg_json_rows'])}
+
+    def save(self, filename):
+        """
+        Save the index as a binary cache (an uncompressed npz file).
+        """
+        meta, _ = _pack_strings([json.dumps(self.meta)])
+        with open(filename, 'wb') as f:
+            np.savez(f, meta=meta, **self.columns)
+        return filename
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            columns = {k: f[k] for k in f.files}
+        meta = json.loads(columns.pop('meta').tobytes().decode('utf-8'))
+        return cls(columns, meta)
+
+    def _lookup(self, keys, offsets, order, values):
+        """Rows of the given key values, grouped by key (in the order of the given values)."""
+        values = np.asarray(values, dtype=np.int64).reshape(-1)
+        pos = np.searchsorted(keys, values)
+        pos = np.minimum(pos, max(len(keys) - 1, 0))
+        found = (keys[pos] == values) if len(keys) > 0 else np.zeros(len(values), dtype=bool)
+        pos = pos[found]
+        starts, ends = offsets[pos], offsets[pos + 1]
+        if len(starts) == 0:
+            return np.zeros(0, dtype=np.int64)
+        lengths = ends - starts
+        # Concatenate the ranges [starts[i], ends[i]) without a Python loop.
+        index = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+        return order[index]
+
+    def rowsOfImages(self, imgIds):
+        return self._lookup(self.imgKeys, self.imgOffsets, self.imgOrder, imgIds)
+
+    def rowsOfCategories(self, catIds):
+        return np.sort(self._lookup(self.catKeys, self.catOffsets, self.catOrder, catIds))
+
+    def rowsOfIds(self, annIds):
+        annIds = np.asarray(annIds, dtype=np.int64).reshape(-1)
+        pos = np.searchsorted(self.sortedIds, annIds)
+        if len(annIds) > 0:
+            valid = pos < len(self.sortedIds)
+            valid[valid] = self.sortedIds[pos[valid]] == annIds[valid]
+            if not valid.all():
+                raise KeyError(int(annIds[~valid][0]))
+        return self.idOrder[pos]
+
+    def queryRows(self, imgIds=[], catIds=[], areaRng=[], iscrowd=None):
+        """
+        Vectorized version of COCO.getAnnIds. Returns the rows (not the ids) of the matched annotations, in the
+        same order as COCO.getAnnIds.
+        """
+        c = self.columns
+        if len(imgIds) > 0:
+            rows = self.rowsOfImages(imgIds)
+        else:
+            rows = np.arange(self.nrAnns)
+        mask = np.ones(len(rows), dtype=bool)
+        if len(catIds) > 0:
+            mask &= np.isin(c['category_id'][rows], np.asarray(catIds, dtype=np.int64))
+        if len(areaRng) > 0:
+            area = c['area'][rows]
+            mask &= (area > areaRng[0]) & (area < areaRng[1])
+        if iscrowd is not None:
+            mask &= c['iscrowd'][rows] == iscrowd
+        return rows[mask]
+
+    def imagesOfCategory(self, catId):
+        return np.unique(self.columns['image_id'][self.rowsOfCategories([catId])])
+
+    def getSegmentation(self, row):
+        kind = self.columns['seg_kind'][row]
+        if kind == _SEG_POLYGON:
+            c = self.columns
+            coords, poly_offsets = c['seg_coords'], c['seg_poly_offsets']
+            return [
+                coords[poly_offsets[p]:poly_offsets[p + 1]].tolist()
+                for p in range(c['seg_offsets'][row], c['seg_offsets'][row + 1])
+            ]
+        elif kind == _SEG_JSON:
+            return json.loads(_unpack_string(self.columns['seg_json'], self.columns['seg_json_offsets'], self._segJsonIndex[int(row)]))
+        return None
+
+    def getAnn(self, row):
+        """
+        Build the annotation dict of a row. The segmentation is decoded here.
+        """
+        c = self.columns
+        has_key = int(c['has_key'][row])
+        ann = dict()
+        extra = _unpack_string(c['extra'], c['extra_offsets'], row)
+        if len(extra) > 0:
+            ann.update(json.loads(extra))
+        ann['id'] = int(c['id'][row])
+        ann['image_id'] = int(c['image_id'][row])
+        if has_key & 2:
+            ann['category_id'] = int(c['category_id'][row])
+        if has_key & 4:
+            ann['area'] = float(c['area'][row])
+        if has_key & 8:
+            ann['iscrowd'] = int(c['iscrowd'][row])
+        if has_key & 1:
+            ann['bbox'] = c['bbox'][row].tolist()
+        if c['seg_kind'][row] != _SEG_NONE:
+            ann['segmentation'] = self.getSegmentation(row)
+        return ann
+
+
+class _LazyAnns(Mapping):
+    """ann id -> ann dict, built on access."""
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, annId):
+        return self.index.getAnn(self.index.rowsOfIds([annId])[0])
+
+    def __iter__(self):
+        return iter(self.index.columns['id'].tolist())
+
+    def __len__(self):
+        return self.index.nrAnns
+
+    def __contains__(self, annId):
+        try:
+            self.index.rowsOfIds([annId])
+            return True
+        except KeyError:
+            return False
+
+
+class _LazyAnnList(Sequence):
+    """The list of annotations (as in dataset['annotations']), built on access."""
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.index.getAnn(r) for r in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.index.getAnn(i)
+
+    def __len__(self):
+        return self.index.nrAnns
+
+
+class _LazyImgToAnns(Mapping):
+    """image id -> list of ann dicts, built on access."""
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, imgId):
+        rows = self.index.rowsOfImages([imgId])
+        return [self.index.getAnn(r) for r in rows]
+
+    def __iter__(self):
+        return iter(self.index.imgKeys.tolist())
+
+    def __len__(self):
+        return len(self.index.imgKeys)
+
+    def __contains__(self, imgId):
+        return len(self.index.rowsOfImages([imgId])) > 0
+
+
+class _LazyCatToImgs(Mapping):
+    """category id -> list of image ids (one for each annotation), built on access."""
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, catId):
+        return self.index.columns['image_id'][self.index.rowsOfCategories([catId])].tolist()
+
+    def __iter__(self):
+        return iter(self.index.catKeys.tolist())
+
+    def __len__(self):
+        return len(self.index.catKeys)
+
+    def __contains__(self, catId):
+        return len(self.index.rowsOfCategories([catId])) > 0
+
+
+class IndexedCOCO(COCO):
+    def __init__(self, annotation_file=None, cache_file=None):
+        """
+        COCO API backed by a columnar COCOIndex.
+        :param annotation_file (str): location of annotation file
+        :param cache_file (str): location of the binary cache. If it exists (and is newer than the annotation file),
+            the annotations are loaded from the cache; otherwise, the cache is created after parsing the JSON file.
+        :return:
+        """
+        self.dataset, self.anns, self.cats, self.imgs = dict(), dict(), dict(), dict()
+        self.imgToAnns, self.catToImgs = dict(), dict()
+        self.index = COCOIndex.fromDataset(self.dataset)
+
+        use_cache = cache_file is not None and os.path.exists(cache_file) and (
+            annotation_file is None or os.path.getmtime(cache_file) >= os.path.getmtime(annotation_file)
+        )
+        if use_cache:
+            print('loading annotations from cache...')
+            tic = time.time()
+            self.index = COCOIndex.load(cache_file)
+            print('Done (t={:0.2f}s)'.format(time.time()- tic))
+            self._setIndex()
+        elif annotation_file is not None:
+            print('loading annotations into memory...')
+            tic = time.time()
+            dataset = json.load(open(annotation_file, 'r'))
+            assert type(dataset)==dict, 'annotation file format {} not supported'.format(type(dataset))
+            print('Done (t={:0.2f}s)'.format(time.time()- tic))
+            self.dataset = dataset
+            self.createIndex()
+            if cache_file is not None:
+                self.index.save(cache_file)
+
+    def createIndex(self):
+        print('creating index...')
+        self.index = COCOIndex.fromDataset(self.dataset)
+        self._setIndex()
+        print('index created!')
+
+    def _setIndex(self):
+        index = self.index
+        # Only the meta data (images, categories, etc.) is kept as Python objects.
+        self.dataset = dict(index.meta)
+        self.dataset['annotations'] = _LazyAnnList(index)
+        self.anns = _LazyAnns(index)
+        self.imgToAnns = _LazyImgToAnns(index)
+        self.catToImgs = _LazyCatToImgs(index)
+        self.imgs = {img['id']: img for img in self.dataset.get('images', [])}
+        self.cats = {cat['id']: cat for cat in self.dataset.get('categories', [])}
+
+    def getAnnIds(self, imgIds=[], catIds=[], areaRng=[], iscrowd=None):
+        imgIds = imgIds if _isArrayLike(imgIds) else [imgIds]
+        catIds = catIds if _isArrayLike(catIds) else [catIds]
+        rows = self.index.queryRows(imgIds, catIds, areaRng, iscrowd)
+        return self.index.columns['id'][rows].tolist()
+
+    def getImgIds(self, imgIds=[], catIds=[]):
+        imgIds = imgIds if _isArrayLike(imgIds) else [imgIds]
+        catIds = catIds if _isArrayLike(catIds) else [catIds]
+
+        if len(imgIds) == len(catIds) == 0:
+            return list(self.imgs.keys())
+        ids = np.unique(np.asarray(imgIds, dtype=np.int64))
+        for i, catId in enumerate(catIds):
+            catImgs = self.index.imagesOfCategory(catId)
+            if i == 0 and len(ids) == 0:
+                ids = catImgs
+            else:
+                ids = np.intersect1d(ids, catImgs)
+        return ids.tolist()
+
+    def loadAnns(self, ids=[]):
+        if _isArrayLike(ids):
+            return [self.index.getAnn(r) for r in self.index.rowsOfIds(ids)]
+        elif type(ids) == int:
+            return [self.anns[ids]]
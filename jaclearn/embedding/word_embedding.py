@@ -17,7 +17,11 @@
 #
 # Embeddings and vocabulary utility methods
 
+import os
+import os.path as osp
 import re
+import itertools
+import tempfile
 import numpy as np
 
 from jacinle.logging import get_logger
@@ -28,6 +32,9 @@ logger = get_logger(__file__)
 
 special_tokens = {"&ndash;": "–", "&mdash;": "—", "@card@": "0"}
 
+_TRIM_RE = re.compile(r"(^\W|\W$)")
+_DIGITS_RE = re.compile(r"([0-9][0-9.,]*)")
+
 
 def load_word_index(path, filter=None):
     """
@@ -52,11 +59,20 @@ def load_word_index(path, filter=None):
     return word2idx
 
 
-def load(path, word_index_only=False, filter=None):
+def load(path, word_index_only=False, filter=None, cache=False):
     """
     Loads pre-trained embeddings from the specified path.
+
+    If cache is True, the text file is converted into the binary format (see :func:`convert_to_binary`) on the first
+    call, and later calls load the (memory-mapped) binary cache instead. The cache is ignored when a filter is given.
     """
 
+    if cache and filter is None:
+        prefix = get_binary_prefix(path)
+        if not _is_binary_cache_valid(path, prefix):
+            convert_to_binary(path, prefix)
+        return load_binary(prefix, word_index_only=word_index_only)
+
     if word_index_only:
         return load_word_index(path, filter=filter)
 
@@ -102,6 +118,155 @@ def load(path, word_index_only=False, filter=None):
     return np.array(embeddings, dtype='float32'), word2idx
 
 
+def get_binary_prefix(path):
+    """The default path prefix of the binary cache of an embedding text file."""
+    return osp.splitext(path)[0]
+
+
+def _is_binary_cache_valid(path, prefix):
+    for fname in (prefix + '.npy', prefix + '.vocab.txt'):
+        if not osp.exists(fname) or osp.getmtime(fname) < osp.getmtime(path):
+            return False
+    return True
+
+
+def _mktemp(prefix, suffix):
+    fd, fname = tempfile.mkstemp(suffix=suffix, prefix=osp.basename(prefix) + '.tmp.', dir=osp.dirname(osp.abspath(prefix)))
+    os.close(fd)
+    return fname
+
+
+def _parse_chunk(lines, filter, embedding_size, line_offset):
+    """Parse a chunk of lines. Returns the words, the embeddings and the embedding size."""
+    words, values, line_ids = [], [], []
+    for i, line in enumerate(lines):
+        line = line.strip()
+        k = line.find(' ')
+        if k <= 0:
+            continue
+        word = line[:k]
+        if filter is not None and word not in filter:
+            continue
+        words.append(word)
+        values.append(line[k + 1:])
+        line_ids.append(line_offset + i + 1)
+
+    if len(words) == 0:
+        return words, None, embedding_size
+    if embedding_size is None:
+        embedding_size = len(values[0].split(' '))
+
+    # Fast path: parse all numbers in the chunk at once. The per-row check guarantees that the rows are not shifted
+    # (e.g., one row with an extra number and another one with a missing number).
+    if all(value.count(' ') + 1 == embedding_size for value in values):
+        try:
+            array = np.fromstring(' '.join(values), sep=' ', dtype='float32')
+            if array.size == len(words) * embedding_size:
+                return words, array.reshape(len(words), embedding_size), embedding_size
+        except ValueError:
+            pass
+
+    # Slow path: parse line by line, skipping invalid entries.
+    valid_words, valid_values = [], []
+    for word, value, line_id in zip(words, values, line_ids):
+        try:
+            val = np.array(value.split(' '), dtype='float32')
+        except ValueError:
+            logger.warning('Skip invalid entry (encoding): Line#{}.'.format(line_id))
+            continue
+        if len(val) != embedding_size:
+            logger.warning('Skip invalid entry (vector length): Line#{}.'.format(line_id))
+            continue
+        valid_words.append(word)
+        valid_values.append(val)
+    if len(valid_words) == 0:
+        return valid_words, None, embedding_size
+    return valid_words, np.stack(valid_values), embedding_size
+
+
+def convert_to_binary(path, prefix=None, dtype='float32', filter=None, chunk_size=65536):
+    """
+    Convert a text embedding file into a binary cache: the embedding matrix is saved as `prefix.npy`, with the same
+    layout as :func:`load` (row 0 for `EBD_ALL_ZEROS` and the last row for `EBD_UNKNOWN`), and the words are
+    saved as `prefix.vocab.txt`, one per line. The text file is parsed in chunks of `chunk_size` lines, and the
+    parsed rows are streamed to disk.
+
+    :param path: the path to the text embedding file
+    :param prefix: the path prefix of the output files (default: the path without its extension)
+    :param dtype: the dtype of the saved matrix, e.g., float32 or float16
+    :return: the prefix
+    """
+    if prefix is None:
+        prefix = get_binary_prefix(path)
+
+    # All files are first written to unique temporary files and then atomically moved to the destination, so that
+    # concurrent conversions (e.g., from multiple workers) never observe partially-written caches.
+    raw_filename = _mktemp(prefix, '.npy.tmp')
+    npy_filename = _mktemp(prefix, '.npy')
+    vocab_filename = _mktemp(prefix, '.vocab.txt')
+    try:
+        words = []
+        embedding_size = None
+        nr_lines = 0
+        with open(path, 'r', encoding='utf-8') as fIn, open(raw_filename, 'wb') as fRaw:
+            while True:
+                lines = list(itertools.islice(fIn, chunk_size))
+                if len(lines) == 0:
+                    break
+                chunk_words, chunk_values, embedding_size = _parse_chunk(lines, filter, embedding_size, nr_lines)
+                nr_lines += len(lines)
+                if chunk_values is not None:
+                    words.extend(chunk_words)
+                    chunk_values.astype(dtype).tofile(fRaw)
+
+        assert embedding_size is not None, 'No valid entry in the embedding file: {}.'.format(path)
+        nr_words = len(words)
+        raw = np.memmap(raw_filename, dtype=dtype, mode='r', shape=(nr_words, embedding_size))
+        output = np.lib.format.open_memmap(npy_filename, mode='w+', dtype=dtype, shape=(nr_words + 2, embedding_size))
+        output[0] = 0
+        for i in range(0, nr_words, chunk_size):
+            j = min(i + chunk_size, nr_words)
+            output[1 + i:1 + j] = raw[i:j]
+        # rare words; the same as load: the average of the last 101 rows (including the all-zero row).
+        output[-1] = np.average(output[max(nr_words - 100, 0):nr_words + 1].astype('float32'), axis=0)
+        output.flush()
+        del raw, output
+
+        with open(vocab_filename, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(words))
+
+        # The vocabulary is moved last: the cache is considered as valid only if both files are up-to-date.
+        os.replace(npy_filename, prefix + '.npy')
+        os.replace(vocab_filename, prefix + '.vocab.txt')
+    finally:
+        for fname in (raw_filename, npy_filename, vocab_filename):
+            if osp.exists(fname):
+                os.remove(fname)
+
+    return prefix
+
+
+def load_binary(prefix, mmap=True, word_index_only=False):
+    """
+    Load the binary cache created by :func:`convert_to_binary`. If mmap is True, the embedding matrix is
+    memory-mapped (read-only), so that the pages are loaded lazily and shared among processes.
+
+    :return: the embedding matrix and the word to index dictionary (only the dictionary if word_index_only)
+    """
+    with open(prefix + '.vocab.txt', 'r', encoding='utf-8') as f:
+        content = f.read()
+    words = content.split('\n') if len(content) > 0 else []
+
+    word2idx = dict(zip(words, range(1, len(words) + 1)))
+    word2idx[EBD_ALL_ZEROS] = 0
+    word2idx[EBD_UNKNOWN] = len(words) + 1
+    if word_index_only:
+        return word2idx
+
+    embeddings = np.load(prefix + '.npy', mmap_mode='r' if mmap else None)
+    return embeddings, word2idx
+
+
 def map(word, word2idx):
     """
     Get the word index for the given word. Maps all numbers to 0, lowercases if necessary.
@@ -118,12 +283,12 @@ def map(word, word2idx):
         return word2idx[word.lower()]
     elif word in special_tokens:
         return word2idx[special_tokens[word]]
-    trimmed = re.sub("(^\W|\W$)", "", word)
+    trimmed = _TRIM_RE.sub("", word)
     if trimmed in word2idx:
         return word2idx[trimmed]
     elif trimmed.lower() in word2idx:
         return word2idx[trimmed.lower()]
-    no_digits = re.sub("([0-9][0-9.,]*)", '0', word)
+    no_digits = _DIGITS_RE.sub('0', word)
     if no_digits in word2idx:
         return word2idx[no_digits]
     return unknown_idx
@@ -138,3 +303,85 @@ def map_sequence(word_sequence, word2idx):
     :return: a sequence of embedding indices
     """
     return [map(word, word2idx) for word in word_sequence]
+
+
+class WordIndexMapper(object):
+    """
+    Batched version of :func:`map`. The results are cached, so that the fallback chain (lowercasing, trimming, etc.)
+    is evaluated only once for each distinct token.
+
+    Example:
+        >>> mapper = WordIndexMapper(word2idx)
+        >>> ids = mapper.map_sequence(['The', 'quick', 'fox'])  # np.ndarray of int64
+        >>> ids, lengths = mapper.map_batch([['The', 'fox'], ['Hello']])
+    """
+
+    def __init__(self, word2idx, max_cache_size=None):
+        self.word2idx = word2idx
+        self.max_cache_size = max_cache_size
+        self._cache = dict()
+
+    def clear_cache(self):
+        self._cache = dict()
+
+    def map(self, word):
+        idx = self._cache.get(word)
+        if idx is None:
+            idx = self._map_miss(word)
+        return idx
+
+    def _map_miss(self, word):
+        idx = map(word, self.word2idx)
+        if self.max_cache_size is None or len(self._cache) < self.max_cache_size:
+            self._cache[word] = idx
+        return idx
+
+    def map_sequence(self, word_sequence):
+        """Map a sequence (or a whole corpus) of tokens into an int64 array of indices."""
+        get = self._cache.get
+        indices = [get(w) for w in word_sequence]
+        if None in indices:
+            indices = [i if i is not None else self._map_miss(w) for i, w in zip(indices, word_sequence)]
+        return np.array(indices, dtype='int64')
+
+    def map_batch(self, sequences, max_length=None):
+        """
+        Map a batch of token sequences into a padded array of shape `[batch, length]`, padded by the index of
+        `EBD_PAD`.
+
+        :return: the padded indices and the lengths of the sequences
+        """
+        lengths = np.array([len(x) for x in sequences], dtype='int64')
+        if max_length is None:
+            max_length = int(lengths.max()) if len(sequences) > 0 else 0
+        lengths = np.minimum(lengths, max_length)
+
+        flat = self.map_sequence([w for x in sequences for w in x[:max_length]])
+        output = np.full((len(sequences), max_length), self.word2idx[EBD_ALL_ZEROS], dtype='int64')
+        output[np.arange(max_length)[np.newaxis] < lengths[:, np.newaxis]] = flat
+        return output, lengths
+
+    def build_submatrix(self, embeddings, corpus):
+        """
+        Build the embedding submatrix for the vocabulary of a corpus: only the rows used by the corpus are kept.
+
+        :param embeddings: the full embedding matrix (can be memory-mapped)
+        :param corpus: an iterable of tokens
+        :return: the submatrix and a word to index dictionary of the corpus vocabulary (in the submatrix). As in
+            :func:`load`, `EBD_ALL_ZEROS` is mapped to the first row and `EBD_UNKNOWN` to the last one.
+        """
+        vocab = sorted(set(corpus) - {EBD_ALL_ZEROS, EBD_UNKNOWN})
+        indices = self.map_sequence(vocab)
+
+        rows = np.unique(indices)
+        rows = rows[(rows != self.word2idx[EBD_ALL_ZEROS]) & (rows != self.word2idx[EBD_UNKNOWN])]
+        rows = np.concatenate([[self.word2idx[EBD_ALL_ZEROS]], rows, [self.word2idx[EBD_UNKNOWN]]])
+        # Map the old row indices into the new ones; rows are sorted, so this is a binary search.
+        new_indices = np.searchsorted(rows, indices)
+        new_indices[indices == self.word2idx[EBD_ALL_ZEROS]] = 0
+        new_indices[indices == self.word2idx[EBD_UNKNOWN]] = len(rows) - 1
+
+        word2idx = dict(zip(vocab, new_indices.tolist()))
+        word2idx[EBD_ALL_ZEROS] = 0
+        word2idx[EBD_UNKNOWN] = len(rows) - 1
+        return np.asarray(embeddings[rows]), word2idx
@@ -0,0 +1,177 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : batch.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+"""
+Batched photometric augmentation. The brightness, contrast and saturation jitters (in a random order) and the
+lighting noise of each image are composed into a single affine color transform (a 3x3 matrix plus an offset), which
+is then applied to the whole `[N, H, W, C]` batch at once with :func:`jacinle.image.imgproc.color_transform`.
+
+Unlike :func:`jaclearn.imageaug.photography.color_augment_pack`, the intermediate results are not clipped: the
+output is clipped into [0, 255] only once, at the end.
+"""
+
+import time
+import numpy as np
+
+import jacinle.random as random
+from jacinle.image import imgproc
+
+from .photography import color_augment_pack, lighting_augment
+
+__all__ = [
+    'compose_color_transform', 'sample_color_transform',
+    'batch_color_augment', 'batch_horizontal_flip_augment',
+    'benchmark_color_augment'
+]
+
+_GRAYSCALE_WEIGHTS = np.array([0.114, 0.587, 0.299])
+_DEFAULT_EIGVAL = np.array([0.2175, 0.0188, 0.0045])
+_DEFAULT_EIGVEC = np.array([
+    [-0.5836, -0.6948, 0.4203],
+    [-0.5808, -0.0045, -0.8140],
+    [-0.5675, 0.7192, 0.4009]
+])
+
+BRIGHTNESS, CONTRAST, SATURATION = 0, 1, 2
+
+
+def compose_color_transform(means, brightness=None, contrast=None, saturation=None, order=None, lighting=None):
+    """
+    Compose the color jitters of a batch of images into affine transforms.
+
+    Args:
+        means (np.ndarray): the per-channel mean of each image, of shape `[N, 3]`. Used by the contrast jitter.
+        brightness, contrast, saturation (np.ndarray): the jitter factors (alpha) of each image, of shape `[N]`.
+            None means no such jitter.
+        order (np.ndarray): the order of the jitters of each image, of shape `[N, 3]`; each row is a permutation of
+            `(BRIGHTNESS, CONTRAST, SATURATION)`. Default to the order of the arguments.
+        lighting (np.ndarray): the lighting noise (an offset added after the jitters), of shape `[N, 3]`.
+
+    Returns:
+        tuple: the matrices (`[N, 3, 3]`) and the offsets (`[N, 3]`) of the transforms.
+    """
+    means = np.asarray(means, dtype='float64')
+    n = len(means)
+    matrix = np.tile(np.eye(3), (n, 1, 1))
+    offset = np.zeros((n, 3))
+    if order is None:
+        order = np.tile(np.arange(3), (n, 1))
+
+    alphas = (brightness, contrast, saturation)
+    for k in range(order.shape[1]):
+        for op, alpha in enumerate(alphas):
+            if alpha is None:
+                continue
+            idx = np.nonzero(order[:, k] == op)[0]
+            if len(idx) == 0:
+                continue
+            a = np.asarray(alpha, dtype='float64')[idx]
+            m, b = matrix[idx], offset[idx]
+            if op == BRIGHTNESS:
+                m, b = m * a[:, None, None], b * a[:, None]
+            elif op == CONTRAST:
+                # the mean of the grayscale image, after the transforms so far.
+                gray_mean = (np.einsum('nij,nj->ni', m, means[idx]) + b) @ _GRAYSCALE_WEIGHTS
+                m, b = m * a[:, None, None], b * a[:, None] + ((1 - a) * gray_mean)[:, None]
+            else:
+                s = a[:, None, None] * np.eye(3) + (1 - a)[:, None, None] * _GRAYSCALE_WEIGHTS.reshape(1, 1, 3)
+                m, b = s @ m, np.einsum('nij,nj->ni', s, b)
+            matrix[idx], offset[idx] = m, b
+
+    if lighting is not None:
+        offset += lighting
+    return matrix, offset
+
+
+def sample_color_transform(means, brightness=0.4, contrast=0.4, saturation=0.4, lighting=0.1, eigval=None, eigvec=None, rng=None):
+    """
+    Sample the color jitters of a batch of images (with the same distribution as
+    :func:`jaclearn.imageaug.photography.color_augment_pack` followed by
+    :func:`jaclearn.imageaug.photography.lighting_augment`), and compose them into affine transforms.
+    See :func:`compose_color_transform` for details.
+    """
+    rng = rng or random.get_default_rng()
+    n = len(means)
+
+    def sample_alpha(val):
+        if val == 0:
+            return None
+        return 1. + val * (rng.rand(n) * 2 - 1)
+
+    alphas = [sample_alpha(v) for v in (brightness, contrast, saturation)]
+    order = np.argsort(rng.rand(n, 3), axis=1)
+
+    light = None
+    if lighting != 0:
+        eigval = _DEFAULT_EIGVAL if eigval is None else eigval
+        eigvec = _DEFAULT_EIGVEC if eigvec is None else eigvec
+        alpha = rng.randn(n, 3) * lighting
+        light = (eigvec[None] * alpha[:, None, :] * eigval.reshape(1, 1, 3)).sum(axis=2)
+
+    return compose_color_transform(means, *alphas, order=order, lighting=light)
+
+
+def batch_color_augment(imgs, brightness=0.4, contrast=0.4, saturation=0.4, lighting=0.1, eigval=None, eigvec=None, out=None, rng=None):
+    """
+    Apply random brightness, contrast and saturation jitters and lighting noise to a batch of images.
+
+    Args:
+        imgs (np.ndarray): the images, of shape `[N, H, W, 3]` (BGR), usually uint8.
+        out (np.ndarray): optional, the output array. It can be `imgs` itself for in-place augmentation.
+
+    Returns:
+        np.ndarray: the augmented images, clipped into [0, 255], with the dtype of `out` (default: the input dtype).
+    """
+    means = imgs.reshape(len(imgs), -1, imgs.shape[-1]).mean(axis=1, dtype='float64')
+    matrix, offset = sample_color_transform(
+        means, brightness=brightness, contrast=contrast, saturation=saturation,
+        lighting=lighting, eigval=eigval, eigvec=eigvec, rng=rng
+    )
+    return imgproc.color_transform(imgs, matrix, offset, out=out)
+
+
+def batch_horizontal_flip_augment(imgs, prob, rng=None):
+    """Randomly flip each image of a batch horizontally, in place."""
+    rng = rng or random.get_default_rng()
+    idx = np.nonzero(rng.rand(len(imgs)) < prob)[0]
+    if len(idx) > 0:
+        imgs[idx] = imgs[idx, :, ::-1]
+    return imgs
+
+
+def benchmark_color_augment(batch_size=64, image_shape=(224, 224), nr_iters=5, rng=None):
+    """
+    Measure the throughput (images per second) of the per-image color augmentation
+    (:func:`color_augment_pack` and :func:`lighting_augment`) and of :func:`batch_color_augment`.
+
+    Returns:
+        dict: the throughput of both implementations, with keys `per_image` and `batched`.
+    """
+    rng = rng or random.get_default_rng()
+    imgs = rng.randint(0, 256, size=(batch_size, ) + tuple(image_shape) + (3, )).astype('uint8')
+
+    def per_image():
+        for img in imgs:
+            img = color_augment_pack(img.astype('float64'), brightness=0.4, contrast=0.4, saturation=0.4)
+            imgproc.clip(lighting_augment(img, 0.1)).astype('uint8')
+
+    out = np.empty_like(imgs)
+
+    def batched():
+        batch_color_augment(imgs, out=out, rng=rng)
+
+    results = dict()
+    for name, func in [('per_image', per_image), ('batched', batched)]:
+        func()
+        start = time.time()
+        for i in range(nr_iters):
+            func()
+        results[name] = batch_size * nr_iters / (time.time() - start)
+    return results
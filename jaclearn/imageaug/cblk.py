@@ -8,12 +8,16 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
+import numpy as np
+
 from jacinle.image import imgproc
+from jacinle.utils.argument import get_2dshape
 
 from . import shape as shape_augment
 from . import photography as photography_augment
+from . import batch as batch_augment
 
-__all__ = ['fbaug']
+__all__ = ['fbaug', 'fbaug_batch']
 
 
 def fbaug(img, target_shape=(224, 224), is_training=True, area_range=0.08, aspect_ratio=(3/4, 4/3)):
@@ -33,3 +37,26 @@ def fbaug(img, target_shape=(224, 224), is_training=True, area_range=0.08, aspec
 
         # 2. center crop 224x244 patch from the image
         return imgproc.center_crop(img, target_shape)
+
+
+def fbaug_batch(imgs, target_shape=(224, 224), is_training=True, area_range=0.08, aspect_ratio=(3/4, 4/3), out=None):
+    """
+    The batched version of :func:`fbaug`. The images (a list of uint8 images of arbitrary sizes) are cropped and
+    resized one by one into a preallocated `[N, H, W, 3]` uint8 batch, and the color augmentations are then applied
+    to the whole batch in place (see :mod:`jaclearn.imageaug.batch`).
+    """
+    target_shape = get_2dshape(target_shape)
+    if out is None:
+        out = np.empty((len(imgs), ) + target_shape + (3, ), dtype='uint8')
+
+    for i, img in enumerate(imgs):
+        if is_training:
+            out[i] = shape_augment.random_size_crop(img, target_shape, area_range=area_range, aspect_ratio=aspect_ratio)
+        else:
+            h, w = img.shape[:2]
+            out[i] = imgproc.center_crop(imgproc.resize_scale(img, 256 / min(h, w)), target_shape)
+
+    if is_training:
+        batch_augment.batch_color_augment(out, brightness=0.4, contrast=0.4, saturation=0.4, lighting=0.1, out=out)
+        batch_augment.batch_horizontal_flip_augment(out, 0.5)
+    return out
@@ -9,7 +9,7 @@
 # Distributed under terms of the MIT license.
 
 import itertools
-import collections
+import collections.abc
 
 import jacinle.random as random
 from jacinle.image import imgproc
@@ -59,7 +59,7 @@ def random_size_crop(img, target_shape, area_range, aspect_ratio=None, contiguou
     target_shape = get_2dshape(target_shape)
     h, w = img.shape[:2]
     area = h * w
-    area_range = area_range if isinstance(area, collections.Iterable) else (area_range, 1)
+    area_range = area_range if isinstance(area_range, collections.abc.Iterable) else (area_range, 1)
 
     if aspect_ratio is None:
         assert contiguous_ar == False
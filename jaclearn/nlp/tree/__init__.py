@@ -11,4 +11,5 @@
 from .node import *
 from .traversal import *
 from .ptb import *
+from .flat import *
 
@@ -12,11 +12,14 @@
 Constituency Tree.
 """
 
+import heapq
+import numpy as np
+
 import jacinle.random as random
 from jacinle.utils.enum import JacEnum
 
+from .flat import FlatTree
 from .ptb import PTBNode
-from .traversal import traversal
 
 TEMP_NODE = '<TEMP>'
 
@@ -83,48 +86,153 @@ class StepMaskSelectionMode(JacEnum):
 
 
 def compose_bianry_tree_step_masks(tree, selection='first'):
+    """
+    Compute the composition steps of a binary tree, bottom-up. At each step, two adjacent nodes (in the current
+    sequence of composed nodes) are composed into their parent.
+
+    Returns:
+        list: a list of (position, mask) tuples, one for each step. `position` is the index of the left node being
+        composed in the current sequence, and `mask` marks all nodes in the current sequence that can be composed
+        with their right neighbours.
+    """
+    positions, masks = compose_binary_tree_step_masks_array(tree, selection)
+    length = masks.shape[1]
+    return [(int(p), masks[i, :length - i].tolist()) for i, p in enumerate(positions)]
+
+
+class _FenwickTree(object):
+    def __init__(self, n):
+        # All entries are initialized as 1.
+        self.n = n
+        self.tree = [i & (-i) for i in range(n + 1)]
+
+    def remove(self, i):
+        i += 1
+        while i <= self.n:
+            self.tree[i] -= 1
+            i += i & (-i)
+
+    def prefix_sum(self, i):
+        """Sum of the entries [0, i)."""
+        s = 0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & (-i)
+        return s
+
+
+def compose_binary_tree_step_masks_array(tree, selection='first', out=None):
+    """
+    The array version of :func:`compose_bianry_tree_step_masks`, running in O(n log n) time besides writing the
+    masks, where n is the number of leaves.
+
+    Args:
+        tree: the binary tree, either a :class:`PTBNode` or a :class:`FlatTree`.
+        selection (str): the node to be composed at each step. `first`: the first node in the pre-order among all
+            nodes that can be composed; `random`: a random one.
+        out (np.ndarray): optional, a preallocated uint8 array of shape at least `[n - 1, n]` to store the masks.
+
+    Returns:
+        tuple: the positions, an int64 array of shape `[n - 1]`, and the masks, a uint8 array of shape `[n - 1, n]`.
+        The mask at step `i` is `masks[i, :n - i]`; the rest of the row is zero.
+    """
     selection = StepMaskSelectionMode.from_string(selection)
-    nodes = list(traversal(tree, 'pre'))
-    clean_nodes = {x for x in nodes if x.is_leaf}
-    ever_clean_nodes = clean_nodes.copy()
-
-    answer = []
-
-    while len(clean_nodes) > 1:
-        # all allowed nodes
-        allowed = {x: i for i, x in enumerate(nodes) if (
-            x not in ever_clean_nodes and
-            all(map(lambda y: y in clean_nodes, x.children))
-        )}
-
-        # project it to 
-        allowed_projected = {x for x in clean_nodes if (
-            x.sibling_ind == 0 and x.father in allowed
-        )}
-
-        ordered_clean_nodes = [x for x in nodes if x in clean_nodes]
-        clean_nodes_indices = {x: i for i, x in enumerate(ordered_clean_nodes)}
-
+    if not isinstance(tree, FlatTree):
+        tree = FlatTree.from_node(tree)
+
+    nr_leaves = tree.nr_leaves
+    nr_steps = max(nr_leaves - 1, 0)
+    if out is None:
+        masks = np.zeros((nr_steps, nr_leaves), dtype='uint8')
+    else:
+        masks = out[:nr_steps, :nr_leaves]
+        masks.fill(0)
+    positions = np.zeros(nr_steps, dtype='int64')
+    if nr_steps == 0:
+        return positions, masks
+
+    parent = tree.parent.tolist()
+    end = tree.end.tolist()
+    leftmost = tree.span[:, 0].tolist()
+    is_leaf = tree.is_leaf.tolist()
+    nr_nodes = len(parent)
+
+    # For an internal node i of a binary tree (in the pre-order), its children are i + 1 and end[i + 1].
+    lson = [i + 1 if not is_leaf[i] else -1 for i in range(nr_nodes)]
+    rson = [end[i + 1] if not is_leaf[i] else -1 for i in range(nr_nodes)]
+    for i in range(nr_nodes):
+        if not is_leaf[i] and end[rson[i]] != end[i]:
+            raise ValueError('The input tree is not a binary tree.')
+
+    # The number of children that have not been composed (leaves are composed from the beginning).
+    pending = [0 if is_leaf[i] else (not is_leaf[lson[i]]) + (not is_leaf[rson[i]]) for i in range(nr_nodes)]
+    ready = []
+    for i in range(nr_nodes):
+        if not is_leaf[i] and pending[i] == 0:
+            ready.append(i)
+            masks[0, leftmost[i]] = 1
+    if selection is StepMaskSelectionMode.FIRST:
+        heapq.heapify(ready)
+    rng = random.get_default_rng()
+
+    # The position of a node in the current sequence is the number of alive leftmost-leaves before it.
+    alive = _FenwickTree(nr_leaves)
+    for step in range(nr_steps):
         if selection is StepMaskSelectionMode.FIRST:
-            selected = nodes[min(allowed.values())]
+            selected = heapq.heappop(ready)
         elif selection is StepMaskSelectionMode.RANDOM:
-            selected = random.choice_list(list(allowed))
+            k = rng.randint(len(ready))
+            ready[k], ready[-1] = ready[-1], ready[k]
+            selected = ready.pop()
         else:
             raise ValueError('Unknown StepMaskSelectionMode: {}.'.format(selection))
 
-        mask_allowed_projected = [1 if x in allowed_projected else 0 for x in ordered_clean_nodes]
-        assert len(selected.children) == 2
-
-        # sanity check.
-        lson = clean_nodes_indices[selected.children[0]]
-        rson = clean_nodes_indices[selected.children[1]]
-        assert lson + 1 == rson
-
-        clean_nodes.difference_update(selected.children)
-        clean_nodes.add(selected)
-        ever_clean_nodes.add(selected)
-
-        answer.append((lson, mask_allowed_projected))
-
-    return answer
-
+        pos = alive.prefix_sum(leftmost[selected])
+        positions[step] = pos
+        alive.remove(leftmost[rson[selected]])
+
+        if step + 1 == nr_steps:
+            break
+
+        # The new sequence is the current one with the right child removed.
+        length = nr_leaves - step
+        row, next_row = masks[step], masks[step + 1]
+        next_row[:pos] = row[:pos]
+        next_row[pos + 1:length - 1] = row[pos + 2:length]
+        next_row[pos] = 0
+
+        p = parent[selected]
+        if p >= 0:
+            pending[p] -= 1
+            if pending[p] == 0:
+                if selection is StepMaskSelectionMode.FIRST:
+                    heapq.heappush(ready, p)
+                else:
+                    ready.append(p)
+                # The left child of p is either the selected node or its left neighbour.
+                next_row[pos if lson[p] == selected else pos - 1] = 1
+
+    return positions, masks
+
+
+def batch_compose_binary_tree_step_masks(trees, selection='first', max_length=None):
+    """
+    Compute the composition steps of a batch of binary trees. See :func:`compose_binary_tree_step_masks_array`.
+
+    Returns:
+        tuple: the positions, an int64 array of shape `[batch, steps]` (padded with -1), the masks, a uint8 array of
+        shape `[batch, steps, length]`, and the number of leaves of each tree. Here, `length` is the maximum number of
+        leaves (or `max_length`) and `steps = length - 1`.
+    """
+    trees = [t if isinstance(t, FlatTree) else FlatTree.from_node(t) for t in trees]
+    lengths = np.array([t.nr_leaves for t in trees], dtype='int64')
+    if max_length is None:
+        max_length = int(lengths.max()) if len(trees) > 0 else 0
+    nr_steps = max(max_length - 1, 0)
+
+    positions = np.full((len(trees), nr_steps), -1, dtype='int64')
+    masks = np.zeros((len(trees), nr_steps, max_length), dtype='uint8')
+    for i, t in enumerate(trees):
+        p, _ = compose_binary_tree_step_masks_array(t, selection, out=masks[i])
+        positions[i, :len(p)] = p
+    return positions, masks, lengths
@@ -0,0 +1,334 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : flat.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+"""
+Flat (array-based) representation of constituency trees.
+
+The nodes are numbered in the pre-order, and the tree is stored as parallel arrays: parent index, label id,
+depth, the (exclusive) pre-order index where the subtree ends, and the span of the leaves covered by the subtree.
+Since the nodes are in the pre-order, the subtree of node `i` is exactly the nodes `[i, end[i])`.
+"""
+
+import re
+import six
+import numpy as np
+
+from jacinle.utils.enum import JacEnum
+
+__all__ = ['tokenize_ptb', 'TreeLabelVocab', 'FlatTree', 'load_ptb_treebank']
+
+_PTB_TOKENIZER = re.compile(r'\(\s*([^\s()]+)\s+([^\s()]+)\s*\)|\(\s*([^\s()]*)|(\))|([^\s()]+)')
+
+
+def tokenize_ptb(encoding):
+    """
+    Tokenize a PTB-formatted tree (a string or a list of whitespace-separated parts). Each token is a tuple of
+    (leaf_label, leaf_token, open_label, close, invalid): either a leaf "(LABEL TOKEN)", an opening "(LABEL",
+    a closing ")", or an invalid token.
+    """
+    if not isinstance(encoding, six.string_types):
+        assert isinstance(encoding, (tuple, list))
+        encoding = ' '.join(encoding)
+    return _PTB_TOKENIZER.findall(encoding)
+
+
+class TreeLabelVocab(object):
+    """The vocabulary of node labels. It is usually shared among all trees of a treebank."""
+
+    def __init__(self, labels=None):
+        self.idx2label = []
+        self.label2idx = dict()
+        if labels is not None:
+            for l in labels:
+                self.add(l)
+
+    def __len__(self):
+        return len(self.idx2label)
+
+    def add(self, label):
+        idx = self.label2idx.get(label)
+        if idx is None:
+            idx = self.label2idx[label] = len(self.idx2label)
+            self.idx2label.append(label)
+        return idx
+
+    def __getitem__(self, idx):
+        return self.idx2label[idx]
+
+
+class _FlatTraversalOrder(JacEnum):
+    PRE = 'pre'
+    POST = 'post'
+
+
+class FlatTree(object):
+    """
+    A constituency tree stored in parallel arrays. See the module docstring for details.
+
+    Attributes:
+        parent (np.ndarray): int32, the parent of each node (-1 for the root).
+        label (np.ndarray): int32, the label id of each node, in `vocab`.
+        depth (np.ndarray): int32, the distance of each node to the root (0 for the root).
+        end (np.ndarray): int32, the subtree of node `i` is the nodes `[i, end[i])`.
+        span (np.ndarray): int32 of shape `[n, 2]`, the leaves covered by each node are `tokens[span[i, 0]:span[i, 1]]`.
+        tokens (list[str]): the tokens of the leaves.
+        vocab (TreeLabelVocab): the label vocabulary.
+    """
+
+    def __init__(self, parent, label, depth, end, span, tokens, vocab):
+        self.parent = parent
+        self.label = label
+        self.depth = depth
+        self.end = end
+        self.span = span
+        self.tokens = tokens
+        self.vocab = vocab
+
+    @classmethod
+    def from_string(cls, encoding, vocab=None):
+        """Parse a PTB-formatted tree in a single pass over the tokens."""
+        if vocab is None:
+            vocab = TreeLabelVocab()
+
+        matches = tokenize_ptb(encoding)
+        label2idx = vocab.label2idx
+        add_label = vocab.add
+        nodes = []  # Flattened rows of (parent, label, depth, end, span_begin, span_end).
+        words = []
+        stack = []
+        for leaf_label, word, open_label, close, invalid in matches:
+            if invalid or (not stack and len(nodes) > 0):
+                raise ValueError('Invalid PTB encoding.')
+            if word:
+                label = label2idx.get(leaf_label)
+                if label is None:
+                    label = add_label(leaf_label)
+                nr_nodes, nr_words = len(nodes) // 6, len(words)
+                nodes.extend((stack[-1] if stack else -1, label, len(stack), nr_nodes + 1, nr_words, nr_words + 1))
+                words.append(word)
+            elif close:
+                if not stack:
+                    raise ValueError('Invalid PTB encoding.')
+                node = stack.pop() * 6
+                nodes[node + 3] = len(nodes) // 6
+                nodes[node + 5] = len(words)
+            else:
+                label = label2idx.get(open_label)
+                if label is None:
+                    label = add_label(open_label)
+                nodes.extend((stack[-1] if stack else -1, label, len(stack), -1, len(words), -1))
+                stack.append(len(nodes) // 6 - 1)
+
+        if len(stack) > 0 or len(nodes) == 0:
+            raise ValueError('Invalid PTB encoding.')
+
+        nodes = np.array(nodes, dtype='int32').reshape(-1, 6)
+        return cls(nodes[:, 0], nodes[:, 1], nodes[:, 2], nodes[:, 3], nodes[:, 4:6], words, vocab)
+
+    @classmethod
+    def from_node(cls, root, vocab=None):
+        """Convert a :class:`PTBNode` into the flat representation."""
+        from .traversal import traversal
+
+        if vocab is None:
+            vocab = TreeLabelVocab()
+        nodes = list(traversal(root, 'pre'))
+        index = {id(x): i for i, x in enumerate(nodes)}
+        parent = np.array([index[id(x.father)] if x is not root else -1 for x in nodes], dtype='int32')
+        label = np.array([vocab.add(x.vtype) for x in nodes], dtype='int32')
+        tokens = [x.token for x in nodes if x.is_leaf]
+        return cls._from_parent(parent, label, tokens, vocab)
+
+    @classmethod
+    def _from_parent(cls, parent, label, tokens, vocab):
+        """Build the tree from the parent and label arrays. The nodes must be in the pre-order."""
+        n = len(parent)
+        depth = np.zeros(n, dtype='int32')
+        end = np.arange(1, n + 1, dtype='int32')
+        for i in range(1, n):
+            depth[i] = depth[parent[i]] + 1
+        nr_children = np.bincount(parent[1:], minlength=n)
+        is_leaf = nr_children == 0
+        leaf_index = np.cumsum(is_leaf) - is_leaf
+        span = np.stack([leaf_index, leaf_index + is_leaf], axis=1).astype('int32')
+        for i in range(n - 1, 0, -1):
+            p = parent[i]
+            end[p] = max(end[p], end[i])
+            span[p, 1] = max(span[p, 1], span[i, 1])
+        return cls(parent, label, depth, end, span, tokens, vocab)
+
+    def __len__(self):
+        return len(self.parent)
+
+    @property
+    def nr_nodes(self):
+        return len(self.parent)
+
+    @property
+    def nr_leaves(self):
+        return len(self.tokens)
+
+    @property
+    def nr_children(self):
+        return np.bincount(self.parent[1:], minlength=self.nr_nodes)
+
+    @property
+    def is_leaf(self):
+        return self.end == np.arange(1, self.nr_nodes + 1)
+
+    @property
+    def leaves(self):
+        """The indices of the leaf nodes, from left to right."""
+        return np.nonzero(self.is_leaf)[0]
+
+    @property
+    def labels(self):
+        return [self.vocab[l] for l in self.label]
+
+    def children(self, node):
+        """The children of a node, from left to right."""
+        children = []
+        c = node + 1
+        end = self.end[node]
+        while c < end:
+            children.append(c)
+            c = self.end[c]
+        return children
+
+    def children_lists(self):
+        """The children of all nodes, as a list of lists."""
+        children = [[] for _ in range(self.nr_nodes)]
+        for i, p in enumerate(self.parent[1:].tolist(), 1):
+            children[p].append(i)
+        return children
+
+    def traversal(self, order='pre'):
+        """Node indices in the given traversal order, as an ndarray."""
+        order = _FlatTraversalOrder.from_string(order)
+        if order is _FlatTraversalOrder.PRE:
+            return np.arange(self.nr_nodes)
+        # In the post-order, a node comes after all nodes in its subtree (ending at end[i] - 1), and deeper nodes
+        # come first among the nodes whose subtrees end at the same position.
+        return np.lexsort((-self.depth, self.end))
+
+    @property
+    def max_depth(self):
+        """The depth of the tree, as defined in :attr:`Node.depth` (a single node has depth 1)."""
+        return int(self.depth.max()) + 1
+
+    def heights(self):
+        """The depth (as in :attr:`Node.depth`) of the subtree rooted at each node."""
+        heights = np.ones(self.nr_nodes, dtype='int32')
+        for d in range(int(self.depth.max()), 0, -1):
+            nodes = np.nonzero(self.depth == d)[0]
+            np.maximum.at(heights, self.parent[nodes], heights[nodes] + 1)
+        return heights
+
+    def subtree(self, node):
+        """Extract the subtree rooted at the given node, as a new :class:`FlatTree`."""
+        begin, end = node, self.end[node]
+        parent = self.parent[begin:end] - begin
+        parent[0] = -1
+        span = self.span[begin:end] - self.span[begin, 0]
+        return type(self)(
+            parent, self.label[begin:end].copy(), self.depth[begin:end] - self.depth[begin],
+            self.end[begin:end] - begin, span, self.tokens[self.span[begin, 0]:self.span[begin, 1]], self.vocab
+        )
+
+    def binarize(self, temp_label='<TEMP>'):
+        """
+        Binarize the tree. The result is identical to :func:`jaclearn.nlp.tree.constituency.binarize_tree`:
+        unary chains are collapsed into the lowest node (with the label of the highest node), and nodes with more than
+        two children are split recursively into halves with temporary nodes.
+        """
+        temp = self.vocab.add(temp_label)
+        children = self.children_lists()
+        parent, label = [], []
+
+        def emit(node, p, l):
+            # Collapse the unary chain.
+            while len(children[node]) == 1:
+                node = children[node][0]
+            i = len(parent)
+            parent.append(p)
+            label.append(l)
+            split(children[node], i)
+
+        def split(nodes, p):
+            n = len(nodes)
+            if n == 0:
+                return
+            for part in (nodes[:n // 2], nodes[n // 2:]):
+                if len(part) == 1:
+                    emit(part[0], p, self.label[part[0]])
+                else:
+                    i = len(parent)
+                    parent.append(p)
+                    label.append(temp)
+                    split(part, i)
+
+        emit(0, -1, self.label[0])
+        return self._from_parent(np.array(parent, dtype='int32'), np.array(label, dtype='int32'), list(self.tokens), self.vocab)
+
+    def to_node(self, cls=None):
+        """Convert the tree into :class:`PTBNode` objects (or other subclasses of :class:`Node`)."""
+        if cls is None:
+            from .ptb import PTBNode
+            cls = PTBNode
+
+        labels = self.vocab.idx2label
+        is_leaf = self.is_leaf.tolist()
+        span_begin = self.span[:, 0].tolist()
+        nodes = []
+        for i, (p, l) in enumerate(zip(self.parent.tolist(), self.label.tolist())):
+            node = cls(labels[l], self.tokens[span_begin[i]] if is_leaf[i] else None)
+            if p >= 0:
+                nodes[p].append_child(node)
+            nodes.append(node)
+        return nodes[0]
+
+    def to_sentence(self, to_string=True):
+        if not to_string:
+            return list(self.tokens)
+        return ' '.join(self.tokens)
+
+    def to_string(self, vtype=True):
+        """Convert the tree into the (compressed) PTB format, identical to :meth:`PTBNode.to_string`."""
+        labels = self.vocab.idx2label
+        is_leaf = self.is_leaf.tolist()
+        span_begin = self.span[:, 0].tolist()
+        end = self.end.tolist()
+        label = self.label.tolist()
+
+        output = []
+        closing = []
+        for i in range(self.nr_nodes):
+            while closing and closing[-1] <= i:
+                closing.pop()
+                output.append(')')
+            if output and output[-1] != '(' and not output[-1].endswith(' '):
+                output.append(' ')
+            if is_leaf[i]:
+                if vtype:
+                    output.append('({} {})'.format(labels[label[i]], self.tokens[span_begin[i]]))
+                else:
+                    output.append('({})'.format(self.tokens[span_begin[i]]))
+            else:
+                output.append('({} '.format(labels[label[i]]) if vtype else '(')
+                closing.append(end[i])
+        output.extend(')' * len(closing))
+        return ''.join(output)
+
+
+def load_ptb_treebank(lines, vocab=None):
+    """Parse a list of PTB-formatted trees into :class:`FlatTree` objects that share one label vocabulary."""
+    if vocab is None:
+        vocab = TreeLabelVocab()
+    return [FlatTree.from_string(l, vocab) for l in lines if len(l.strip()) > 0]
@@ -12,7 +12,7 @@
 The definition for tree Nodes.
 """
 
-from copy import deepcopy
+from copy import copy, deepcopy
 
 __all__ = ['Node']
 
@@ -49,9 +49,12 @@ class Node(object):
         Depth is defined as the number of nodes on the maximum distance with the root of nodes + 1.
         (Thus a single nodes will have depth 1.)
         """
-        if self.is_leaf:
-            return 1
-        return max([c.depth for c in self.children]) + 1
+        depth = 0
+        level = [self]
+        while len(level) > 0:
+            depth += 1
+            level = [c for x in level for c in x.children]
+        return depth
 
     @property
     def breadth(self):
@@ -63,7 +66,21 @@ class Node(object):
         return max(max([c.breath for c in self.children]), len(self.children))
 
     def clone(self):
-        return deepcopy(self)
+        # A subtree is cloned together with its ancestors (by deepcopy), as before.
+        if self.father is not None:
+            return deepcopy(self)
+
+        root = copy(self)
+        root.children = []
+        stack = [(self, root)]
+        while len(stack) > 0:
+            x, y = stack.pop()
+            for c in x.children:
+                z = copy(c)
+                z.children = []
+                y.append_child(z)
+                stack.append((c, z))
+        return root
 
     def insert_child(self, pos, node):
         node.father = self
@@ -14,9 +14,8 @@ PTB-formed constituency trees.
 
 __all__ = ['PTBNode']
 
-import six
-
 from .node import Node
+from .flat import tokenize_ptb
 from .traversal import traversal
 
 
@@ -27,52 +26,33 @@ class PTBNode(Node):
 
     @classmethod
     def from_string(cls, encoding):
-        if isinstance(encoding, six.string_types):
-            steps = encoding.split()
-        else:
-            assert isinstance(encoding, (tuple, list))
-            steps = encoding
-
+        """Parse a PTB-formatted tree. Use :meth:`FlatTree.from_string` for the (faster) flat representation."""
         stack = []
-        word_id = 0
-        for s in steps:
-            if s == '(' or s.startswith('('):
-                while s.startswith('('):
-                    stack.append('(')
-                    s = s[1:]
-                if len(s) > 0:
-                    stack.append(s)
-            elif s == ')' or s.endswith(')'):
-                nr_right = 0
-                while s.endswith(')'):
-                    nr_right += 1
-                    s = s[:-1]
-                if len(s) > 0:
-                    stack.append(s)
-
-                for i in range(nr_right):
-                    poped = []
-                    while True:
-                        x = stack.pop()
-                        if isinstance(x, six.string_types) and x == '(':
-                            break
-                        poped.append(x)
-                    poped = poped[::-1]
-
-                    if len(poped) == 2 and isinstance(poped[1], six.string_types):  # is leaf
-                        stack.append(cls(poped[0], poped[1]))
-                    else:
-                        node = cls(poped[0])
-                        for x in poped[1:]:
-                            node.append_child(x)
-                        stack.append(node)
+        root = None
+        for leaf_label, word, open_label, close, invalid in tokenize_ptb(encoding):
+            if invalid or (root is not None and not stack):
+                raise ValueError('Invalid PTB encoding.')
+            if word:
+                node = cls(leaf_label, word)
+                if stack:
+                    stack[-1].append_child(node)
+                else:
+                    root = node
+            elif close:
+                if not stack:
+                    raise ValueError('Invalid PTB encoding.')
+                stack.pop()
             else:
-                stack.append(s)
+                node = cls(open_label)
+                if stack:
+                    stack[-1].append_child(node)
+                else:
+                    root = node
+                stack.append(node)
 
-        if len(stack) != 1:
+        if root is None or len(stack) > 0:
             raise ValueError('Invalid PTB encoding.')
-    
-        return stack[0]
+        return root
 
     def to_string(self, to_string=True, compressed=True, vtype=True):
         if not to_string:
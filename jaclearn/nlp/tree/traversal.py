@@ -25,16 +25,26 @@ class TraversalOrder(JacEnum):
 
 def traversal(root, order='pre'):
     order = TraversalOrder.from_string(order)
+    return _iterative_dfs(root, order, lambda x: x.children)
 
-    def dfs(x):
-        if order is TraversalOrder.PRE:
-            yield x
-        for c in x.children:
-            yield from dfs(c)
-        if order is TraversalOrder.POST:
-            yield x
 
-    return dfs(root)
+def _iterative_dfs(root, order, get_children):
+    # An explicit stack avoids the overhead of nested generators (one per level).
+    if order is TraversalOrder.PRE:
+        stack = [root]
+        while len(stack) > 0:
+            x = stack.pop()
+            yield x
+            stack.extend(reversed(get_children(x)))
+    else:
+        stack = [(root, False)]
+        while len(stack) > 0:
+            x, expanded = stack.pop()
+            if expanded:
+                yield x
+            else:
+                stack.append((x, True))
+                stack.extend((c, False) for c in reversed(get_children(x)))
 
 
 def _shuffled(a):
@@ -45,16 +55,7 @@ def _shuffled(a):
 
 def random_traversal(root, order='pre'):
     order = TraversalOrder.from_string(order)
-
-    def dfs(x):
-        if order is TraversalOrder.PRE:
-            yield x
-        for c in _shuffled(x.children):
-            yield from dfs(c)
-        if order is TraversalOrder.POST:
-            yield x
-
-    return dfs(root)
+    return _iterative_dfs(root, order, lambda x: _shuffled(x.children))
 
 
 def is_binary_tree(root):
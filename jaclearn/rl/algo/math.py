@@ -107,3 +107,129 @@ def compute_gae(rewards, values, next_val, gamma, lambda_):
         adv_batch[i] = td_i
 
     return adv_batch
+
+
+def flat_to_padded(x, offsets, pad_value=0):
+    """Convert a flat array of concatenated trajectories into a padded `[batch, time, ...]` array.
+
+    Args:
+        x: the flat array, of shape `[total_steps, ...]`.
+        offsets: the trajectory offsets, of length `batch + 1`. The i-th trajectory is `x[offsets[i]:offsets[i+1]]`.
+
+    Returns:
+        tuple: the padded array and the lengths of the trajectories.
+    """
+    x = np.asarray(x)
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    max_length = lengths.max() if len(lengths) > 0 else 0
+    mask = np.arange(max_length)[np.newaxis] < lengths[:, np.newaxis]
+    padded = np.full((len(lengths), max_length) + x.shape[1:], pad_value, dtype=x.dtype)
+    # The row-major order of the masked entries is exactly the order of the flat array.
+    padded[mask] = x[offsets[0]:offsets[-1]]
+    return padded, lengths
+
+
+def padded_to_flat(x, lengths):
+    """The inverse of :func:`flat_to_padded`."""
+    x = np.asarray(x)
+    mask = np.arange(x.shape[1])[np.newaxis] < np.asarray(lengths)[:, np.newaxis]
+    return x[mask]
+
+
+def _batch_discounted_scan(x, coeffs, gamma):
+    """Compute y[:, t] = x[:, t] + coeffs[:, t] * y[:, t + 1] (y[:, T] = 0) for all trajectories at once.
+    If coeffs is None, a constant `gamma` is used and the recurrence is solved by `lfilter`."""
+    if coeffs is None:
+        return scipy.signal.lfilter([1], [1, float(-gamma)], x[:, ::-1], axis=1)[:, ::-1]
+
+    out = np.empty_like(x)
+    acc = np.zeros_like(x[:, 0])
+    for t in range(x.shape[1] - 1, -1, -1):
+        acc = x[:, t] + coeffs[:, t] * acc
+        out[:, t] = acc
+    return out
+
+
+def _batch_prepare(rewards, dones, lengths):
+    rewards = np.asarray(rewards, dtype='float64')
+    assert rewards.ndim == 2, 'Rewards should be of shape [batch, time].'
+    nonterminal = None
+    if dones is not None:
+        nonterminal = 1 - np.asarray(dones, dtype='float64')
+
+    mask = None
+    if lengths is not None:
+        mask = np.arange(rewards.shape[1])[np.newaxis] < np.asarray(lengths)[:, np.newaxis]
+        rewards = rewards * mask
+    return rewards, nonterminal, mask
+
+
+def batch_discount_cumsum(rewards, gamma, dones=None, next_values=None, lengths=None):
+    """Compute the discounted returns of a batch of trajectories in one pass.
+
+    Args:
+        rewards: the rewards, of shape `[batch, time]`.
+        gamma (float): the discount factor.
+        dones: optional, of shape `[batch, time]`. `dones[b, t]` indicates that an episode terminates after step `t`,
+            so that the return is not propagated across the episode boundary.
+        next_values: optional, of shape `[batch]`. The value used to bootstrap the return after the last step.
+        lengths: optional, of shape `[batch]`. The lengths of the trajectories, if the inputs are padded.
+
+    Returns:
+        np.ndarray: the discounted returns, of shape `[batch, time]` (zero at padded positions).
+    """
+    rewards, nonterminal, mask = _batch_prepare(rewards, dones, lengths)
+    if next_values is not None:
+        rewards = rewards.copy()
+        last = _last_indices(rewards, lengths)
+        batch_indices = np.arange(rewards.shape[0])
+        bootstrap = gamma * np.asarray(next_values, dtype='float64')
+        if nonterminal is not None:
+            bootstrap = bootstrap * nonterminal[batch_indices, last]
+        rewards[batch_indices, last] += bootstrap
+
+    coeffs = None if nonterminal is None else gamma * nonterminal
+    return _batch_discounted_scan(rewards, coeffs, gamma)
+
+
+def batch_compute_gae(rewards, values, gamma, lambda_, dones=None, next_values=None, lengths=None):
+    """Compute the generalized advantage estimation (GAE) of a batch of trajectories in one pass.
+
+    Args:
+        rewards: the rewards, of shape `[batch, time]`.
+        values: the value estimations, of shape `[batch, time]`.
+        gamma (float): the discount factor.
+        lambda_ (float): the GAE parameter.
+        dones: optional, of shape `[batch, time]`. `dones[b, t]` indicates that an episode terminates after step `t`.
+        next_values: optional, of shape `[batch]`. The value estimation after the last step (default: 0).
+        lengths: optional, of shape `[batch]`. The lengths of the trajectories, if the inputs are padded.
+
+    Returns:
+        np.ndarray: the advantages, of shape `[batch, time]` (zero at padded positions).
+    """
+    rewards, nonterminal, mask = _batch_prepare(rewards, dones, lengths)
+    values = np.asarray(values, dtype='float64')
+    batch_size, length = rewards.shape
+
+    next_vals = np.zeros_like(values)
+    next_vals[:, :-1] = values[:, 1:]
+    if next_values is not None:
+        next_vals[np.arange(batch_size), _last_indices(rewards, lengths)] = next_values
+    elif lengths is not None:
+        next_vals[np.arange(batch_size), _last_indices(rewards, lengths)] = 0
+    if nonterminal is not None:
+        next_vals = next_vals * nonterminal
+
+    deltas = rewards + gamma * next_vals - values
+    if mask is not None:
+        deltas = deltas * mask
+
+    coeffs = None if nonterminal is None else gamma * lambda_ * nonterminal
+    return _batch_discounted_scan(deltas, coeffs, gamma * lambda_)
+
+
+def _last_indices(rewards, lengths):
+    if lengths is None:
+        return np.full(rewards.shape[0], rewards.shape[1] - 1, dtype='int64')
+    return np.maximum(np.asarray(lengths, dtype='int64') - 1, 0)
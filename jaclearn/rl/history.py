@@ -0,0 +1,221 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : history.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+"""
+Preallocated frame history for frame-stacking environments.
+
+The history is stored in a ring buffer with every slot written twice (at position `i` and `i + history_length`),
+so that the most recent `history_length` frames always form a contiguous slice of the buffer. The stacked
+observation is thus a zero-copy view of the buffer.
+"""
+
+import numpy as np
+
+__all__ = ['FrameHistory', 'LazyFrameStack']
+
+
+class LazyFrameStack(object):
+    """
+    A lazily concatenated stack of frames. It only holds references to the frames; the concatenation is
+    performed when the object is converted into an ndarray (e.g., by `np.asarray`).
+    """
+
+    def __init__(self, frames, axis=-1, concat=True):
+        self._frames = tuple(frames)
+        self._axis = axis
+        self._concat = concat
+
+    @property
+    def frames(self):
+        return self._frames
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, item):
+        return np.asarray(self)[item]
+
+    def __array__(self, dtype=None, copy=None):
+        if self._concat:
+            out = np.concatenate(self._frames, axis=self._axis)
+        else:
+            out = np.stack(self._frames, axis=self._axis)
+        if dtype is not None:
+            out = out.astype(dtype)
+        return out
+
+    @property
+    def shape(self):
+        return np.asarray(self).shape
+
+    @property
+    def dtype(self):
+        return self._frames[-1].dtype
+
+
+class FrameHistory(object):
+    """
+    A fixed-length frame history backed by a preallocated ring buffer.
+
+    Args:
+        history_length (int): the number of frames to keep.
+        axis (int): the axis along which frames are stacked.
+        concat (bool): if true, frames are concatenated along an existing axis (as `np.concatenate`); otherwise
+            they are stacked along a new axis (as `np.stack`).
+        batched (bool): if true, the leading dimension of each frame is treated as the batch dimension (e.g., the
+            observations of a vectorized environment). The axis is then relative to a single frame.
+        mode (str): what `get()` returns. `copy`: a freshly allocated ndarray; `view`: a zero-copy view into the
+            buffer, which will be overwritten by later pushes; `lazy`: a `LazyFrameStack` holding references to the
+            pushed frames (frames must not be modified in-place after being pushed).
+    """
+
+    def __init__(self, history_length, axis=-1, concat=True, batched=False, mode='copy'):
+        assert mode in ('copy', 'view', 'lazy'), 'Unknown history mode: {}.'.format(mode)
+        self._history_length = history_length
+        self._axis = axis
+        self._concat = concat
+        self._batched = batched
+        self._mode = mode
+
+        self._buffer = None
+        self._frames = None
+        self._frame_shape = None
+        self._buffer_axis = None
+        self._pos = 0
+        self._size = 0
+
+    @property
+    def history_length(self):
+        return self._history_length
+
+    @property
+    def mode(self):
+        return self._mode
+
+    def __len__(self):
+        return self._size
+
+    def _normalize_axis(self, frame):
+        ndim = frame.ndim - int(self._batched) + int(not self._concat)
+        axis = self._axis
+        if axis < 0:
+            axis += ndim
+        assert 0 <= axis < ndim, 'Invalid stacking axis {} for frames of shape {}.'.format(self._axis, frame.shape)
+        return axis + int(self._batched)
+
+    def _init(self, frame):
+        self._frame_shape = frame.shape
+        self._buffer_axis = self._normalize_axis(frame)
+
+        if self._mode == 'lazy':
+            self._frames = [np.zeros_like(frame)] * self._history_length
+            return
+
+        if not self._concat:
+            frame = np.expand_dims(frame, self._buffer_axis)
+        shape = list(frame.shape)
+        shape[self._buffer_axis] *= 2 * self._history_length
+        self._buffer = np.zeros(shape, dtype=frame.dtype)
+
+    def _slot(self, i, n=1):
+        step = self._buffer.shape[self._buffer_axis] // (2 * self._history_length)
+        index = [slice(None)] * self._buffer.ndim
+        index[self._buffer_axis] = slice(i * step, (i + n) * step)
+        return tuple(index)
+
+    def push(self, frame):
+        """Append a new frame (or a batch of frames, if batched), overwriting the oldest one in place."""
+        frame = np.asarray(frame)
+        if self._frame_shape is None:
+            self._init(frame)
+        assert frame.shape == self._frame_shape, 'Frame shape mismatch: expect {}, got {}.'.format(self._frame_shape, frame.shape)
+
+        i = self._pos
+        if self._mode == 'lazy':
+            self._frames[i] = frame
+        else:
+            if not self._concat:
+                frame = np.expand_dims(frame, self._buffer_axis)
+            self._buffer[self._slot(i)] = frame
+            self._buffer[self._slot(i + self._history_length)] = frame
+
+        self._pos = (i + 1) % self._history_length
+        self._size = min(self._size + 1, self._history_length)
+        return self
+
+    def get(self):
+        """Get the stacked frames, ordered from the oldest to the newest. Missing frames are filled with zeros."""
+        assert self._size > 0, 'Empty frame history.'
+        if self._mode == 'lazy':
+            frames = self._frames[self._pos:] + self._frames[:self._pos]
+            return LazyFrameStack(frames, axis=self._buffer_axis, concat=self._concat)
+
+        view = self._buffer[self._slot(self._pos, self._history_length)]
+        if self._mode == 'copy':
+            return view.copy()
+        return view
+
+    def clear(self, indices=None, keep_last=False):
+        """
+        Reset the history to zeros.
+
+        Args:
+            indices: if not None, only reset these entries along the batch dimension (requires batched=True).
+            keep_last (bool): keep the most recent frame. Useful for vectorized environments, where the first
+                observation of a new episode has been pushed together with the others.
+        """
+        if self._frame_shape is None:
+            return self
+        if indices is None and not keep_last:
+            self._size = 0
+            self._pos = 0
+            if self._mode == 'lazy':
+                self._frames = [np.zeros_like(self._frames[0])] * self._history_length
+            else:
+                self._buffer.fill(0)
+            return self
+
+        assert indices is None or self._batched, 'Partial reset requires a batched history.'
+        last = (self._pos - 1) % self._history_length
+        for i in range(self._history_length):
+            if keep_last and i == last:
+                continue
+            if self._mode == 'lazy':
+                if indices is None:
+                    self._frames[i] = np.zeros_like(self._frames[i])
+                else:
+                    self._frames[i] = self._frames[i].copy()
+                    self._frames[i][indices] = 0
+            else:
+                for j in (i, i + self._history_length):
+                    slot = self._slot(j)
+                    if indices is None:
+                        self._buffer[slot] = 0
+                    else:
+                        self._buffer[(indices, ) + slot[1:]] = 0
+
+        if indices is None:
+            self._size = min(self._size, int(keep_last))
+        return self
+
+    def copy(self):
+        """Make a snapshot of the history. The frame buffer is copied, so that the snapshot is not affected by later pushes."""
+        other = FrameHistory(self._history_length, axis=self._axis, concat=self._concat, batched=self._batched, mode=self._mode)
+        other._frame_shape = self._frame_shape
+        other._buffer_axis = self._buffer_axis
+        other._pos = self._pos
+        other._size = self._size
+        if self._buffer is not None:
+            other._buffer = self._buffer.copy()
+        if self._frames is not None:
+            other._frames = list(self._frames)
+        return other
+
+    __copy__ = copy
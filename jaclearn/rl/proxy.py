@@ -8,12 +8,11 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
-import copy
 import functools
-import collections
 import numpy as np
 
 from .env import ProxyRLEnvBase
+from .history import FrameHistory
 from .space import DiscreteActionSpace
 
 __all__ = [
@@ -132,44 +131,47 @@ class MapActionProxy(ProxyRLEnvBase):
 
 
 class HistoryFrameProxy(ProxyRLEnvBase):
-    @staticmethod
-    def __zeros_like(v):
-        if type(v) is tuple:
-            return tuple(HistoryFrameProxy.__zeros_like(i) for i in v)
-        assert isinstance(v, np.ndarray)
-        return np.zeros_like(v, dtype=v.dtype)
-
-    @staticmethod
-    def __concat(history):
-        last = history[-1]
-        if type(last) is tuple:
-            return tuple(HistoryFrameProxy.__concat(i) for i in zip(*history))
-        return np.concatenate(history, axis=-1)
+    """
+    Stack the most recent `history_length` states as the current state. States can be ndarrays or (nested) tuples
+    of ndarrays. See :class:`jaclearn.rl.history.FrameHistory` for the meaning of `axis`, `concat` and `mode`.
+    """
 
-    def __init__(self, other, history_length):
+    def __init__(self, other, history_length, axis=-1, concat=True, mode='copy'):
         super().__init__(other)
-        self._history = collections.deque(maxlen=history_length)
+        self._history_length = history_length
+        self._history_kwargs = dict(axis=axis, concat=concat, mode=mode)
+        self._history = None
+
+    def __make_history(self, state):
+        if type(state) is tuple:
+            return tuple(self.__make_history(s) for s in state)
+        assert isinstance(state, np.ndarray)
+        return FrameHistory(self._history_length, **self._history_kwargs)
+
+    @staticmethod
+    def __map_history(func, history, *args):
+        if type(history) is tuple:
+            return tuple(HistoryFrameProxy.__map_history(func, h, *a) for h, *a in zip(history, *args))
+        return func(history, *args)
 
     def _get_current_state(self):
-        while len(self._history) != self._history.maxlen:
-            assert len(self._history) > 0
-            v = self._history[-1]
-            self._history.appendleft(self.__zeros_like(v))
-        return self.__concat(self._history)
+        assert self._history is not None
+        return self.__map_history(FrameHistory.get, self._history)
 
     def _set_current_state(self, state):
-        if len(self._history) == self._history.maxlen:
-            self._history.popleft()
-        self._history.append(state)
+        if self._history is None:
+            self._history = self.__make_history(state)
+        self.__map_history(FrameHistory.push, self._history, state)
 
-    # Use shallow copy
+    # The frame buffers are copied, so that the snapshot is not affected by later actions.
     def copy_history(self):
-        return copy.copy(self._history)
+        return self.__map_history(FrameHistory.copy, self._history)
 
     def restore_history(self, history):
-        assert isinstance(history, collections.deque)
-        assert history.maxlen == self._history.maxlen
-        self._history = copy.copy(history)
+        def restore(h):
+            assert isinstance(h, FrameHistory) and h.history_length == self._history_length
+            return h.copy()
+        self._history = self.__map_history(restore, history)
 
     def _action(self, action):
         r, is_over = self.proxy.action(action)
@@ -178,7 +180,8 @@ class HistoryFrameProxy(ProxyRLEnvBase):
 
     def _restart(self, *args, **kwargs):
         super()._restart(*args, **kwargs)
-        self._history.clear()
+        if self._history is not None:
+            self.__map_history(FrameHistory.clear, self._history)
         self._set_current_state(self.proxy.current_state)
 
 
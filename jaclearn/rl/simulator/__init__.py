@@ -11,6 +11,7 @@
 
 from .controller import *
 from .pack import *
+from .trajectory import *
 
 
 __quit_action__ = 32767
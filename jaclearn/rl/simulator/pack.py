@@ -10,11 +10,18 @@
 
 from jacinle.utils.imp import module_vars_as_dict
 
+from .trajectory import TrajectoryStore
+
 
 class Pack(object):
+    """
+    Record of a single episode. The steps are stored in a columnar :class:`TrajectoryStore` (`self.trajectory`):
+    one ndarray per field, and the final observation as an episode-level field.
+    """
+
     def __init__(self, cfg=None):
         self.cfg = cfg
-        self.steps = []
+        self.trajectory = TrajectoryStore()
         self.is_ended = False
 
         self.__last_observation = None
@@ -25,24 +32,31 @@ class Pack(object):
     def step(self, action, observation, reward, done, info=None):
         assert not self.is_ended
 
-        last_observation = self.__last_observation
+        record = dict(action=action, observation=self.__last_observation, reward=reward)
+        if info is not None:
+            record['info'] = info
+        self.trajectory.append(**record)
 
         if done:
             self.is_ended = True
             self.__last_observation = None
+            self.trajectory.end_episode(observation=observation)
         else:
             self.__last_observation = observation
 
-        record = dict(
-            action=action,
-            observation=last_observation,
-            reward=reward,
-            info=info)
-        self.steps.append(record)
+    @property
+    def steps(self):
+        """The steps as a list of dicts. When the episode has ended, the last record holds the final observation."""
+        n = len(self.trajectory)
+        fields = {k: self.trajectory.get_field(k) for k in ('action', 'observation', 'reward', 'info') if k in self.trajectory.fields}
+        steps = [{k: fields[k][i] if k in fields else None for k in ('action', 'observation', 'reward', 'info')} for i in range(n)]
+        if self.is_ended:
+            steps.append(dict(action=None, observation=self.trajectory.get_episode_field('observation')[0], reward=None, info=None))
+        return steps
 
-        if done:
-            record = dict(action=None, observation=observation, reward=None, info=None)
-            self.steps.append(record)
+    def dump(self, filename, compressed=False):
+        """Save the trajectory in the columnar format. See :meth:`TrajectoryStore.dump`."""
+        return self.trajectory.dump(filename, compressed=compressed)
 
     def make_pickleable(self):
         return dict(
@@ -0,0 +1,292 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : trajectory.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+"""
+Columnar storage of trajectories. Each field (e.g., observation, action, reward) is stored in one growable ndarray,
+and the episode boundaries are stored as offsets into these arrays.
+"""
+
+import os
+import os.path as osp
+import numpy as np
+
+import jacinle.random as random
+
+__all__ = ['TrajectoryStore']
+
+_OFFSETS_KEY = '__offsets__'
+_EPISODE_PREFIX = '__episode__'
+
+
+class _Column(object):
+    """A growable, preallocated ndarray. Appending is amortized O(1)."""
+
+    def __init__(self, value, capacity):
+        value = np.asarray(value) if _is_numeric(value) else None
+        if value is None:
+            self.data = np.empty(capacity, dtype=object)
+        else:
+            self.data = np.zeros((capacity, ) + value.shape, dtype=value.dtype)
+        self.size = 0
+
+    @classmethod
+    def from_array(cls, data):
+        column = cls.__new__(cls)
+        column.data = data
+        column.size = len(data)
+        return column
+
+    @property
+    def is_object(self):
+        return self.data.dtype == object
+
+    def reserve(self, size):
+        if size > len(self.data):
+            capacity = max(size, 2 * len(self.data), 16)
+            if self.is_object:
+                data = np.empty(capacity, dtype=object)
+            else:
+                data = np.zeros((capacity, ) + self.data.shape[1:], dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+    def promote(self, value, batched=False):
+        """
+        Promote the dtype of the column so that it can hold the value (or a batch of values, if batched is True).
+        Non-numeric values and values of a different shape turn the column into an object column.
+        """
+        if self.is_object:
+            return
+        if batched:
+            numeric = value.dtype != object and value.shape[1:] == self.data.shape[1:]
+        else:
+            numeric = _is_numeric(value) and np.shape(value) == self.data.shape[1:]
+        if numeric:
+            try:
+                dtype = np.result_type(self.data.dtype, value.dtype if batched else value)
+            except TypeError:
+                numeric = False
+        if not numeric:
+            data = np.empty(len(self.data), dtype=object)
+            for i in range(self.size):
+                data[i] = self.data[i]
+            self.data = data
+        elif dtype != self.data.dtype:
+            self.data = self.data.astype(dtype)
+
+    def set(self, index, value):
+        self.reserve(index + 1)
+        self.promote(value)
+        if self.is_object:
+            # Avoid numpy broadcasting sequences into the object array.
+            self.data[index:index + 1] = [None]
+            self.data[index] = value
+        else:
+            self.data[index] = value
+        self.size = max(self.size, index + 1)
+
+    def view(self, size=None):
+        if size is None:
+            size = self.size
+        self.reserve(size)
+        return self.data[:size]
+
+
+def _is_numeric(value):
+    if isinstance(value, np.ndarray):
+        return value.dtype != object
+    return isinstance(value, (bool, int, float, np.number, np.bool_))
+
+
+class TrajectoryStore(object):
+    """
+    A columnar trajectory store. Each step is a set of named fields, stored in one preallocated ndarray per field.
+    Numeric fields (ndarrays and scalars) are stored with the shape of their first value, and the dtype is promoted
+    as new values come in (e.g., int to float); all other values (e.g., dicts or None), as well as values of
+    inconsistent shapes, turn the field into an object column. Fields not given for a step are left zero (None for
+    object columns). Episode-level fields (e.g., the final observation) can be passed to `end_episode`.
+
+    Example:
+        >>> store = TrajectoryStore()
+        >>> store.append(observation=obs, action=1, reward=0.5)
+        >>> store.end_episode(final_observation=obs)
+        >>> store.get_episode(0)['reward']
+    """
+
+    def __init__(self, capacity=1024):
+        self._capacity = capacity
+        self._columns = dict()
+        self._episode_columns = dict()
+        self._size = 0
+        self._offsets = [0]
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def fields(self):
+        return tuple(self._columns.keys())
+
+    @property
+    def nr_episodes(self):
+        return len(self._offsets) - 1
+
+    @property
+    def episode_offsets(self):
+        """The offsets of the episodes, of length `nr_episodes + 1`. The i-th episode spans `[offsets[i], offsets[i + 1])`."""
+        return np.array(self._offsets, dtype='int64')
+
+    @property
+    def episode_lengths(self):
+        return np.diff(self.episode_offsets)
+
+    def _set(self, columns, index, capacity, values):
+        for k, v in values.items():
+            if k not in columns:
+                columns[k] = _Column(v, capacity)
+            columns[k].set(index, v)
+
+    def append(self, **fields):
+        """Append a step to the current (unfinished) episode."""
+        self._set(self._columns, self._size, self._capacity, fields)
+        self._size += 1
+        return self
+
+    def extend(self, **fields):
+        """Append multiple steps at once. Each field is an array-like whose first dimension is the number of steps."""
+        lengths = {len(v) for v in fields.values()}
+        assert len(lengths) == 1, 'All fields must have the same length.'
+        n = lengths.pop()
+        for k, v in fields.items():
+            v = np.asarray(v)
+            if k not in self._columns:
+                self._columns[k] = _Column(v[0], self._capacity)
+            column = self._columns[k]
+            column.reserve(self._size + n)
+            column.promote(v, batched=True)
+            if column.is_object:
+                for i in range(n):
+                    column.data[self._size + i] = v[i]
+            else:
+                column.data[self._size:self._size + n] = v
+            column.size = self._size + n
+        self._size += n
+        return self
+
+    def end_episode(self, **fields):
+        """Finish the current episode, optionally with episode-level fields."""
+        self._set(self._episode_columns, self.nr_episodes, 16, fields)
+        self._offsets.append(self._size)
+        return self
+
+    def get_field(self, name):
+        """Get a field of all steps, as a view of the underlying storage."""
+        return self._columns[name].view(self._size)
+
+    def get_episode_field(self, name):
+        return self._episode_columns[name].view(self.nr_episodes)
+
+    def get_episode(self, index):
+        """Get all fields of an episode. Step fields are views of the underlying storage."""
+        begin, end = self._offsets[index], self._offsets[index + 1]
+        episode = {k: c.view(self._size)[begin:end] for k, c in self._columns.items()}
+        for k, c in self._episode_columns.items():
+            episode[k] = c.view(self.nr_episodes)[index]
+        return episode
+
+    def iter_episodes(self):
+        for i in range(self.nr_episodes):
+            yield self.get_episode(i)
+
+    def get_steps(self, indices, fields=None):
+        """Gather steps by (global) indices, returned as a dict of arrays."""
+        fields = fields or self.fields
+        indices = np.asarray(indices)
+        return {k: self._columns[k].view(self._size)[indices] for k in fields}
+
+    def episode_of(self, indices):
+        """Compute the index of the episode containing each of the given step indices."""
+        return np.searchsorted(self.episode_offsets, indices, side='right') - 1
+
+    def sample(self, batch_size, fields=None, rng=None):
+        """
+        Sample a random minibatch of steps across all finished episodes.
+
+        Returns:
+            tuple: the sampled steps (a dict of arrays) and their global indices.
+        """
+        rng = rng or random.get_default_rng()
+        nr_steps = self._offsets[-1]
+        assert nr_steps > 0, 'No finished episode in the store.'
+        indices = rng.randint(nr_steps, size=batch_size)
+        return self.get_steps(indices, fields), indices
+
+    def sample_episodes(self, batch_size, replace=False, rng=None):
+        rng = rng or random.get_default_rng()
+        indices = rng.choice(self.nr_episodes, size=batch_size, replace=replace)
+        return [self.get_episode(i) for i in indices]
+
+    def clear(self):
+        self._columns = dict()
+        self._episode_columns = dict()
+        self._size = 0
+        self._offsets = [0]
+        return self
+
+    def _as_arrays(self):
+        arrays = {k: c.view(self._size) for k, c in self._columns.items()}
+        arrays.update({_EPISODE_PREFIX + k: c.view(self.nr_episodes) for k, c in self._episode_columns.items()})
+        arrays[_OFFSETS_KEY] = self.episode_offsets
+        return arrays
+
+    def dump(self, filename, compressed=False):
+        """
+        Save the store. If the filename ends with `.npz`, all fields are saved into a single npz file; otherwise,
+        `filename` is treated as a directory, and each field is saved as an individual `.npy` file, which can be
+        memory-mapped when loading. Object fields are pickled.
+        """
+        arrays = self._as_arrays()
+        if filename.endswith('.npz'):
+            (np.savez_compressed if compressed else np.savez)(filename, **arrays)
+        else:
+            os.makedirs(filename, exist_ok=True)
+            for k, v in arrays.items():
+                np.save(osp.join(filename, k + '.npy'), v, allow_pickle=True)
+        return filename
+
+    @classmethod
+    def load(cls, filename, mmap=False):
+        """
+        Load a store saved by `dump`. If `mmap` is True and the store is saved as a directory, numeric fields are
+        memory-mapped (read-only) instead of being read into memory.
+        """
+        if filename.endswith('.npz'):
+            with np.load(filename, allow_pickle=True) as f:
+                arrays = {k: f[k] for k in f.files}
+        else:
+            arrays = dict()
+            for fname in sorted(os.listdir(filename)):
+                if fname.endswith('.npy'):
+                    path = osp.join(filename, fname)
+                    try:
+                        arrays[fname[:-4]] = np.load(path, mmap_mode='r' if mmap else None)
+                    except ValueError:  # object arrays can not be memory-mapped.
+                        arrays[fname[:-4]] = np.load(path, allow_pickle=True)
+
+        store = cls()
+        store._offsets = arrays.pop(_OFFSETS_KEY).tolist()
+        store._size = store._offsets[-1]
+        for k, v in arrays.items():
+            if k.startswith(_EPISODE_PREFIX):
+                store._episode_columns[k[len(_EPISODE_PREFIX):]] = _Column.from_array(v)
+            else:
+                store._columns[k] = _Column.from_array(v)
+                store._size = max(store._size, len(v))
+        return store
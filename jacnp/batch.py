@@ -9,26 +9,45 @@
 # Distributed under terms of the MIT license.
 
 import collections
+import collections.abc
 import numpy as np
 
-__all__ = ['batchify', 'unbatchify']
+__all__ = ['batchify', 'pad_batchify', 'unbatchify']
 
 
 def batchify(inputs):
     first = inputs[0]
     if isinstance(first, (tuple, list, collections.UserList)):
         return [batchify([ele[i] for ele in inputs]) for i in range(len(first))]
-    elif isinstance(first, (collections.Mapping, collections.UserDict)):
+    elif isinstance(first, (collections.abc.Mapping, collections.UserDict)):
         return {k: batchify([ele[k] for ele in inputs]) for k in first}
     return np.stack(inputs)
 
 
+def pad_batchify(inputs, pad_value=0):
+    """Similar to :func:`batchify`, but arrays of different shapes are padded to the maximum shape with `pad_value`."""
+    first = inputs[0]
+    if isinstance(first, (tuple, list, collections.UserList)):
+        return [pad_batchify([ele[i] for ele in inputs], pad_value) for i in range(len(first))]
+    elif isinstance(first, (collections.abc.Mapping, collections.UserDict)):
+        return {k: pad_batchify([ele[k] for ele in inputs], pad_value) for k in first}
+
+    inputs = [np.asarray(x) for x in inputs]
+    shape = np.max([x.shape for x in inputs], axis=0) if inputs[0].ndim > 0 else ()
+    if all(x.shape == tuple(shape) for x in inputs):
+        return np.stack(inputs)
+    output = np.full((len(inputs), ) + tuple(shape), pad_value, dtype=np.result_type(*inputs))
+    for i, x in enumerate(inputs):
+        output[(i, ) + tuple(slice(0, s) for s in x.shape)] = x
+    return output
+
+
 def unbatchify(inputs):
     if isinstance(inputs, (tuple, list, collections.UserList)):
         outputs = [unbatchify(e) for e in inputs]
         return list(map(list, zip(*outputs)))
-    elif isinstance(inputs, (collections.Mapping, collections.UserDict)):
+    elif isinstance(inputs, (collections.abc.Mapping, collections.UserDict)):
         outputs = {k: unbatchify(v) for k, v in inputs.items()}
-        first = outputs[0]
+        first = next(iter(outputs.values()))
         return [{k: outputs[k][i] for k in inputs} for i in range(len(first))]
     return list(inputs)
@@ -9,6 +9,7 @@
 # Distributed under terms of the MIT license.
 
 import collections
+import collections.abc
 
 import torch
 
@@ -22,7 +23,7 @@ def async_copy_to(obj, dev, main_stream=None):
         if main_stream is not None:
             v.record_stream(main_stream)
         return v
-    elif isinstance(obj, collections.Mapping):
+    elif isinstance(obj, collections.abc.Mapping):
         return {k: async_copy_to(o, dev, main_stream) for k, o in obj.items()}
     elif isinstance(obj, (tuple, list, collections.UserList)):
         return [async_copy_to(o, dev, main_stream) for o in obj]
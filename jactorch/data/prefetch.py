@@ -0,0 +1,234 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : prefetch.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+"""
+Prefetch batches in a background thread, so that loading, preprocessing, pinning and host-to-device copies of the
+next batches overlap with the current training step.
+"""
+
+import sys
+import time
+import queue
+import threading
+import collections
+
+import torch
+
+__all__ = ['BatchPrefetcher']
+
+_END = object()
+
+
+class _ExceptionWrapper(object):
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+    def reraise(self):
+        raise self.exc_info[1].with_traceback(self.exc_info[2])
+
+
+def _map_tensors(func, batch):
+    """Apply `func` to all tensors in a nested batch, preserving the types of the containers (e.g., namedtuples)."""
+    if torch.is_tensor(batch):
+        return func(batch)
+    if isinstance(batch, (str, bytes)):
+        return batch
+    if isinstance(batch, tuple) and hasattr(batch, '_fields'):
+        return type(batch)(*[_map_tensors(func, x) for x in batch])
+    if isinstance(batch, (tuple, list)):
+        values = [_map_tensors(func, x) for x in batch]
+        try:
+            return type(batch)(values)
+        except TypeError:
+            return values
+    if isinstance(batch, collections.abc.Mapping):
+        values = {k: _map_tensors(func, v) for k, v in batch.items()}
+        try:
+            return type(batch)(values)
+        except TypeError:
+            return values
+    return batch
+
+
+def _pin_memory(batch):
+    return _map_tensors(lambda x: x.pin_memory(), batch)
+
+
+def _record_stream(x, stream):
+    if x.is_cuda:
+        x.record_stream(stream)
+    return x
+
+
+class BatchPrefetcher(object):
+    """
+    Wrap an iterable of batches (e.g., a data loader), and keep `nr_prefetch` batches staged ahead in a background
+    thread. For each batch, the background thread applies the transforms, pins the memory, and (if a CUDA device is
+    given) copies the batch to the device on a side stream. Without CUDA, the staging only consists of the transforms
+    (and the conversions done by them).
+
+    The time the main thread waits for the batches (the stall time) is recorded, see :meth:`get_stat`.
+
+    Example:
+        >>> prefetcher = BatchPrefetcher(train_dataloader, nr_prefetch=2, device=0)
+        >>> for feed_dict in prefetcher:
+        >>>     trainer.step(feed_dict)
+        >>> print(prefetcher.get_stat())
+    """
+
+    def __init__(self, iterable, nr_prefetch=2, transforms=None, pin_memory=None, device=None):
+        """
+        Args:
+            iterable: the iterable of batches.
+            nr_prefetch (int): the number of batches staged ahead.
+            transforms (list of callable): the functions applied to each batch, in the background thread.
+            pin_memory (bool): pin the memory of the tensors in the batches. Default to whether a CUDA device is given.
+            device (int or torch.device): the CUDA device to copy the batches to. If None, the batches stay on the host.
+        """
+        assert nr_prefetch >= 1
+        self.iterable = iterable
+        self.nr_prefetch = nr_prefetch
+        self.transforms = list(transforms) if transforms is not None else []
+        self.device = torch.device('cuda', device) if isinstance(device, int) else device
+        if self.device is not None:
+            self.device = torch.device(self.device)
+            assert self.device.type == 'cuda', 'BatchPrefetcher only supports copying the batches to CUDA devices.'
+        self.pin_memory = pin_memory if pin_memory is not None else self.device is not None
+
+        self._thread = None
+        self._queue = None
+        self._stop_event = None
+        self._stat_lock = threading.Lock()
+        self.reset_stat()
+
+    def __len__(self):
+        return len(self.iterable)
+
+    def reset_stat(self):
+        with self._stat_lock:
+            self._stat = dict(nr_batches=0, nr_stalls=0, stall_time=0., last_stall_time=0., produce_time=0.)
+
+    def get_stat(self):
+        """
+        Returns:
+            dict: the statistics since the last reset: `nr_batches`, the number of batches consumed; `stall_time`, the
+            total time the main thread waited for the batches; `nr_stalls`, the number of batches that were not ready
+            when requested; `last_stall_time`, the waiting time of the last batch; and `produce_time`, the total time
+            spent by the background thread on loading and staging the batches.
+        """
+        with self._stat_lock:
+            return self._stat.copy()
+
+    def __iter__(self):
+        self.close()
+        self._queue = queue.Queue(maxsize=self.nr_prefetch)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._worker, args=(iter(self.iterable), self._queue, self._stop_event), daemon=True)
+        self._thread.start()
+        return self._consume(self._queue, self._thread)
+
+    def _stage(self, batch, stream):
+        for t in self.transforms:
+            batch = t(batch)
+        if self.pin_memory:
+            batch = _pin_memory(batch)
+        if self.device is not None:
+            with torch.cuda.stream(stream):
+                batch = _map_tensors(lambda x: x.to(self.device, non_blocking=True), batch)
+            event = torch.cuda.Event()
+            event.record(stream)
+            return batch, event
+        return batch, None
+
+    def _worker(self, iterator, output_queue, stop_event):
+        try:
+            stream = torch.cuda.Stream(self.device) if self.device is not None else None
+            while not stop_event.is_set():
+                start = time.time()
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    break
+                item = self._stage(batch, stream)
+                with self._stat_lock:
+                    self._stat['produce_time'] += time.time() - start
+                if not self._put(output_queue, item, stop_event):
+                    return
+        except BaseException:
+            self._put(output_queue, _ExceptionWrapper(sys.exc_info()), stop_event)
+            return
+        self._put(output_queue, _END, stop_event)
+
+    @staticmethod
+    def _put(output_queue, item, stop_event):
+        while not stop_event.is_set():
+            try:
+                output_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _consume(self, input_queue, thread):
+        while True:
+            start = time.time()
+            stalled = input_queue.empty()
+            item = self._get(input_queue, thread)
+            stall_time = time.time() - start
+            if item is _END:
+                return
+            if isinstance(item, _ExceptionWrapper):
+                item.reraise()
+
+            batch, event = item
+            if event is not None:
+                current_stream = torch.cuda.current_stream(self.device)
+                current_stream.wait_event(event)
+                # The tensors were allocated on the side stream; make sure that they are not reused while in use.
+                _map_tensors(lambda x: _record_stream(x, current_stream), batch)
+
+            with self._stat_lock:
+                self._stat['nr_batches'] += 1
+                self._stat['nr_stalls'] += int(stalled)
+                self._stat['stall_time'] += stall_time
+                self._stat['last_stall_time'] = stall_time
+            yield batch
+
+    @staticmethod
+    def _get(input_queue, thread):
+        while True:
+            try:
+                return input_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            if not thread.is_alive():
+                # The worker may have put the last item right before exiting.
+                try:
+                    return input_queue.get_nowait()
+                except queue.Empty:
+                    raise RuntimeError('The prefetching thread exited unexpectedly.') from None
+
+    def close(self):
+        """Stop the background thread. An iterator still consuming the batches stops at its next step."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            # Replace the staged batches with the end signal, so that the consumer does not wait for more batches.
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._queue.put(_END)
+            self._thread = None
+            self._queue = None
+
+    def __del__(self):
+        self.close()
@@ -18,5 +18,6 @@ from .mask import *
 from .meshgrid import *
 from .probability import *
 from .quantization import *
+from .rl import *
 from .sample import *
 from .shape import *
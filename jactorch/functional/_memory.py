@@ -0,0 +1,16 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : _memory.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+"""Shared settings of the functions that compute their results in chunks, e.g., the log-linear and pairwise kernels."""
+
+__all__ = ['DEFAULT_MEMORY_BUDGET']
+
+# The default memory budget (in bytes) of the intermediate results of the chunked kernels.
+DEFAULT_MEMORY_BUDGET = 64 * 1024 ** 2
@@ -8,16 +8,105 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
-"""Useful utilities for kernel-based attention mechanism."""
+"""
+Useful utilities for kernel-based attention mechanism.
+
+All kernels take the features of the lookup keys (`[n, k]` or `[b, n, k]`) and of the value keys (`[m, k]` or
+`[b, m, k]`), and return the `[n, m]` (or `[b, n, m]`) kernel matrix. The distances are computed with
+:func:`torch.cdist` (or the `|a|^2 + |b|^2 - 2ab` matmul trick), so that no `[n, m, k]` tensor is materialized. The
+lookup keys are processed in chunks of rows, so that the intermediate results fit in a memory budget.
+"""
 
 import torch
 
+from jacinle.utils.enum import JacEnum
+
+from ._memory import DEFAULT_MEMORY_BUDGET
 from .linalg import normalize
 
-__all__ = ['inverse_distance', 'cosine_distance', 'dot']
+__all__ = ['PairwiseKernelType', 'pairwise_kernel', 'inverse_distance', 'cosine_distance', 'dot', 'lp_distance', 'rbf_kernel']
+
+# The number of [rows, m] intermediate tensors allocated by a kernel.
+_NR_INTERMEDIATES = 3
+
+
+class PairwiseKernelType(JacEnum):
+    DOT = 'dot'
+    COSINE = 'cosine'
+    DISTANCE = 'distance'
+    INVERSE_DISTANCE = 'inverse_distance'
+    RBF = 'rbf'
+
+
+def _dot(f_lookup, f):
+    return torch.bmm(f_lookup, f.transpose(1, 2))
+
+
+def _distance(f_lookup, f, p=2):
+    return torch.cdist(f_lookup, f, p=p)
+
+
+def _inverse_distance(f_lookup, f, p=2, eps=1e-8):
+    return 1. / torch.cdist(f_lookup, f, p=p).clamp(min=eps)
+
+
+def _rbf(f_lookup, f, gamma=None):
+    if gamma is None:
+        gamma = 1. / f.size(-1)
+    sqr_norm = (f_lookup * f_lookup).sum(dim=-1, keepdim=True) + (f * f).sum(dim=-1).unsqueeze(1)
+    sqr_dist = torch.baddbmm(sqr_norm, f_lookup, f.transpose(1, 2), alpha=-2).clamp(min=0)
+    return torch.exp(-gamma * sqr_dist)
+
 
+_KERNELS = {
+    PairwiseKernelType.DOT: _dot,
+    PairwiseKernelType.COSINE: _dot,
+    PairwiseKernelType.DISTANCE: _distance,
+    PairwiseKernelType.INVERSE_DISTANCE: _inverse_distance,
+    PairwiseKernelType.RBF: _rbf
+}
 
-def inverse_distance(f_lookup, f, p=2, eps=1e-8):
+
+def pairwise_kernel(f_lookup, f, kernel='dot', memory_budget=None, **kwargs):
+    """
+    Compute a kernel between each pair of the lookup keys and the value keys.
+
+    Args:
+        f_lookup (FloatTensor): features of the lookup keys, of shape `[n, k]` or `[b, n, k]`.
+        f (FloatTensor): features of the value keys, of shape `[m, k]` or `[b, m, k]`.
+        kernel (str): the kernel, one of `dot`, `cosine`, `distance` (the p-norm distance, with the argument `p`),
+            `inverse_distance` (with the arguments `p` and `eps`) and `rbf` (`exp(-gamma * |a - b|^2)`, with the argument
+            `gamma`, default to `1 / k`).
+        memory_budget (int): the memory budget (in bytes) of the intermediate results.
+
+    Returns (FloatTensor): the kernel matrix, of shape `[n, m]` or `[b, n, m]`.
+    """
+    kernel = PairwiseKernelType.from_string(kernel)
+
+    batched = f_lookup.dim() == 3
+    if not batched:
+        f_lookup, f = f_lookup.unsqueeze(0), f.unsqueeze(0)
+    assert f_lookup.dim() == 3 and f.dim() == 3 and f_lookup.size(-1) == f.size(-1)
+
+    if kernel is PairwiseKernelType.COSINE:
+        f_lookup, f = normalize(f_lookup, 2, dim=-1), normalize(f, 2, dim=-1)
+
+    func = _KERNELS[kernel]
+    b, n, m = f_lookup.size(0), f_lookup.size(1), f.size(1)
+    memory_budget = memory_budget or DEFAULT_MEMORY_BUDGET
+    rows = max(1, memory_budget // (b * m * f_lookup.element_size() * _NR_INTERMEDIATES))
+
+    if rows >= n:
+        out = func(f_lookup, f, **kwargs)
+    else:
+        out = torch.cat([func(f_lookup[:, i:i + rows], f, **kwargs) for i in range(0, n, rows)], dim=1)
+
+    if not batched:
+        out = out.squeeze(0)
+    return out
+
+
+def inverse_distance(f_lookup, f, p=2, eps=1e-8, memory_budget=None):
     """
     Inverse distance kernel.
 
@@ -27,22 +116,20 @@ def inverse_distance(f_lookup, f, p=2, eps=1e-8):
 
     Returns (FloatTensor): the attention mask for each lookup keys.
     """
+    return pairwise_kernel(f_lookup, f, 'inverse_distance', memory_budget=memory_budget, p=p, eps=eps)
+
 
-    n, m, k = f_lookup.size(0), f.size(0), f.size(1)
-    f_lookup = f_lookup.view(n, 1, k).expand(n, m, k)
-    f = f.view(1, m, k).expand(n, m, k)
+def cosine_distance(f_lookup, f, memory_budget=None):
+    return pairwise_kernel(f_lookup, f, 'cosine', memory_budget=memory_budget)
 
-    # TODO(Jiayuan Mao @ 05/26): this function can be optimized.
-    dist = (f_lookup - f).norm(p, dim=2)
-    return 1. / dist.clamp(min=eps)
 
+def dot(f_lookup, f, memory_budget=None):
+    return pairwise_kernel(f_lookup, f, 'dot', memory_budget=memory_budget)
 
-def cosine_distance(f_lookup, f):
-    f_lookup = normalize(f_lookup, 2, dim=1)
-    f = normalize(f, 2, dim=1)
 
-    return torch.mm(f_lookup, f.t())
+def lp_distance(f_lookup, f, p=2, memory_budget=None):
+    return pairwise_kernel(f_lookup, f, 'distance', memory_budget=memory_budget, p=p)
 
 
-def dot(f_lookup, f):
-    return torch.mm(f_lookup, f.t())
+def rbf_kernel(f_lookup, f, gamma=None, memory_budget=None):
+    return pairwise_kernel(f_lookup, f, 'rbf', memory_budget=memory_budget, gamma=gamma)
@@ -8,8 +8,10 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
+import time
 import torch
 
+from ._memory import DEFAULT_MEMORY_BUDGET
 from .shape import concat_shape, move_dim
 
 __all__ = ['logaddexp', 'logsumexp', 'logmatmulexp', 'batch_logmatmulexp', 'logits_and', 'logits_or']
@@ -28,14 +30,31 @@ def logsumexp(inputs, dim=-1, keepdim=False):
     # return (inputs - F.log_softmax(inputs, dim=dim)).mean(dim, keepdim=keepdim)
 
 
-def logmatmulexp(mat1, mat2, use_mm=False):
+def logmatmulexp(mat1, mat2, use_mm=False, memory_budget=None):
+    """
+    Compute `log(exp(mat1) @ exp(mat2))` in a numerically stable way. The last dimension of `mat1` is contracted with
+    the first dimension of `mat2`.
+
+    Args:
+        mat1 (Tensor): of shape `[..., k]`.
+        mat2 (Tensor): of shape `[k, ...]`.
+        use_mm (bool): use a matrix multiplication of the max-shifted exponentials. It is faster, but underflows
+            when the entries of a row (column) span a large range.
+        memory_budget (int): the memory budget (in bytes) of the intermediate results. The contraction is computed
+            in chunks so that the `[n, k, m]` intermediate is never materialized, in both forward and backward.
+            The backward is differentiable, so higher-order gradients are supported.
+
+    Returns:
+        Tensor: of shape `[..., ...]`.
+    """
     mat1_shape = mat1.size()
     mat2_shape = mat2.size()
-    mat1 = mat1.contiguous().view(-1, mat1_shape[-1])
-    mat2 = move_dim(mat2, 0, -1)
-    mat2 = mat2.contiguous().view(-1, mat2_shape[0])
 
     if use_mm:
+        mat1 = mat1.contiguous().view(-1, mat1_shape[-1])
+        mat2 = move_dim(mat2, 0, -1)
+        mat2 = mat2.contiguous().view(-1, mat2_shape[0])
+
         mat1_max = mat1.max(dim=-1, keepdim=True)[0]
         mat2_max = mat2.max(dim=-1, keepdim=True)[0]
         mat1 = mat1 - mat1_max
@@ -44,20 +63,25 @@ def logmatmulexp(mat1, mat2, use_mm=False):
         out = _safe_log(torch.matmul(mat1.exp(), mat2.exp().t()))
         out = out + mat1_max + mat2_max.t()
     else:
-        out_sum = mat1.unsqueeze(1) + mat2.unsqueeze(0)
-        out = logsumexp(out_sum, dim=-1)
+        mat1 = mat1.contiguous().view(1, -1, mat1_shape[-1])
+        mat2 = mat2.contiguous().view(1, mat2_shape[0], -1)
+        out = _ChunkedLogMatMulExp.apply(mat1, mat2, memory_budget or DEFAULT_MEMORY_BUDGET)
 
     return out.view(concat_shape(mat1_shape[:-1], mat2_shape[1:]))
 
 
-def batch_logmatmulexp(mat1, mat2, use_mm=False):
+def batch_logmatmulexp(mat1, mat2, use_mm=False, memory_budget=None):
+    """
+    The batched version of :func:`logmatmulexp`. `mat1` is of shape `[b, ..., k]` and `mat2` is of shape `[b, k, ...]`.
+    """
     mat1_shape = mat1.size()
     mat2_shape = mat2.size()
-    mat1 = mat1.contiguous().view(mat1_shape[0], -1, mat1_shape[-1])
-    mat2 = move_dim(mat2, 1, -1)
-    mat2 = mat2.contiguous().view(mat2_shape[0], -1, mat2_shape[1])
 
     if use_mm:
+        mat1 = mat1.contiguous().view(mat1_shape[0], -1, mat1_shape[-1])
+        mat2 = move_dim(mat2, 1, -1)
+        mat2 = mat2.contiguous().view(mat2_shape[0], -1, mat2_shape[1])
+
         mat1_max = mat1.max(dim=-1, keepdim=True)[0]
         mat2_max = mat2.max(dim=-1, keepdim=True)[0]
         mat1 = mat1 - mat1_max
@@ -66,12 +90,123 @@ def batch_logmatmulexp(mat1, mat2, use_mm=False):
         out = _safe_log(torch.bmm(mat1.exp(), mat2.exp().permute(0, 2, 1)))
         out = out + mat1_max + mat2_max.permute(0, 2, 1)
     else:
-        out_sum = mat1.unsqueeze(2) + mat2.unsqueeze(1)
-        out = logsumexp(out_sum, dim=-1)
+        mat1 = mat1.contiguous().view(mat1_shape[0], -1, mat1_shape[-1])
+        mat2 = mat2.contiguous().view(mat2_shape[0], mat2_shape[1], -1)
+        out = _ChunkedLogMatMulExp.apply(mat1, mat2, memory_budget or DEFAULT_MEMORY_BUDGET)
 
     return out.view(concat_shape(mat1_shape[:-1], mat2_shape[2:]))
 
 
+def _get_chunk_sizes(b, n, k, m, element_size, memory_budget):
+    """The number of rows and the size of the contraction chunk such that a `[b, rows, chunk, m]` tensor fits in the budget."""
+    row_size = b * m * element_size
+    rows = min(n, max(1, memory_budget // row_size))
+    chunk = min(k, max(1, memory_budget // (row_size * rows)))
+    return rows, chunk
+
+
+def _chunked_logmatmulexp_forward(mat1, mat2, memory_budget):
+    """The forward of the chunked kernel, with `mat1` of shape `[b, n, k]` and `mat2` of shape `[b, k, m]`."""
+    b, n, k = mat1.size()
+    m = mat2.size(2)
+    rows, chunk = _get_chunk_sizes(b, n, k, m, mat1.element_size(), memory_budget)
+
+    out = mat1.new_empty((b, n, m))
+    for i in range(0, n, rows):
+        mat1_rows = mat1[:, i:i + rows]
+        # Online logsumexp: acc is the sum of exp(x - shift) over the chunks so far, where shift is the running max
+        # (or 0 if the running max is -inf); acc is rescaled whenever the running max increases.
+        running_max, shift, acc = None, None, None
+        for j in range(0, k, chunk):
+            s = mat1_rows[:, :, j:j + chunk, None] + mat2[:, None, j:j + chunk, :]
+            chunk_max = s.max(dim=2)[0]
+            running_max = chunk_max if running_max is None else torch.max(running_max, chunk_max)
+            new_shift = running_max.masked_fill(torch.isinf(running_max), 0)
+            chunk_sum = s.sub_(new_shift.unsqueeze(2)).exp_().sum(dim=2)
+            if acc is None:
+                acc = chunk_sum
+            else:
+                acc = acc.mul_((shift - new_shift).exp_()).add_(chunk_sum)
+            shift = new_shift
+        out[:, i:i + rows] = acc.log_().add_(shift)
+    return out
+
+
+def _chunked_logmatmulexp_backward(mat1, mat2, out, grad_output, memory_budget, needs_input_grad):
+    """
+    The backward of the chunked kernel. The gradient of `out[i, j]` w.r.t. `mat1[i, t]` and `mat2[t, j]` is
+    `exp(mat1[i, t] + mat2[t, j] - out[i, j])`, which is recomputed chunk by chunk. When the grad mode is enabled
+    (i.e., the backward is run with `create_graph=True`), it is computed with out-of-place ops so that it can be
+    differentiated again.
+    """
+    b, n, k = mat1.size()
+    m = mat2.size(2)
+    rows, chunk = _get_chunk_sizes(b, n, k, m, mat1.element_size(), memory_budget)
+
+    differentiable = torch.is_grad_enabled()
+    out = out.masked_fill(torch.isinf(out), 0)
+    grad1 = torch.zeros_like(mat1) if needs_input_grad[0] else None
+    grad2 = torch.zeros_like(mat2) if needs_input_grad[1] else None
+    for i in range(0, n, rows):
+        out_rows = out[:, i:i + rows, None, :]
+        grad_rows = grad_output[:, i:i + rows, None, :]
+        for j in range(0, k, chunk):
+            p = mat1[:, i:i + rows, j:j + chunk, None] + mat2[:, None, j:j + chunk, :]
+            if differentiable:
+                p = (p - out_rows).exp() * grad_rows
+            else:
+                p = p.sub_(out_rows).exp_().mul_(grad_rows)
+            if grad1 is not None:
+                grad1[:, i:i + rows, j:j + chunk] = p.sum(dim=3)
+            if grad2 is not None:
+                grad2[:, j:j + chunk] += p.sum(dim=1)
+    return grad1, grad2
+
+
+class _ChunkedLogMatMulExp(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, mat1, mat2, memory_budget):
+        out = _chunked_logmatmulexp_forward(mat1, mat2, memory_budget)
+        ctx.save_for_backward(mat1, mat2, out)
+        ctx.memory_budget = memory_budget
+        return out
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        mat1, mat2, out = ctx.saved_tensors
+        grad1, grad2 = _chunked_logmatmulexp_backward(
+            mat1, mat2, out, grad_output.contiguous(), ctx.memory_budget, ctx.needs_input_grad[:2]
+        )
+        return grad1, grad2, None
+
+
+def benchmark_logmatmulexp(n=256, k=256, m=256, memory_budget=None, nr_iters=5, device='cpu'):
+    """
+    Compare the chunked :func:`logmatmulexp` with the broadcasting implementation, which materializes the full
+    `[n, k, m]` intermediate, in forward and backward.
+
+    Returns:
+        dict: the time per iteration (in seconds) of both implementations, with keys `broadcast` and `chunked`.
+    """
+    mat1 = torch.randn(n, k, device=device, requires_grad=True)
+    mat2 = torch.randn(k, m, device=device, requires_grad=True)
+
+    def broadcast():
+        logsumexp(mat1.unsqueeze(1) + mat2.t().unsqueeze(0), dim=-1).sum().backward()
+
+    def chunked():
+        logmatmulexp(mat1, mat2, memory_budget=memory_budget).sum().backward()
+
+    results = dict()
+    for name, func in [('broadcast', broadcast), ('chunked', chunked)]:
+        func()
+        start = time.time()
+        for i in range(nr_iters):
+            func()
+        results[name] = (time.time() - start) / nr_iters
+    return results
+
+
 def logits_and(x, y):
     t = (x + y) / 2
     f = logaddexp(logaddexp((x - y) / 2, (y - x) / 2), -t)
@@ -8,12 +8,16 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
+import functools
+
 import torch
-import numpy as np
 
 from .shape import add_dim_as_except
 
-__all__ = ['mask_meshgrid', 'masked_average', 'length2mask', 'length_masked_reversed'] 
+__all__ = [
+    'mask_meshgrid', 'masked_average', 'length2mask', 'cached_length2mask',
+    'length_masked_reversed', 'length_masked_shift', 'length_masked_roll', 'length_masked_gather_last', 'length_masked_scatter_last'
+]
 
 
 def mask_meshgrid(mask, target_dims=2):
@@ -40,6 +44,60 @@ def length2mask(lengths, max_length):
     return mask.float()
 
 
+@functools.lru_cache(maxsize=64)
+def _cached_length2mask(lengths, max_length, device):
+    return length2mask(torch.tensor(lengths, dtype=torch.long, device=device), max_length)
+
+
+def cached_length2mask(lengths, max_length, device=None):
+    """
+    A cached version of :func:`length2mask`, keyed by (lengths, max_length, device). This is useful when the same
+    batch of lengths is used multiple times (e.g., in each layer of a model). The returned mask is shared by the
+    callers, so do not modify it in place.
+
+    The cache is keyed on the values of the lengths, so they must be on the host (a list, a tuple, or a CPU tensor):
+    reading a CUDA tensor would force a device synchronization on every call. Use :func:`length2mask` for lengths that
+    are on a GPU.
+
+    Args:
+        lengths (list or torch.LongTensor): the lengths of the sequences, on the host.
+        max_length (int): the maximum length.
+        device (torch.device): the device of the mask, default to the CPU.
+    """
+    if torch.is_tensor(lengths):
+        if lengths.device.type != 'cpu':
+            raise ValueError('cached_length2mask requires the lengths on the host; use length2mask instead.')
+        lengths = lengths.tolist()
+    return _cached_length2mask(tuple(lengths), max_length, str(torch.device(device or 'cpu')))
+
+
+def _length_index(tensor, lengths, dim):
+    """Returns the position index `[B, T]` (along the `dim` dimension of `tensor`) and the lengths `[B, 1]`."""
+    if tensor.size(0) != len(lengths):
+        raise ValueError('tensor incompatible with lengths.')
+    if not torch.is_tensor(lengths):
+        lengths = torch.tensor(lengths)
+    lengths = lengths.to(device=tensor.device, dtype=torch.long).unsqueeze(-1)
+    rng = torch.arange(tensor.size(dim), dtype=torch.long, device=tensor.device).unsqueeze(0)
+    return rng, lengths
+
+
+def _expand_index(index, tensor, dim):
+    """Expand the `[B, T]` index to the shape of `tensor`, where T is along the `dim` dimension."""
+    shape = [1] * tensor.dim()
+    shape[0], shape[dim] = index.size(0), index.size(1)
+    target_shape = list(tensor.size())
+    target_shape[dim] = index.size(1)
+    return index.view(shape).expand(target_shape)
+
+
+def _gather_with_index(tensor, index, dim, valid=None, fill=0):
+    output = torch.gather(tensor, dim, _expand_index(index, tensor, dim))
+    if valid is not None:
+        output = output.masked_fill(~_expand_index(valid, tensor, dim), fill)
+    return output
+
+
 def length_masked_reversed(tensor, lengths, dim=1):
     """Reverses sequences according to their lengths.
 
@@ -51,16 +109,52 @@ def length_masked_reversed(tensor, lengths, dim=1):
         A Variable with the same size as tensor, but with each sequence
         reversed according to its length.
     """
+    rng, lengths = _length_index(tensor, lengths, dim)
+    index = torch.where(rng < lengths, lengths - 1 - rng, rng)
+    return _gather_with_index(tensor, index, dim)
 
-    assert dim == 1
 
-    if tensor.size(0) != len(lengths):
-        raise ValueError('tensor incompatible with lengths.')
-    reversed_indices = np.repeat(np.arange(tensor.size(1))[np.newaxis], inputs.size(0), 0)
-    for i, length in enumerate(lengths.cpu().numpy().tolist()):
-        if length > 0:
-            reversed_indices[i, :length] = reversed_indices[i, length-1::-1]
-    reversed_indices = torch.tensor(reversed_indices, dtype=torch.long, device=tensor.device)
-    reversed_inputs = torch.gather(tensor, dim, reversed_indices)
-    return reversed_inputs
+def length_masked_shift(tensor, lengths, shift, dim=1, fill=0):
+    """Shifts sequences by `shift` steps (forward if positive) within their lengths. The vacated positions
+    (and the paddings) are filled with `fill`.
+
+    Args:
+        tensor (torch.Tensor): padded batch of variable length sequences.
+        lengths (torch.LongTensor): list of sequence lengths
+        shift (int): the number of steps.
+        fill (float): the value of the vacated positions.
+    """
+    rng, lengths = _length_index(tensor, lengths, dim)
+    source = rng - shift
+    valid = (source >= 0) & (source < lengths) & (rng < lengths)
+    index = torch.where(valid, source, rng)
+    return _gather_with_index(tensor, index, dim, valid, fill)
+
+
+def length_masked_roll(tensor, lengths, shift, dim=1):
+    """Rolls sequences by `shift` steps (forward if positive) within their lengths. The paddings are unchanged.
+
+    Args:
+        tensor (torch.Tensor): padded batch of variable length sequences.
+        lengths (torch.LongTensor): list of sequence lengths
+        shift (int): the number of steps.
+    """
+    rng, lengths = _length_index(tensor, lengths, dim)
+    index = torch.where(rng < lengths, torch.remainder(rng - shift, lengths.clamp(min=1)), rng)
+    return _gather_with_index(tensor, index, dim)
+
+
+def length_masked_gather_last(tensor, lengths, dim=1):
+    """Gathers the last valid element of each sequence. The result has the `dim` dimension removed. For empty
+    sequences, the first element is returned."""
+    _, lengths = _length_index(tensor, lengths, dim)
+    index = (lengths - 1).clamp(min=0)
+    return _gather_with_index(tensor, index, dim).squeeze(dim)
+
 
+def length_masked_scatter_last(tensor, lengths, values, dim=1):
+    """Returns a copy of `tensor` with the last valid element of each sequence replaced by `values` (which has the
+    shape of `tensor` with the `dim` dimension removed). Empty sequences are unchanged."""
+    rng, lengths = _length_index(tensor, lengths, dim)
+    is_last = _expand_index(rng == lengths - 1, tensor, dim)
+    return torch.where(is_last, values.unsqueeze(dim).expand_as(tensor), tensor)
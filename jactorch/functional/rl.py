@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : rl.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+"""
+Batched discounted return and GAE kernels. See `jaclearn.rl.algo.math` for the NumPy version.
+All inputs are padded tensors of shape `[batch, time]`.
+"""
+
+import torch
+
+__all__ = ['batch_discount_cumsum', 'batch_compute_gae']
+
+
+def _discounted_scan(x, coeffs):
+    # y[:, t] = x[:, t] + coeffs[:, t] * y[:, t + 1], y[:, T] = 0.
+    outputs = []
+    acc = torch.zeros_like(x[:, 0])
+    for t in range(x.size(1) - 1, -1, -1):
+        acc = x[:, t] + coeffs[:, t] * acc
+        outputs.append(acc)
+    outputs.reverse()
+    return torch.stack(outputs, dim=1)
+
+
+def _prepare(rewards, dones, lengths):
+    nonterminal = torch.ones_like(rewards)
+    if dones is not None:
+        nonterminal = 1 - dones.type_as(rewards)
+    mask = None
+    if lengths is not None:
+        mask = (torch.arange(rewards.size(1), device=rewards.device).unsqueeze(0) < lengths.unsqueeze(1)).type_as(rewards)
+        rewards = rewards * mask
+    return rewards, nonterminal, mask
+
+
+def _last_indices(rewards, lengths):
+    if lengths is None:
+        return torch.full((rewards.size(0), ), rewards.size(1) - 1, dtype=torch.long, device=rewards.device)
+    return (lengths.long() - 1).clamp(min=0)
+
+
+def batch_discount_cumsum(rewards, gamma, dones=None, next_values=None, lengths=None):
+    """
+    Compute the discounted returns of a batch of trajectories.
+
+    Args:
+        rewards (Tensor): the rewards, of shape `[batch, time]`.
+        gamma (float): the discount factor.
+        dones (Tensor): optional, `dones[b, t]` indicates that an episode terminates after step `t`.
+        next_values (Tensor): optional, of shape `[batch]`. The value used to bootstrap after the last step.
+        lengths (Tensor): optional, of shape `[batch]`. The lengths of the trajectories, if the inputs are padded.
+
+    Returns:
+        Tensor: the discounted returns, of shape `[batch, time]`.
+    """
+    rewards, nonterminal, mask = _prepare(rewards, dones, lengths)
+    if next_values is not None:
+        last = _last_indices(rewards, lengths).unsqueeze(1)
+        bootstrap = gamma * next_values.type_as(rewards).unsqueeze(1) * nonterminal.gather(1, last)
+        rewards = rewards.scatter_add(1, last, bootstrap)
+    return _discounted_scan(rewards, gamma * nonterminal)
+
+
+def batch_compute_gae(rewards, values, gamma, lambda_, dones=None, next_values=None, lengths=None):
+    """
+    Compute the generalized advantage estimation (GAE) of a batch of trajectories.
+
+    Args:
+        rewards (Tensor): the rewards, of shape `[batch, time]`.
+        values (Tensor): the value estimations, of shape `[batch, time]`.
+        gamma (float): the discount factor.
+        lambda_ (float): the GAE parameter.
+        dones (Tensor): optional, `dones[b, t]` indicates that an episode terminates after step `t`.
+        next_values (Tensor): optional, of shape `[batch]`. The value estimation after the last step (default: 0).
+        lengths (Tensor): optional, of shape `[batch]`. The lengths of the trajectories, if the inputs are padded.
+
+    Returns:
+        Tensor: the advantages, of shape `[batch, time]`.
+    """
+    rewards, nonterminal, mask = _prepare(rewards, dones, lengths)
+    last = _last_indices(rewards, lengths).unsqueeze(1)
+
+    next_vals = torch.cat([values[:, 1:], torch.zeros_like(values[:, :1])], dim=1)
+    if next_values is None:
+        bootstrap = torch.zeros_like(values[:, :1])
+    else:
+        bootstrap = next_values.type_as(values).unsqueeze(1)
+    next_vals = next_vals.scatter(1, last, bootstrap) * nonterminal
+
+    deltas = rewards + gamma * next_vals - values
+    if mask is not None:
+        deltas = deltas * mask
+    return _discounted_scan(deltas, gamma * lambda_ * nonterminal)
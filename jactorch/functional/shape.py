@@ -8,7 +8,7 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
-import collections
+import collections.abc
 import torch
 
 __all__ = ['flatten', 'flatten2', 'concat_shape', 'broadcast', 'add_dim', 'add_dim_as_except', 'repeat', 'repeat_times', 'force_view']
@@ -25,7 +25,7 @@ def flatten2(tensor):
 def concat_shape(*shapes):
     output = []
     for s in shapes:
-        if isinstance(s, collections.Sequence):
+        if isinstance(s, collections.abc.Sequence):
             output.extend(s)
         else:
             output.append(int(s))
@@ -55,6 +55,8 @@ def add_dim_as_except(tensor, target, *excepts):
 
 
 def move_dim(tensor, dim, dest):
+    if dest < 0:
+        dest += tensor.dim()
     dims = list(range(tensor.dim()))
     dims.pop(dim)
     dims.insert(dest, dim)
@@ -25,12 +25,14 @@ def find_parameters(module, pattern, return_names=False):
 def filter_parameters(params, pattern, return_names=False):
     if isinstance(pattern, six.string_types):
         pattern = [pattern]
+    params = list(params)
     matcher = NameMatcher({p: True for p in pattern})
     with matcher:
-        if return_names:
-            return [(name, p) for name, p in params if matcher.match(name)]
-        else:
-            return [p for name, p in params if matcher.match(name)]
+        matched = matcher.match_all([name for name, _ in params])
+    if return_names:
+        return [(name, p) for (name, p), m in zip(params, matched) if m]
+    else:
+        return [p for (name, p), m in zip(params, matched) if m]
 
 
 def exclude_parameters(params, exclude):
@@ -57,16 +59,14 @@ def compose_param_groups(model, *groups, filter_grad=True, verbose=True):
     """
     matcher = NameMatcher([(g[0], i) for i, g in enumerate(groups)])
     param_groups = [{'params': [], 'names': []} for _ in range(len(groups) + 1)]
+    params = [(name, p) for name, p in model.named_parameters() if not filter_grad or p.requires_grad]
     with matcher:
-        for name, p in model.named_parameters():
-            if filter_grad and not p.requires_grad:
-                continue
-
-            res = matcher.match(name)
-            if res is None:
-                res = -1
-            param_groups[res]['names'].append(name)
-            param_groups[res]['params'].append(p)
+        matched = matcher.match_all([name for name, _ in params])
+    for (name, p), res in zip(params, matched):
+        if res is None:
+            res = -1
+        param_groups[res]['names'].append(name)
+        param_groups[res]['params'].append(p)
     for i, g in enumerate(groups):
         param_groups[i].update(g[1])
 
@@ -11,7 +11,7 @@
 import torch
 import torch.nn as nn
 
-from jactorch.nn.rnn_utils import rnn_with_length
+from jactorch.nn.rnn_utils import PackedBatchPlan
 from .normalization import LayerNorm
 
 __all__ = ['ResidualConvBlock', 'ResidualConvBottleneck', 'ResidualLinear', 'ResidualGRU']
@@ -145,16 +145,17 @@ class ResidualGRU(nn.Module):
 
         if initial_states is None:
             batch_size = input.size(1)
-            state_shape = (self.real_num_layers, batch_size, self.hidden_dim)
+            state_shape = (self.real_num_layers, batch_size, self.real_hidden_dim)
             initial_states = torch.zeros(state_shape, device=input.device)
 
+        # The sequences are sorted and packed with the same plan in all layers.
+        plan = PackedBatchPlan(input_lengths, batch_first=False)
+
         f = input
         for i in range(self.num_layers):
             f_input = f
             f_state = initial_states[2*i:2*i+2] if self.bidirectional else initial_states[i:i+1]
-            # TODO(Jiayuan Mao @ 05/08): accelerate this by pre-sort the sequences.
-            f = rnn_with_length(self.rnns[i], f, input_lengths, initial_states=f_state,
-                                batch_first=False, sorted=False)
+            f, _ = plan.run(self.rnns[i], f, initial_states=f_state, total_length=input.size(0))
             if self.layer_norms is not None:
                 f = self.layer_norms[i](f)
             f = f + f_input
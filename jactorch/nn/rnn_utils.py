@@ -8,30 +8,191 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
-from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+import time
 
-from jactorch.functional.indexing import inverse_permutation
+import torch
+from torch.nn.utils.rnn import PackedSequence, pack_padded_sequence, pad_packed_sequence
 
-__all__ = ['rnn_with_length']
+__all__ = ['PackedBatchPlan', 'rnn_with_length']
 
 
-def rnn_with_length(rnn, seq_tensor, seq_lengths, initial_states, batch_first=True, sorted=False):
-    perm_idx = None
-    if not sorted:
-        seq_lengths, perm_idx = seq_lengths.sort(0, descending=True)
-        seq_tensor = seq_tensor[perm_idx]
+class PackedBatchPlan(object):
+    """
+    A packing plan of a batch of padded sequences, computed once from the lengths and reused by any number of RNN
+    modules (e.g., the layers of a stacked encoder).
 
-    packed_input = pack_padded_sequence(seq_tensor, seq_lengths.cpu().numpy(), batch_first=batch_first)
+    The plan holds the sorting permutation (and its inverse), the `batch_sizes` of the packed sequence, and the index
+    of each packed element in the padded tensor. Thus, packing is a single `index_select` from the padded tensor, and
+    unpacking is a single `index_copy` into a zero tensor, both in the original order of the batch. The packed
+    sequences carry the sorting permutation (see :class:`torch.nn.utils.rnn.PackedSequence`), so the RNN modules take
+    the initial states and return the last states in the original order.
+
+    Example:
+        >>> plan = PackedBatchPlan(lengths, batch_first=True)
+        >>> for rnn in rnns:
+        >>>     f, _ = plan.run(rnn, f)
+    """
+
+    def __init__(self, seq_lengths, batch_first=True, sorted=False):
+        """
+        Args:
+            seq_lengths (list or torch.LongTensor): the lengths of the sequences.
+            batch_first (bool): whether the padded tensors are of shape `[B, T, ...]` (otherwise `[T, B, ...]`).
+            sorted (bool): whether the lengths are sorted in descending order. If not given, it is detected from the
+                lengths, in which case no permutation is needed.
+        """
+        lengths = torch.as_tensor(seq_lengths, dtype=torch.long).cpu()
+        self.batch_first = batch_first
+        self.batch_size = lengths.size(0)
+        self.max_length = int(lengths.max()) if self.batch_size > 0 else 0
+
+        if not sorted:
+            sorted = bool((lengths[:-1] >= lengths[1:]).all())
+        if sorted:
+            self.sorted_indices, self.unsorted_indices = None, None
+            sorted_lengths = lengths
+        else:
+            sorted_lengths, self.sorted_indices = lengths.sort(0, descending=True)
+            self.unsorted_indices = torch.empty_like(self.sorted_indices)
+            self.unsorted_indices[self.sorted_indices] = torch.arange(self.batch_size)
+        self.lengths = lengths
+
+        # valid[t, j]: whether the j-th (sorted) sequence has the t-th element. Its nonzero entries (in the row-major
+        # order) are the packed elements.
+        valid = sorted_lengths.unsqueeze(0) > torch.arange(self.max_length).unsqueeze(1)
+        self.batch_sizes = valid.sum(dim=1)
+        packed_time, packed_batch = valid.nonzero(as_tuple=True)
+        if self.sorted_indices is not None:
+            packed_batch = self.sorted_indices[packed_batch]
+        self._packed_time, self._packed_batch = packed_time, packed_batch
+        self._cache = dict()
+
+    def _get(self, name, device, func):
+        key = (name, device)
+        if key not in self._cache:
+            self._cache[key] = func().to(device)
+        return self._cache[key]
+
+    def _get_index(self, total_length, device):
+        """The index of each packed element in the padded tensor, flattened in its first two dimensions."""
+        def compute():
+            if self.batch_first:
+                return self._packed_batch * total_length + self._packed_time
+            return self._packed_time * self.batch_size + self._packed_batch
+        return self._get(('index', total_length), device, compute)
+
+    def _get_permutation(self, device):
+        if self.sorted_indices is None:
+            return None, None
+        return (
+            self._get('sorted_indices', device, lambda: self.sorted_indices),
+            self._get('unsorted_indices', device, lambda: self.unsorted_indices)
+        )
+
+    def pack(self, seq_tensor):
+        """Pack a padded tensor of shape `[B, T, ...]` (or `[T, B, ...]`) into a :class:`PackedSequence`."""
+        total_length = seq_tensor.size(1 if self.batch_first else 0)
+        flat = seq_tensor.reshape((-1, ) + seq_tensor.size()[2:])
+        data = flat.index_select(0, self._get_index(total_length, seq_tensor.device))
+        sorted_indices, unsorted_indices = self._get_permutation(seq_tensor.device)
+        return PackedSequence(data, self.batch_sizes, sorted_indices, unsorted_indices)
+
+    def unpack(self, packed, total_length=None, padding_value=0):
+        """
+        Unpack a :class:`PackedSequence` into a padded tensor, in the original order of the batch.
+
+        Args:
+            packed (PackedSequence): the packed sequence, e.g., the output of an RNN module.
+            total_length (int): the length of the padded tensor, default to the maximum length.
+            padding_value (float): the value of the paddings.
+        """
+        if total_length is None:
+            total_length = self.max_length
+        assert total_length >= self.max_length
+        data = packed.data
+        if self.batch_first:
+            shape = (self.batch_size, total_length) + data.size()[1:]
+        else:
+            shape = (total_length, self.batch_size) + data.size()[1:]
+        flat = data.new_full((self.batch_size * total_length, ) + data.size()[1:], padding_value)
+        flat = flat.index_copy(0, self._get_index(total_length, data.device), data)
+        return flat.view(shape)
+
+    def run(self, rnn, seq_tensor, initial_states=None, total_length=None):
+        """
+        Run an RNN module on a padded tensor.
+
+        Args:
+            rnn (nn.Module): the RNN module, which should take a :class:`PackedSequence` as input.
+            seq_tensor (torch.Tensor): the padded tensor.
+            initial_states: the initial states of the RNN, in the original order of the batch.
+            total_length (int): the length of the padded output, default to the maximum length.
+
+        Returns:
+            tuple: the padded output and the last states of the RNN, both in the original order of the batch.
+        """
+        packed_output, last_output = rnn(self.pack(seq_tensor), initial_states)
+        return self.unpack(packed_output, total_length=total_length), last_output
+
+
+def rnn_with_length(rnn, seq_tensor, seq_lengths, initial_states, batch_first=True, sorted=False, plan=None):
+    """
+    Run an RNN module on a batch of padded sequences with lengths. The initial states and the returned last states
+    are in the original order of the batch.
+
+    Args:
+        plan (PackedBatchPlan): optional, the packing plan of the batch. Use it to share the plan across multiple
+            RNN modules running on the same batch.
+    """
+    if plan is None:
+        plan = PackedBatchPlan(seq_lengths, batch_first=batch_first, sorted=sorted)
+    assert plan.batch_first == batch_first
+    return plan.run(rnn, seq_tensor, initial_states)
+
+
+def _rnn_with_length_baseline(rnn, seq_tensor, seq_lengths, initial_states, batch_first=True):
+    """Sort, pack, run, unpack and unsort on every call (the implementation of :func:`rnn_with_length` before
+    :class:`PackedBatchPlan`), for benchmarking."""
+    seq_lengths, perm_idx = seq_lengths.sort(0, descending=True)
+    batch_dim = 0 if batch_first else 1
+    seq_tensor = seq_tensor.index_select(batch_dim, perm_idx)
+    packed_input = pack_padded_sequence(seq_tensor, seq_lengths.cpu(), batch_first=batch_first)
     packed_output, last_output = rnn(packed_input, initial_states)
     output, _ = pad_packed_sequence(packed_output, batch_first=batch_first)
+    perm_inv = torch.empty_like(perm_idx)
+    perm_inv[perm_idx] = torch.arange(perm_idx.size(0), device=perm_idx.device)
+    return output.index_select(batch_dim, perm_inv), last_output
 
-    if not sorted:
-        perm_inv = inverse_permutation(perm_idx)
-        output = output[perm_inv]
-        sequence_dim = 1 if batch_first else 0
-        if type(last_output) is tuple:
-            last_output = tuple(map(lambda x: x.index_select(sequence_dim, perm_inv), last_output))
-        else:
-            last_output = last_output.index_select(sequence_dim, perm_inv)
 
-    return output, last_output
+def benchmark_rnn_with_length(batch_size=64, max_length=50, hidden_dim=64, nr_layers=4, nr_iters=10):
+    """
+    Compare a stacked encoder (a list of single-layer GRUs) that sorts and packs the batch in each layer, with one
+    that shares a :class:`PackedBatchPlan` across the layers, on CPU.
+
+    Returns:
+        dict: the time per forward (in seconds) of both implementations, with keys `baseline` and `plan`.
+    """
+    rnns = [torch.nn.GRU(hidden_dim, hidden_dim, batch_first=True) for _ in range(nr_layers)]
+    inputs = torch.randn(batch_size, max_length, hidden_dim)
+    lengths = torch.randint(1, max_length + 1, (batch_size, ))
+
+    def baseline():
+        f = inputs
+        for rnn in rnns:
+            f, _ = _rnn_with_length_baseline(rnn, f, lengths, None)
+
+    def plan():
+        f = inputs
+        batch_plan = PackedBatchPlan(lengths)
+        for rnn in rnns:
+            f, _ = batch_plan.run(rnn, f)
+
+    results = dict()
+    with torch.no_grad():
+        for name, func in [('baseline', baseline), ('plan', plan)]:
+            func()
+            start = time.time()
+            for i in range(nr_iters):
+                func()
+            results[name] = (time.time() - start) / nr_iters
+    return results
@@ -8,16 +8,55 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
+import collections
+
+import torch
+
 __all__ = ['AccumGrad']
 
 from .custom_optimizer import CustomizedOptimizer
 
 
+class _GradBucket(object):
+    """A contiguous flat buffer accumulating the gradients of the parameters of the same dtype and device."""
+
+    def __init__(self, params):
+        self.params = params
+        # Whether each parameter has received a gradient in the current accumulation window.
+        self.received = [False for _ in params]
+        self.buffer = torch.zeros(sum(p.numel() for p in params), dtype=params[0].dtype, device=params[0].device)
+        self.views = []
+        offset = 0
+        for p in params:
+            self.views.append(self.buffer[offset:offset + p.numel()].view_as(p))
+            offset += p.numel()
+
+
 class AccumGrad(CustomizedOptimizer):
-    def __init__(self, base_optimizer, nr_acc):
+    """
+    Accumulate the gradients of `nr_acc` steps, and then call the base optimizer with the averaged gradients.
+
+    The gradients are accumulated into one contiguous flat buffer per (dtype, device) of the parameters, so that each
+    step costs a single `torch._foreach_add_` per buffer, and the averaging (and the optional gradient clipping) is
+    done on the flat buffers.
+    """
+
+    def __init__(self, base_optimizer, nr_acc, max_grad_norm=None, norm_type=2):
+        """
+        Args:
+            base_optimizer (torch.optim.Optimizer): the base optimizer.
+            nr_acc (int): the number of steps to accumulate.
+            max_grad_norm (float): if not None, clip the norm of the averaged gradients (of all parameters) to this value.
+            norm_type (float): the type of the norm used by the gradient clipping.
+        """
         self._base_optimizer = base_optimizer
         self._nr_acc = nr_acc
+        self._max_grad_norm = max_grad_norm
+        self._norm_type = float(norm_type)
         self._current = 0
+        self._buckets = None
+        self._bucket_key = None
+        self._pending_buffers = None
 
     @property
     def state(self):
@@ -28,47 +67,112 @@ class AccumGrad(CustomizedOptimizer):
         return self._base_optimizer.param_groups
 
     def state_dict(self):
-        # TODO(Jiayuan Mao @ 05/08): use a separate method to store all grad_buffer.
+        if self._buckets is not None:
+            buffers = [b.buffer.clone() for b in self._buckets]
+            received = [list(b.received) for b in self._buckets]
+        elif self._pending_buffers is not None:
+            # Loaded but not restored yet (no step since load_state_dict): keep the loaded buffers.
+            buffers, received = self._pending_buffers
+        else:
+            buffers, received = None, None
         return {
             'base_optimizer': self._base_optimizer.state_dict(),
-            'current': self._current
+            'current': self._current,
+            'grad_buffers': buffers,
+            'grad_received': received
         }
 
     def load_state_dict(self, state_dict):
         self._current = state_dict['current']
+        # The buffers are restored when the buckets are built, at the next step.
+        self._buckets = None
+        self._pending_buffers = state_dict.get('grad_buffers', None), state_dict.get('grad_received', None)
         return self._base_optimizer.load_state_dict(state_dict['base_optimizer'])
 
     def zero_grad(self):
         return self._base_optimizer.zero_grad()
 
+    @staticmethod
+    def _get_bucket_key(params):
+        return tuple((id(p), p.dtype, p.device) for p in params)
+
+    def _build_buckets(self, params, key):
+        groups = collections.OrderedDict()
+        for p in params:
+            groups.setdefault((p.dtype, p.device), []).append(p)
+        self._buckets = [_GradBucket(ps) for ps in groups.values()]
+        self._bucket_key = key
+
+        if self._pending_buffers is not None:
+            buffers, received = self._pending_buffers
+            if buffers is not None and len(buffers) == len(self._buckets):
+                for i, (b, buf) in enumerate(zip(self._buckets, buffers)):
+                    if buf.shape == b.buffer.shape:
+                        b.buffer.copy_(buf)
+                        # Checkpoints without the flags: assume that all parameters have received gradients.
+                        b.received = list(received[i]) if received is not None else [True for _ in b.params]
+            self._pending_buffers = None
+
     def step(self, closure=None):
         loss = None
         if closure is not None:
             loss = closure()
 
-        self._current += 1
+        params = [p for group in self._base_optimizer.param_groups for p in group['params']]
+        key = self._get_bucket_key(params)
+        if self._buckets is None or self._bucket_key != key:
+            self._build_buckets(params, key)
 
-        for group in self._base_optimizer.param_groups:
-            for p in group['params']:
-                if p.grad is None:
-                    continue
-                d_p = p.grad.data
-                param_state = self._base_optimizer.state[p]
+        self._current += 1
 
-                # MJY:: we ensure that grad_buffer does not require grad.
-                if 'grad_buffer' not in param_state:
-                    buf = param_state['grad_buffer'] = d_p.clone()
-                else:
-                    buf = param_state['grad_buffer']
-                    buf.add_(d_p)
+        with torch.no_grad():
+            for b in self._buckets:
+                views, grads = [], []
+                for i, (p, v) in enumerate(zip(b.params, b.views)):
+                    if p.grad is not None:
+                        views.append(v)
+                        grads.append(p.grad)
+                        b.received[i] = True
+                if len(grads) > 0:
+                    torch._foreach_add_(views, grads)
 
-                if self._current >= self._nr_acc:
-                    buf.mul_(1. / self._current)
-                    p.grad.data.copy_(buf)
-                    buf.zero_()
+            if self._current >= self._nr_acc:
+                self._flush()
 
         if self._current >= self._nr_acc:
             self._base_optimizer.step()
             self._current = 0
 
         return loss
+
+    def _flush(self):
+        """
+        Average (and clip) the accumulated gradients, write them into the parameters, and reset the buffers. Only the
+        parameters that have received a gradient in the window are written, so that the base optimizer skips the
+        unused ones (e.g., it does not apply weight decay to them).
+        """
+        for b in self._buckets:
+            b.buffer.mul_(1. / self._current)
+
+        if self._max_grad_norm is not None:
+            norms = [torch.linalg.vector_norm(b.buffer, self._norm_type).float().cpu() for b in self._buckets]
+            total_norm = torch.linalg.vector_norm(torch.stack(norms), self._norm_type)
+            clip_coef = float(self._max_grad_norm / (total_norm + 1e-6))
+            if clip_coef < 1:
+                for b in self._buckets:
+                    b.buffer.mul_(clip_coef)
+
+        for b in self._buckets:
+            grads, views = [], []
+            for i, (p, v) in enumerate(zip(b.params, b.views)):
+                if not b.received[i]:
+                    continue
+                if p.grad is None:
+                    p.grad = v.clone()
+                else:
+                    grads.append(p.grad)
+                    views.append(v)
+            if len(grads) > 0:
+                torch._foreach_copy_(grads, views)
+            b.buffer.zero_()
+            b.received = [False for _ in b.params]
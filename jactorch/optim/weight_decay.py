@@ -9,17 +9,60 @@
 # Distributed under terms of the MIT license.
 
 import math
+import time
+import collections
+
 import torch
 from torch.optim import Optimizer
 
 __all__ = ['AdamW']
 
 
+class _AdamWBucket(object):
+    """The parameters of a group with the same dtype and device, whose states are stored in flat buffers."""
+
+    def __init__(self, optimizer, params):
+        self.params = params
+        self.numels = [p.numel() for p in params]
+        self.steps = []
+
+        total = sum(self.numels)
+        self.exp_avg = torch.zeros(total, dtype=params[0].dtype, device=params[0].device)
+        self.exp_avg_sq = torch.zeros_like(self.exp_avg)
+        self.denom = torch.empty_like(self.exp_avg)
+        self.exp_avg_views = self._views(self.exp_avg)
+        self.exp_avg_sq_views = self._views(self.exp_avg_sq)
+        self.denom_views = self._views(self.denom)
+
+        # Move the existing states (e.g., loaded from a state dict) into the flat buffers, and make the states views
+        # of the buffers, so that the state dict keeps the per-parameter format.
+        for i, p in enumerate(params):
+            state = optimizer.state[p]
+            if 'exp_avg' in state:
+                self.exp_avg_views[i].copy_(state['exp_avg'])
+                self.exp_avg_sq_views[i].copy_(state['exp_avg_sq'])
+            self.steps.append(int(state.get('step', 0)))
+            state['step'] = self.steps[-1]
+            state['exp_avg'] = self.exp_avg_views[i]
+            state['exp_avg_sq'] = self.exp_avg_sq_views[i]
+
+    def _views(self, buffer):
+        return [v.view_as(p) for v, p in zip(buffer.split(self.numels), self.params)]
+
+    def sync_steps(self, optimizer):
+        for p, step in zip(self.params, self.steps):
+            optimizer.state[p]['step'] = step
+
+
 class AdamW(Optimizer):
     """Implements Adam algorithm.
 
     It has been proposed in `Adam: A Method for Stochastic Optimization`_.
 
+    By default, the parameters of each group are bucketed by dtype and device; the states of each bucket are stored
+    in flat buffers, and the update is applied with the multi-tensor `torch._foreach_*` ops, instead of a loop over
+    the parameters. The state dict has the same per-parameter format as the per-parameter implementation.
+
     Arguments:
         params (iterable): iterable of parameters to optimize or dicts defining
             parameter groups
@@ -29,17 +72,29 @@ class AdamW(Optimizer):
         eps (float, optional): term added to the denominator to improve
             numerical stability (default: 1e-8)
         weight_decay (float, optional): weight decay (L2 penalty) (default: 0)
+        foreach (bool, optional): use the multi-tensor implementation (default: True)
 
-    .. _Adam\: A Method for Stochastic Optimization:
+    .. _Adam\\: A Method for Stochastic Optimization:
         https://arxiv.org/abs/1412.6980
     """
 
     def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8,
-                 weight_decay=0):
+                 weight_decay=0, foreach=True):
         defaults = dict(lr=lr, betas=betas, eps=eps,
                         weight_decay=weight_decay)
+        self.foreach = foreach
+        self._buckets = None
+        self._bucket_key = None
         super().__init__(params, defaults)
 
+    def add_param_group(self, param_group):
+        super().add_param_group(param_group)
+        self._buckets = None
+
+    def load_state_dict(self, state_dict):
+        super().load_state_dict(state_dict)
+        self._buckets = None
+
     def step(self, closure=None):
         """Performs a single optimization step.
 
@@ -51,11 +106,21 @@ class AdamW(Optimizer):
         if closure is not None:
             loss = closure()
 
+        with torch.no_grad():
+            if self.foreach:
+                self._step_foreach()
+            else:
+                self._step_single()
+
+        return loss
+
+    def _step_single(self):
+        self._buckets = None
         for group in self.param_groups:
             for p in group['params']:
                 if p.grad is None:
                     continue
-                grad = p.grad.data
+                grad = p.grad
                 if grad.is_sparse:
                     raise RuntimeError('Adam does not support sparse gradients, please consider SparseAdam instead')
 
@@ -65,9 +130,9 @@ class AdamW(Optimizer):
                 if 'step' not in state:
                     state['step'] = 0
                     # Exponential moving average of gradient values
-                    state['exp_avg'] = torch.zeros_like(p.data)
+                    state['exp_avg'] = torch.zeros_like(p)
                     # Exponential moving average of squared gradient values
-                    state['exp_avg_sq'] = torch.zeros_like(p.data)
+                    state['exp_avg_sq'] = torch.zeros_like(p)
 
                 exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
                 beta1, beta2 = group['betas']
@@ -75,8 +140,8 @@ class AdamW(Optimizer):
                 state['step'] += 1
 
                 # Decay the first and second moment running average coefficient
-                exp_avg.mul_(beta1).add_(1 - beta1, grad)
-                exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
+                exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+                exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
 
                 denom = exp_avg_sq.sqrt().add_(group['eps'])
 
@@ -84,8 +149,107 @@ class AdamW(Optimizer):
                 bias_correction2 = 1 - beta2 ** state['step']
                 step_size = group['lr'] * math.sqrt(bias_correction2) / bias_correction1
 
-                p.data.addcdiv_(-step_size, exp_avg, denom)
+                p.addcdiv_(exp_avg, denom, value=-step_size)
                 if group['weight_decay'] != 0:
-                    p.data.mul_(1 - group['lr'] * group['weight_decay'])
+                    p.mul_(1 - group['lr'] * group['weight_decay'])
 
-        return loss
+    def _get_bucket_key(self):
+        return tuple(tuple((id(p), p.dtype, p.device) for p in group['params']) for group in self.param_groups)
+
+    def _build_buckets(self, key):
+        self._bucket_key = key
+        self._buckets = []
+        for group in self.param_groups:
+            params = collections.OrderedDict()
+            for p in group['params']:
+                params.setdefault((p.dtype, p.device), []).append(p)
+            self._buckets.append([_AdamWBucket(self, ps) for ps in params.values()])
+
+    def _step_foreach(self):
+        # The params of the groups may be replaced (or moved) between steps: rebuild the buckets if so.
+        key = self._get_bucket_key()
+        if self._buckets is None or self._bucket_key != key:
+            self._build_buckets(key)
+
+        for group, buckets in zip(self.param_groups, self._buckets):
+            for b in buckets:
+                indices = [i for i, p in enumerate(b.params) if p.grad is not None]
+                if len(indices) == 0:
+                    continue
+                grads = [b.params[i].grad for i in indices]
+                if any(g.is_sparse for g in grads):
+                    raise RuntimeError('Adam does not support sparse gradients, please consider SparseAdam instead')
+
+                if len(indices) == len(b.params):
+                    # All parameters have gradients: the element-wise ops are applied on the flat buffers.
+                    self._update_bucket(group, b, b.params, grads, b.exp_avg_views, b.exp_avg_sq_views, b)
+                else:
+                    self._update_bucket(
+                        group, b, [b.params[i] for i in indices], grads,
+                        [b.exp_avg_views[i] for i in indices], [b.exp_avg_sq_views[i] for i in indices], None, indices
+                    )
+                # Keep the per-parameter states (e.g., read by schedulers or hooks) in sync with the bucket.
+                b.sync_steps(self)
+
+    def _update_bucket(self, group, bucket, params, grads, exp_avgs, exp_avg_sqs, flat, indices=None):
+        beta1, beta2 = group['betas']
+
+        if flat is not None:
+            flat.exp_avg.mul_(beta1)
+            flat.exp_avg_sq.mul_(beta2)
+        else:
+            torch._foreach_mul_(exp_avgs, beta1)
+            torch._foreach_mul_(exp_avg_sqs, beta2)
+        torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+        torch._foreach_addcmul_(exp_avg_sqs, grads, grads, value=1 - beta2)
+
+        if flat is not None:
+            torch.sqrt(flat.exp_avg_sq, out=flat.denom).add_(group['eps'])
+            denoms = flat.denom_views
+        else:
+            denoms = torch._foreach_sqrt(exp_avg_sqs)
+            torch._foreach_add_(denoms, group['eps'])
+
+        # Parameters with different numbers of steps (which happens if some of them did not have gradients in some
+        # steps) have different bias corrections.
+        steps = bucket.steps
+        if indices is None:
+            indices = range(len(steps))
+        for i in indices:
+            steps[i] += 1
+        by_step = collections.defaultdict(list)
+        for j, i in enumerate(indices):
+            by_step[steps[i]].append(j)
+
+        for step, js in by_step.items():
+            bias_correction1 = 1 - beta1 ** step
+            bias_correction2 = 1 - beta2 ** step
+            step_size = group['lr'] * math.sqrt(bias_correction2) / bias_correction1
+            if len(js) == len(params):
+                torch._foreach_addcdiv_(params, exp_avgs, denoms, value=-step_size)
+            else:
+                torch._foreach_addcdiv_([params[j] for j in js], [exp_avgs[j] for j in js], [denoms[j] for j in js], value=-step_size)
+
+        if group['weight_decay'] != 0:
+            torch._foreach_mul_(params, 1 - group['lr'] * group['weight_decay'])
+
+
+def benchmark_adamw(nr_params=1000, param_size=16, nr_iters=20):
+    """
+    Compare the per-parameter and the multi-tensor implementations of :class:`AdamW`, on CPU.
+
+    Returns:
+        dict: the time per step (in seconds) of both implementations, with keys `single` and `foreach`.
+    """
+    results = dict()
+    for name, foreach in [('single', False), ('foreach', True)]:
+        params = [torch.nn.Parameter(torch.randn(param_size)) for _ in range(nr_params)]
+        for p in params:
+            p.grad = torch.randn(param_size)
+        optimizer = AdamW(params, weight_decay=1e-4, foreach=foreach)
+        optimizer.step()
+        start = time.time()
+        for i in range(nr_iters):
+            optimizer.step()
+        results[name] = (time.time() - start) / nr_iters
+    return results
@@ -10,17 +10,36 @@
 
 import time
 import queue
+import traceback
+import bisect
+import itertools
 import threading
 import contextlib
+import collections
 
+import numpy as np
 import torch
+import torch.multiprocessing as mp
 
 from jacinle.concurrency.future import FutureResult
-from jacinle.utils.meta import map_exec_method
+from jacinle.logging import get_logger
+from jacinle.utils.meta import map_exec_method, stmap
 from jactorch.utils.meta import as_numpy, as_tensor
-from jacnp.batch import batchify, unbatchify
+from jacnp.batch import batchify, pad_batchify, unbatchify
 
-__all__ = ['ModelInferencer', 'AsyncInferenceTask', 'AsyncModelInferencer', 'BatchedAsyncModelInferencer']
+logger = get_logger(__file__)
+
+__all__ = [
+    'ModelInferencer', 'AsyncInferenceTask', 'AsyncModelInferencer', 'BatchedAsyncModelInferencer',
+    'MultiProcessModelInferencer'
+]
+
+
+class _InferenceFailure(object):
+    __slots__ = ('exception', )
+
+    def __init__(self, exception):
+        self.exception = exception
 
 
 class AsyncInferenceTask(object):
@@ -33,11 +52,18 @@ class AsyncInferenceTask(object):
         self.future = future
 
     def get_result(self):
-        return self.future.get()
+        """Wait for the result. If the inference has failed, the exception is raised."""
+        result = self.future.get()
+        if isinstance(result, _InferenceFailure):
+            raise result.exception
+        return result
 
     def put_result(self, result):
         return self.future.put(result)
 
+    def put_error(self, exception):
+        return self.future.put(_InferenceFailure(exception))
+
 
 class ModelInferencer(object):
     def __init__(self, model):
@@ -87,13 +113,20 @@ class AsyncModelInferencer(ModelInferencer):
         for rank in range(self._nr_workers):
             self._task_queue.put(None)
         map_exec_method('join', self._workers)
+        self._workers = []
 
     def _mainloop_worker(self, rank):
         while True:
             task = self._task_queue.get()
             if task is None:
                 break
-            task.put_result(self._inference_model(task.feed_dict))
+            try:
+                output = self._inference_model(task.feed_dict)
+            except Exception as e:
+                logger.exception('Inference failed in worker #{}.'.format(rank))
+                task.put_error(e)
+            else:
+                task.put_result(output)
 
     def inference(self, feed_dict, future=None):
         task = AsyncInferenceTask(feed_dict, future=future)
@@ -102,33 +135,397 @@ class AsyncModelInferencer(ModelInferencer):
 
 
 class BatchedAsyncModelInferencer(AsyncModelInferencer):
-    def __init__(self, model, nr_workers=1, batch_size=8, latency=10):
+    """
+    An asynchronous inferencer that groups the requests into batches.
+
+    A worker starts a batch with the first pending request, and then collects more requests until the batch is full
+    or `latency` (ms) has passed. The requests are served by priority (lower values first), then in the order of
+    arrival. The task queue is bounded by `max_queue_size`: when it is full, :meth:`inference` blocks (backpressure).
+
+    If `target_latency` (ms) is given, the batch size is adapted online within `[1, max_batch_size]`, so that the 99th
+    percentile of the latencies of the requests (from the submission to the result) stays below the target. When the
+    target is exceeded, the batch size is decreased if the execution of a batch itself takes more than half of the
+    target; otherwise the requests are mostly waiting in the queue, and the batch size is increased to gain throughput.
+    When the latencies are well below the target and the batches are full, the batch size is increased. The batch
+    size is never increased beyond the size whose (linearly extrapolated) execution time exceeds half of the target,
+    so that under overload it settles instead of oscillating.
+
+    If `pad_value` is given, the inputs of different shapes are padded to the maximum shape in the batch (see
+    :func:`jacnp.batch.pad_batchify`), and the outputs are unpadded by `unpad`, which is either a callable
+    `unpad(output, feed_dict)` or a dict mapping an output key (None if the output is a single array) to a pair
+    `(input_key, nr_axes)`: the first `nr_axes` axes of the output are cropped to the shape of the input.
+
+    If the inference of a batch fails (including the batching of inputs of different shapes without `pad_value`), the
+    exception is raised by `get_result()` of all tasks in the batch.
+
+    The statistics (including the histograms of the queue times and of the batch sizes) are returned by :meth:`get_stat`.
+    """
+
+    QUEUE_TIME_BUCKETS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float('inf'))
+
+    def __init__(self, model, nr_workers=1, batch_size=8, latency=10,
+                 target_latency=None, max_batch_size=None, max_queue_size=0,
+                 pad_value=None, unpad=None, latency_window=256, adapt_interval=8):
         super().__init__(model, nr_workers=nr_workers)
         self._batch_size = batch_size
         self._latency = latency / 1000
+        self._target_latency = target_latency / 1000 if target_latency is not None else None
+        self._max_batch_size = max_batch_size or batch_size
+        self._max_queue_size = max_queue_size
+        self._pad_value = pad_value
+        self._unpad = unpad
+        self._adapt_interval = adapt_interval
+
+        self._seq = itertools.count()
+        self._stat_lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=latency_window)
+        # The latencies measured with the current batch size, used by the adaptation.
+        self._adapt_latencies = collections.deque(maxlen=latency_window)
+        self._nr_batches_since_adapt = 0
+        self._nr_full_batches_since_adapt = 0
+        self._exec_time_since_adapt = 0
+        self.reset_stat()
+
+    def initialize(self):
+        assert len(self._workers) == 0
+
+        self._task_queue = queue.PriorityQueue(maxsize=self._max_queue_size)
+        for rank in range(self._nr_workers):
+            th = threading.Thread(target=self._mainloop_worker, args=(rank, ))
+            th.start()
+            self._workers.append(th)
+
+    def finalize(self):
+        if len(self._workers) == 0:
+            return
+
+        # The stop signals have the lowest priority, so that all pending requests are served first.
+        for rank in range(self._nr_workers):
+            self._task_queue.put((float('inf'), next(self._seq), 0, None))
+        map_exec_method('join', self._workers)
+        self._workers = []
+
+    def inference(self, feed_dict, future=None, priority=0, block=True, timeout=None):
+        """
+        Submit a request.
+
+        Args:
+            feed_dict: the input of the model.
+            future (FutureResult): optional, the future of the result.
+            priority (int): the priority of the request; lower values are served first.
+            block (bool), timeout (float): when the task queue is full, whether to block and for how long (in
+                seconds), before raising :class:`queue.Full`.
+
+        Returns:
+            AsyncInferenceTask: the task, whose result can be fetched by `get_result()`.
+        """
+        task = AsyncInferenceTask(feed_dict, future=future)
+        self._task_queue.put((priority, next(self._seq), time.time(), task), block=block, timeout=timeout)
+        return task
+
+    @property
+    def batch_size(self):
+        """The current (maximum) batch size."""
+        return self._batch_size
+
+    def reset_stat(self):
+        with self._stat_lock:
+            self._stat = dict(
+                nr_requests=0, nr_batches=0,
+                batch_size_histogram=collections.Counter(),
+                queue_time_histogram=[0 for _ in type(self).QUEUE_TIME_BUCKETS]
+            )
+
+    def get_stat(self):
+        """
+        Returns:
+            dict: the statistics: `nr_requests`, `nr_batches`, `batch_size` (the current batch size),
+            `batch_size_histogram` (a dict from the batch sizes to the counts), `queue_time_histogram` (a list of pairs
+            of the upper bounds of the buckets, in ms, and the counts), and `latency_p50`, `latency_p99` (in ms, over
+            the recent requests).
+        """
+        with self._stat_lock:
+            stat = dict(
+                nr_requests=self._stat['nr_requests'],
+                nr_batches=self._stat['nr_batches'],
+                batch_size=self._batch_size,
+                batch_size_histogram=dict(sorted(self._stat['batch_size_histogram'].items())),
+                queue_time_histogram=list(zip(type(self).QUEUE_TIME_BUCKETS, self._stat['queue_time_histogram']))
+            )
+            latencies = list(self._latencies)
+        if len(latencies) > 0:
+            stat['latency_p50'], stat['latency_p99'] = (np.percentile(latencies, [50, 99]) * 1000).tolist()
+        return stat
 
     def _mainloop_worker(self, rank):
         while True:
-            tasks = []
-            stop_signal = False
+            items, stop_signal = self._collect_batch()
+            if len(items):
+                self._run_batch(items)
+            if stop_signal:
+                break
+
+    def _collect_batch(self):
+        items = []
+        item = self._task_queue.get()
+        if item[-1] is None:
+            return items, True
+        items.append(item)
 
-            last_time = time.time() + self._latency
-            for i in range(self._batch_size):
-                if len(tasks) > 0:
-                    task = self._task_queue.get(timeout=last_time - time.time())
+        deadline = time.time() + self._latency
+        while len(items) < self._batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    item = self._task_queue.get(timeout=remaining)
                 else:
-                    task = self._task_queue.get()
-                if task is None:
-                    stop_signal = True
+                    item = self._task_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[-1] is None:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _run_batch(self, items):
+        start = time.time()
+        tasks = [item[-1] for item in items]
+        feed_dicts = [t.feed_dict for t in tasks]
+
+        try:
+            if self._pad_value is not None:
+                batched_feed = pad_batchify(feed_dicts, self._pad_value)
+            else:
+                batched_feed = batchify(feed_dicts)
+            outputs = unbatchify(self._inference_model(batched_feed))
+            if self._pad_value is not None and self._unpad is not None:
+                outputs = [self._unpad_output(o, f) for o, f in zip(outputs, feed_dicts)]
+        except Exception as e:
+            logger.exception('Batched inference failed.')
+            for t in tasks:
+                t.put_error(e)
+        else:
+            for t, o in zip(tasks, outputs):
+                t.put_result(o)
+
+        end = time.time()
+        self._update_stat([start - item[2] for item in items], [end - item[2] for item in items], end - start)
+
+    def _unpad_output(self, output, feed_dict):
+        if callable(self._unpad):
+            return self._unpad(output, feed_dict)
+
+        def crop(value, input_key, nr_axes):
+            shape = np.shape(feed_dict[input_key])[:nr_axes]
+            return value[tuple(slice(0, s) for s in shape)]
+
+        if None in self._unpad:
+            return crop(output, *self._unpad[None])
+        output = output.copy()
+        for key, (input_key, nr_axes) in self._unpad.items():
+            output[key] = crop(output[key], input_key, nr_axes)
+        return output
+
+    def _update_stat(self, queue_times, latencies, exec_time):
+        buckets = type(self).QUEUE_TIME_BUCKETS
+        with self._stat_lock:
+            self._stat['nr_requests'] += len(latencies)
+            self._stat['nr_batches'] += 1
+            self._stat['batch_size_histogram'][len(latencies)] += 1
+            for t in queue_times:
+                self._stat['queue_time_histogram'][bisect.bisect_left(buckets, t * 1000)] += 1
+
+            self._latencies.extend(latencies)
+            self._adapt_latencies.extend(latencies)
+            self._nr_batches_since_adapt += 1
+            self._nr_full_batches_since_adapt += int(len(latencies) >= self._batch_size)
+            self._exec_time_since_adapt += exec_time
+            if self._target_latency is not None and self._nr_batches_since_adapt >= self._adapt_interval:
+                self._adapt_batch_size()
+
+    def _adapt_batch_size(self):
+        p99 = np.percentile(list(self._adapt_latencies), 99)
+        exec_time = self._exec_time_since_adapt / self._nr_batches_since_adapt
+        mostly_full = self._nr_full_batches_since_adapt * 2 >= self._nr_batches_since_adapt
+
+        batch_size = self._batch_size
+        exec_budget = self._target_latency / 2
+        if p99 > self._target_latency and exec_time > exec_budget:
+            # Shrink to the size whose execution time would fit the budget.
+            batch_size = max(1, min(batch_size - 1, int(batch_size * exec_budget / exec_time)))
+        elif mostly_full and (p99 > self._target_latency or p99 < 0.7 * self._target_latency):
+            step = max(1, batch_size // 4) if p99 > self._target_latency else 1
+            # Grow, but not beyond the size whose execution time would exceed the budget.
+            max_batch_size = int(batch_size * exec_budget / exec_time) if exec_time > 0 else self._max_batch_size
+            batch_size = max(batch_size, min(self._max_batch_size, batch_size + step, max_batch_size))
+
+        self._nr_batches_since_adapt = 0
+        self._nr_full_batches_since_adapt = 0
+        self._exec_time_since_adapt = 0
+        if batch_size != self._batch_size:
+            self._batch_size = batch_size
+            # The latencies measured with the previous batch size are not used by the adaptation.
+            self._adapt_latencies.clear()
+
+
+def _mainloop_process_worker(rank, model, nr_threads, task_queue, result_queue):
+    torch.set_num_threads(nr_threads)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        identifier, feed_dict = task
+        try:
+            with torch.no_grad():
+                output = model(feed_dict)
+            output = stmap(lambda x: x.detach() if torch.is_tensor(x) else x, output)
+            error = None
+        except Exception as e:
+            logger.exception('Inference failed in worker #{}.'.format(rank))
+            # The exception itself may not be picklable; send back a plain record instead.
+            output, error = None, (type(e).__name__, str(e), traceback.format_exc())
+        result_queue.put((identifier, output, error))
+
+
+class MultiProcessModelInferencer(ModelInferencer):
+    """
+    An asynchronous inferencer that runs the model in a pool of processes, which avoids the contention on the GIL of
+    the thread-based :class:`AsyncModelInferencer`.
+
+    The model is moved into the shared memory and passed to each worker once, so the weights are not copied. Each
+    worker uses `nr_threads` intra-op threads (default: the number of CPUs divided by the number of workers). The
+    requests and the results are passed as tensors through :mod:`torch.multiprocessing` queues, which move the tensors
+    into the shared memory instead of pickling their data. The API is the same as :class:`AsyncModelInferencer`.
+
+    If the inference fails in a worker, `get_result()` raises a RuntimeError with the type, the message and the
+    traceback of the original exception. If a worker process dies, all pending requests fail.
+
+    Note that with the `spawn` start method (the default), the model must be picklable, and the main module must be
+    guarded by `if __name__ == '__main__'`.
+    """
+
+    POLL_INTERVAL = 1
+
+    def __init__(self, model, nr_workers=2, nr_threads=None, start_method='spawn'):
+        super().__init__(model)
+        self._nr_workers = nr_workers
+        self._nr_threads = nr_threads or max(1, mp.cpu_count() // nr_workers)
+        self._context = mp.get_context(start_method)
+        self._task_queue = None
+        self._result_queue = None
+        self._workers = []
+        self._collector = None
+        self._futures = dict()
+        self._futures_lock = threading.Lock()
+        self._identifier = itertools.count()
+        self._dead_workers = set()
+
+    def initialize(self):
+        assert len(self._workers) == 0
+
+        self._dead_workers = set()
+        self._model.share_memory()
+        self._task_queue = self._context.Queue()
+        self._result_queue = self._context.Queue()
+        for rank in range(self._nr_workers):
+            proc = self._context.Process(
+                target=_mainloop_process_worker,
+                args=(rank, self._model, self._nr_threads, self._task_queue, self._result_queue),
+                daemon=True
+            )
+            proc.start()
+            self._workers.append(proc)
+        self._collector = threading.Thread(target=self._mainloop_collector, daemon=True)
+        self._collector.start()
+
+    def finalize(self):
+        if len(self._workers) == 0:
+            return
+
+        for rank in range(self._nr_workers):
+            self._task_queue.put(None)
+        map_exec_method('join', self._workers)
+        self._result_queue.put(None)
+        self._collector.join()
+        self._workers = []
+        self._collector = None
+
+    def _mainloop_collector(self):
+        while True:
+            try:
+                result = self._result_queue.get(timeout=type(self).POLL_INTERVAL)
+            except queue.Empty:
+                result = None
+            else:
+                if result is None:
                     break
-                else:
-                    tasks.append(task)
 
-            if len(tasks):
-                batched_feed = batchify([t.feed_dict for t in tasks])
-                outputs = unbatchify(self._inference_model(batched_feed))
-                for t, o in zip(tasks, outputs):
-                    t.put_result(o)
+            try:
+                if result is not None:
+                    self._put_result(*result)
+                self._check_workers()
+            except Exception:
+                logger.exception('Failed to collect the inference result.')
 
-            if stop_signal:
-                break
+    def _put_result(self, identifier, output, error):
+        with self._futures_lock:
+            task = self._futures.pop(identifier, None)
+        if task is None:  # the request has been failed because of a dead worker.
+            return
+        if error is not None:
+            task.put_error(RuntimeError('Inference failed in the worker: {}: {}\n{}'.format(*error)))
+            return
+        try:
+            output = as_numpy(output)
+        except Exception as e:
+            task.put_error(e)
+        else:
+            task.put_result(output)
+
+    def _check_workers(self):
+        """
+        Fail all pending requests when a worker dies (a normal exit only happens in `finalize`), since the request being
+        processed by the worker is lost. If all workers are dead, the pending requests are failed at every check.
+        """
+        dead = {rank for rank, proc in enumerate(self._workers) if proc.exitcode not in (None, 0)}
+        if len(dead) == 0 or (dead == self._dead_workers and len(dead) < len(self._workers)):
+            return
+        self._dead_workers = dead
+        dead = sorted(dead)
+        with self._futures_lock:
+            futures, self._futures = self._futures, dict()
+        if len(futures) > 0:
+            logger.error('Inference worker(s) {} died; failing {} pending request(s).'.format(dead, len(futures)))
+        for task in futures.values():
+            task.put_error(RuntimeError('Inference worker(s) {} died.'.format(dead)))
+
+    def inference(self, feed_dict, future=None):
+        task = AsyncInferenceTask(feed_dict, future=future)
+        identifier = next(self._identifier)
+        with self._futures_lock:
+            self._futures[identifier] = task
+        self._task_queue.put((identifier, as_tensor(feed_dict)))
+        return task
+
+
+def benchmark_multiprocess_inference(model, feed_dict, nr_requests=256, nr_workers=2, nr_threads=None):
+    """
+    Compare the throughput (requests per second) of :class:`AsyncModelInferencer` (with `nr_workers` threads) and
+    :class:`MultiProcessModelInferencer` (with `nr_workers` processes).
+
+    Returns:
+        dict: the throughput of both inferencers, with keys `thread` and `process`.
+    """
+    results = dict()
+    for name, inferencer in [
+        ('thread', AsyncModelInferencer(model, nr_workers=nr_workers)),
+        ('process', MultiProcessModelInferencer(model, nr_workers=nr_workers, nr_threads=nr_threads))
+    ]:
+        with inferencer.activate():
+            inferencer.inference(feed_dict).get_result()
+            start = time.time()
+            tasks = [inferencer.inference(feed_dict) for _ in range(nr_requests)]
+            for t in tasks:
+                t.get_result()
+            results[name] = nr_requests / (time.time() - start)
+    return results
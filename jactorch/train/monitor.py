@@ -8,7 +8,11 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
+import six
+import torch
 import torch.nn.functional as F
+
+from jacinle.utils.matching import NameMatcher
 from jactorch.utils.meta import as_float
 from jactorch.utils.grad import no_grad_func
 
@@ -18,7 +22,8 @@ __all__ = [
     'regression_accuracy',
     'monitor_param_saturation',
     'monitor_param_rms',
-    'monitor_param_gradrms', 'monitor_param_gradrms_ratio'
+    'monitor_param_gradrms', 'monitor_param_gradrms_ratio',
+    'ParamStatMonitor'
 ]
 
 
@@ -69,6 +74,21 @@ def _rms(p):
     return as_float((p ** 2).mean() ** 0.5)
 
 
+def _batched_norms(tensors):
+    """The L2 norms of a list of tensors, as a float tensor, computed with a single multi-tensor op."""
+    if len(tensors) == 0:
+        return torch.zeros(0)
+    norms = torch._foreach_norm(tensors)
+    device = norms[0].device
+    return torch.stack([n.to(device=device, dtype=torch.float32) for n in norms])
+
+
+def _batched_rms(tensors):
+    numels = torch.tensor([t.numel() for t in tensors], dtype=torch.float32)
+    norms = _batched_norms(tensors)
+    return norms / numels.to(norms.device).sqrt()
+
+
 @no_grad_func
 def monitor_param_saturation(model):
     monitors = {}
@@ -81,25 +101,193 @@ def monitor_param_saturation(model):
 
 @no_grad_func
 def monitor_param_rms(model):
-    monitors = {}
-    for name, p in model.named_parameters():
-        monitors['param/rms/' + name] = _rms(p)
-    return monitors
+    named = list(model.named_parameters())
+    rms = _batched_rms([p for _, p in named]).tolist()
+    return {'param/rms/' + name: v for (name, _), v in zip(named, rms)}
 
 
 @no_grad_func
 def monitor_param_gradrms(model):
-    monitors = {}
-    for name, p in model.named_parameters():
-        if p.grad is not None:
-            monitors['param/gradrms/' + name] = _rms(p.grad)
-    return monitors
+    named = [(name, p.grad) for name, p in model.named_parameters() if p.grad is not None]
+    rms = _batched_rms([g for _, g in named]).tolist()
+    return {'param/gradrms/' + name: v for (name, _), v in zip(named, rms)}
 
 
 @no_grad_func
 def monitor_param_gradrms_ratio(model):
-    monitors = {}
-    for name, p in model.named_parameters():
-        if p.grad is not None:
-            monitors['param/gradrmsratio/' + name] = _rms(p.grad) / max(_rms(p), 1e-8)
-    return monitors
+    named = [(name, p) for name, p in model.named_parameters() if p.grad is not None]
+    params = [p for _, p in named]
+    rms = _batched_rms([p.grad for p in params] + params)
+    ratio = (rms[:len(params)] / rms[len(params):].clamp(min=1e-8)).tolist()
+    return {'param/gradrmsratio/' + name: v for (name, _), v in zip(named, ratio)}
+
+
+class ParamStatMonitor(object):
+    """
+    Collect the statistics (norms and RMS) of the parameters and their gradients of a model.
+
+    All statistics are computed with batched ops (a single `torch._foreach_norm` for the parameters and one for the
+    gradients) and concatenated into one tensor, which is read back to the host once, instead of once per parameter.
+    The statistics can be aggregated over groups of parameters, specified by name patterns (see
+    :class:`jacinle.utils.matching.NameMatcher`), and are only computed every `interval` calls. The gradient
+    statistics of a group only cover the parameters that have gradients. The parameters are re-read from the model
+    when they change.
+
+    Example:
+        >>> monitor = ParamStatMonitor(model, interval=10, groups={'encoder': 'encoder.*', 'decoder': 'decoder.*'})
+        >>> # in the training loop, after the backward pass:
+        >>> monitor(meters)  # updates the meters with keys such as `param/gradrms/encoder`.
+    """
+
+    __stats__ = ('norm', 'rms', 'gradnorm', 'gradrms', 'gradrmsratio')
+
+    def __init__(self, model, interval=1, groups=None, stats=('rms', 'gradrms', 'gradrmsratio'), prefix='param'):
+        """
+        Args:
+            model (nn.Module): the model.
+            interval (int): compute the statistics every `interval` calls.
+            groups (dict or list): the groups of parameters, a mapping (or a list of pairs) from the group names to
+                name patterns (a pattern or a list of patterns). A parameter belongs to the first group it matches;
+                the parameters that match no group are ignored. If None, the statistics of each parameter are reported.
+            stats (tuple of str): the statistics to collect, a subset of `norm`, `rms`, `gradnorm`, `gradrms`
+                and `gradrmsratio`.
+            prefix (str): the prefix of the keys.
+        """
+        for stat in stats:
+            assert stat in type(self).__stats__, 'Unknown statistic: {}.'.format(stat)
+
+        self.model = model
+        self.interval = interval
+        self.groups = groups
+        self.stats = tuple(stats)
+        self.prefix = prefix
+        self._counter = 0
+        self._params_key = None
+        self._refresh()
+
+    def _refresh(self):
+        """Rebuild the list of parameters (and their groups) if the parameters of the model have changed."""
+        named = [(name, p) for name, p in self.model.named_parameters() if p.requires_grad]
+        key = tuple((name, id(p)) for name, p in named)
+        if key == self._params_key:
+            return
+        self._params_key = key
+
+        groups = self.groups
+        if groups is None:
+            self.group_names = [name for name, _ in named]
+            self.params = [p for _, p in named]
+            group_index = list(range(len(named)))
+        else:
+            if isinstance(groups, dict):
+                groups = list(groups.items())
+            self.group_names = [g for g, _ in groups]
+            rules = []
+            for i, (_, patterns) in enumerate(groups):
+                if isinstance(patterns, six.string_types):
+                    patterns = [patterns]
+                rules.extend((pattern, i) for pattern in patterns)
+            matcher = NameMatcher(rules)
+            with matcher:
+                matched = matcher.match_all([name for name, _ in named])
+            self.params = [p for (_, p), m in zip(named, matched) if m is not None]
+            group_index = [m for m in matched if m is not None]
+
+        self._group_index = torch.tensor(group_index, dtype=torch.long)
+        self._numels = torch.tensor([p.numel() for p in self.params], dtype=torch.float32)
+
+    def __call__(self, meters=None):
+        """
+        Collect the statistics, every `interval` calls.
+
+        Args:
+            meters (GroupMeters): optional, the meters to be updated with the statistics.
+
+        Returns:
+            dict: the statistics, or None if they are not collected in this call.
+        """
+        self._counter += 1
+        if (self._counter - 1) % self.interval != 0:
+            return None
+
+        monitors = self.collect()
+        if meters is not None:
+            meters.update(monitors)
+        return monitors
+
+    @no_grad_func
+    def collect(self):
+        """Collect the statistics, regardless of the interval."""
+        self._refresh()
+        if len(self.params) == 0:
+            return dict()
+
+        need_params = any(stat in ('norm', 'rms', 'gradrmsratio') for stat in self.stats)
+        need_grads = any(stat.startswith('grad') for stat in self.stats)
+
+        nr_groups = len(self.group_names)
+        values = []
+        device = None
+
+        def aggregate(norms, mask=None):
+            # Sum the squared norms and the numbers of elements in each group.
+            index, numels = self._group_index.to(norms.device), self._numels.to(norms.device)
+            if mask is not None:
+                index, numels = index[mask], numels[mask]
+            sqr = norms.new_zeros(nr_groups).index_add_(0, index, norms ** 2)
+            count = norms.new_zeros(nr_groups).index_add_(0, index, numels)
+            return sqr, count
+
+        if need_params:
+            param_norms = _batched_norms(self.params)
+            sqr, count = aggregate(param_norms)
+            device = sqr.device
+            param_norm, param_rms = sqr.sqrt(), (sqr / count.clamp(min=1)).sqrt()
+
+        grad_valid = None
+        if need_grads:
+            has_grad = [p.grad is not None for p in self.params]
+            grads = [p.grad for p in self.params if p.grad is not None]
+            if len(grads) > 0:
+                mask = torch.tensor(has_grad)
+                norms = _batched_norms(grads)
+                sqr, count = aggregate(norms, mask.to(norms.device))
+                device = device or sqr.device
+                sqr, count = sqr.to(device), count.to(device)
+                grad_norm, grad_rms = sqr.sqrt(), (sqr / count.clamp(min=1)).sqrt()
+                grad_valid = (count > 0).cpu()
+                if 'gradrmsratio' in self.stats:
+                    # The ratio compares the gradients and the parameters over the same set (those with gradients).
+                    param_mask = mask.to(param_norms.device)
+                    sqr, count = aggregate(param_norms[param_mask], param_mask)
+                    ratio_param_rms = (sqr / count.clamp(min=1)).sqrt().to(device)
+
+        keys = []
+        for stat in self.stats:
+            if stat.startswith('grad') and grad_valid is None:
+                continue
+            if stat == 'norm':
+                value = param_norm
+            elif stat == 'rms':
+                value = param_rms
+            elif stat == 'gradnorm':
+                value = grad_norm
+            elif stat == 'gradrms':
+                value = grad_rms
+            else:
+                value = grad_rms / ratio_param_rms.clamp(min=1e-8)
+            keys.append(stat)
+            values.append(value)
+
+        if len(values) == 0:
+            return dict()
+
+        # A single device-to-host copy of all statistics.
+        values = torch.stack(values).cpu().tolist()
+        monitors = dict()
+        for stat, row in zip(keys, values):
+            for i, (name, v) in enumerate(zip(self.group_names, row)):
+                if stat.startswith('grad') and not grad_valid[i]:
+                    continue
+                monitors['{}/{}/{}'.format(self.prefix, stat, name)] = v
+        return monitors
@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-image-cache.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import os.path as osp
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from jacinle.image import imgio, imgproc
+from jacinle.image.cache import PreprocessedImageCache
+
+TRANSFORMS = [('resize_minmax', dict(min_dim=32, max_dim=1000)), ('center_crop', 24)]
+
+
+def _reference(path):
+    return imgproc.center_crop(imgproc.resize_minmax(imgio.imread(path), 32, 1000), 24)
+
+
+class TestPreprocessedImageCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.paths = []
+        for i in range(16):
+            path = osp.join(self.tmpdir, '{}.png'.format(i))
+            imgio.imwrite(path, (rng.rand(40, 48, 3) * 255).astype('uint8'))
+            self.paths.append(path)
+        self.root = osp.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _key(self, cache, path):
+        return cache.make_key(path, [list(t) for t in TRANSFORMS])
+
+    def test_imread(self):
+        cache = PreprocessedImageCache(self.root)
+        a = cache.imread(self.paths[0], TRANSFORMS)
+        b = cache.imread(self.paths[0], TRANSFORMS)
+        self.assertEqual(a.shape, (24, 24, 3))
+        np.testing.assert_equal(a, _reference(self.paths[0]))
+        np.testing.assert_equal(a, b)
+        self.assertEqual(len(cache), 1)
+
+        invalid = osp.join(self.tmpdir, 'invalid.jpg')
+        with open(invalid, 'wb') as f:
+            f.write(b'not an image')
+        self.assertIsNone(cache.imread(invalid, TRANSFORMS))
+        self.assertIsNone(cache.imread(osp.join(self.tmpdir, 'missing.jpg'), TRANSFORMS))
+        self.assertEqual(len(cache), 1)
+        cache.close()
+
+    def test_eviction(self):
+        cache = PreprocessedImageCache(self.root, max_size=6 * 24 * 24 * 3, nr_shards=2, touch_interval=1)
+        for path in self.paths:
+            cache.imread(path, TRANSFORMS)
+            cache.imread(self.paths[0], TRANSFORMS)  # keep the first image recently used.
+        self.assertLessEqual(cache.size, cache.max_size)
+        self.assertIn(self._key(cache, self.paths[0]), cache)
+        self.assertIn(self._key(cache, self.paths[-1]), cache)
+        self.assertNotIn(self._key(cache, self.paths[1]), cache)
+        for path in self.paths:
+            np.testing.assert_equal(cache.imread(path, TRANSFORMS), _reference(path))
+        cache.close()
+
+    def test_threads(self):
+        # A small budget, so that the shards are compacted while other threads are reading.
+        cache = PreprocessedImageCache(self.root, max_size=4 * 24 * 24 * 3, nr_shards=2, touch_interval=2)
+        references = [_reference(p) for p in self.paths]
+        errors = []
+
+        def worker(seed):
+            rng = np.random.RandomState(seed)
+            try:
+                for _ in range(100):
+                    i = rng.randint(len(self.paths))
+                    np.testing.assert_equal(cache.imread(self.paths[i], TRANSFORMS), references[i])
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i, )) for i in range(4)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.assertEqual(errors, [])
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
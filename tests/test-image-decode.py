@@ -0,0 +1,111 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-image-decode.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import io
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from jacinle.image.decode import get_jpeg_size, get_jpeg_orientation, imdecode_resize, ImageDecodePool
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def _encode(img, format='JPEG', orientation=None):
+    kwargs = dict()
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        kwargs['exif'] = exif
+    f = io.BytesIO()
+    Image.fromarray(img).save(f, format, quality=95, **kwargs)
+    return f.getvalue()
+
+
+@unittest.skipIf(Image is None, 'PIL is not installed.')
+class TestImageDecode(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.img = np.array(Image.fromarray((rng.rand(30, 60, 3) * 255).astype('uint8')).resize((600, 300)))
+        self.jpeg = _encode(self.img)
+
+    def test_header(self):
+        self.assertEqual(get_jpeg_size(self.jpeg), (300, 600))
+        self.assertEqual(get_jpeg_orientation(self.jpeg), 1)
+        for orientation in (1, 3, 6, 8):
+            data = _encode(self.img, orientation=orientation)
+            self.assertEqual(get_jpeg_size(data), (300, 600))
+            self.assertEqual(get_jpeg_orientation(data), orientation)
+
+        png = _encode(self.img, 'PNG')
+        self.assertIsNone(get_jpeg_size(png))
+        self.assertEqual(get_jpeg_orientation(png), 1)
+        self.assertIsNone(get_jpeg_size(self.jpeg[:10]))
+
+    def test_imdecode_resize(self):
+        self.assertEqual(imdecode_resize(_encode(self.img, 'PNG'), (32, 48)).shape, (32, 48, 3))
+        self.assertEqual(imdecode_resize(self.jpeg, 100, mode='center_crop').shape, (100, 100, 3))
+
+        full = imdecode_resize(self.jpeg, (300, 600), reduced_decode=False)
+        self.assertLess(np.abs(full.astype('int64') - self.img[:, :, ::-1]).mean(), 10)
+
+        out = np.empty((100, 120, 3), dtype='uint8')
+        result = imdecode_resize(self.jpeg, (100, 120), out=out)
+        self.assertIs(result, out)
+        self.assertEqual(out.shape, (100, 120, 3))
+
+    def test_orientation(self):
+        for orientation in (3, 6, 8):
+            data = _encode(self.img, orientation=orientation)
+            expected = imdecode_resize(self.jpeg, (300, 600), reduced_decode=False)
+            expected = np.rot90(expected, {3: 2, 6: -1, 8: 1}[orientation])
+            shape = expected.shape[:2]
+            np.testing.assert_array_equal(imdecode_resize(data, shape, reduced_decode=False), expected)
+
+        # the displayed image is 600x300. A 140x290 target cannot be reduced (300 // 2 < 290), so the reduced decode
+        # must be identical to the full decode.
+        data = _encode(self.img, orientation=6)
+        full = imdecode_resize(data, (140, 290), reduced_decode=False)
+        np.testing.assert_array_equal(imdecode_resize(data, (140, 290)), full)
+
+    def test_pool(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            rng = np.random.RandomState(1)
+            inputs = list()
+            for i in range(6):
+                h, w = rng.randint(100, 300, size=2)
+                data = _encode((rng.rand(h, w, 3) * 255).astype('uint8'))
+                if i % 2 == 0:
+                    path = osp.join(tmpdir, '{}.jpg'.format(i))
+                    with open(path, 'wb') as f:
+                        f.write(data)
+                    inputs.append(path)
+                else:
+                    inputs.append(data)
+
+            with ImageDecodePool((64, 48), nr_workers=2, mode='center_crop') as pool:
+                batch = pool.decode(inputs)
+                self.assertEqual(batch.shape, (6, 64, 48, 3))
+                for i, x in enumerate(inputs):
+                    np.testing.assert_array_equal(batch[i], imdecode_resize(x, (64, 48), mode='center_crop'))
+                np.testing.assert_array_equal(pool.decode_async(inputs).result(), batch)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,268 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-learn-coco.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import os.path as osp
+import io
+import copy
+import json
+import random
+import shutil
+import tempfile
+import contextlib
+import unittest
+
+import numpy as np
+
+try:
+    from jaclearn.datasets.vision.coco.pycocotools.coco import COCO
+    from jaclearn.datasets.vision.coco.pycocotools.cocoindex import IndexedCOCO
+    from jaclearn.datasets.vision.coco.pycocotools.cocoeval import COCOeval
+except ImportError:  # the _mask extension is not built (see jaclearn/datasets/vision/coco/setup.py).
+    COCO = None
+
+_CAT_IDS = (1, 3, 7, 9)
+
+
+def _make_dataset(seed):
+    rng = random.Random(seed)
+    images = [{'id': i, 'width': 100, 'height': 80, 'file_name': '{}.jpg'.format(i)} for i in range(1, 40)]
+    categories = [{'id': c, 'name': 'c{}'.format(c), 'supercategory': 's'} for c in _CAT_IDS]
+    annotations = []
+    for k in range(300):
+        ann = {
+            'id': rng.randint(1, 10 ** 9), 'image_id': rng.randint(1, 35), 'category_id': rng.choice(_CAT_IDS),
+            'area': rng.random() * 1000, 'iscrowd': int(rng.random() < 0.2),
+            'bbox': [rng.random() * 50 for _ in range(4)]
+        }
+        if ann['iscrowd']:
+            ann['segmentation'] = {'size': [80, 100], 'counts': 'abc'}
+        else:
+            ann['segmentation'] = [
+                [rng.random() * 50 for _ in range(rng.choice([6, 8]))] for _ in range(rng.randint(1, 3))
+            ]
+        if k % 7 == 0:
+            ann['keypoints'] = [1, 2, 3]
+        annotations.append(ann)
+    return {'images': images, 'categories': categories, 'annotations': annotations, 'info': {}}
+
+
+@unittest.skipIf(COCO is None, 'The COCO API extension is not built.')
+class TestIndexedCOCO(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.annotation_file = osp.join(self.tmpdir, 'annotations.json')
+        with open(self.annotation_file, 'w') as f:
+            json.dump(_make_dataset(0), f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_indexed_coco(self):
+        reference = COCO(self.annotation_file)
+        cache_file = osp.join(self.tmpdir, 'annotations.npz')
+        for coco in (IndexedCOCO(self.annotation_file, cache_file), IndexedCOCO(self.annotation_file, cache_file)):
+            for query in [
+                dict(), dict(imgIds=[3, 5, 1]), dict(catIds=[3]), dict(iscrowd=1), dict(imgIds=7),
+                dict(imgIds=[2, 99], catIds=[1, 9], areaRng=[100, 600], iscrowd=0)
+            ]:
+                self.assertEqual(coco.getAnnIds(**query), reference.getAnnIds(**query), query)
+            for query in [
+                dict(), dict(catIds=[1]), dict(catIds=[1, 3]), dict(imgIds=[1, 2, 3], catIds=3), dict(imgIds=[4, 2])
+            ]:
+                self.assertEqual(sorted(coco.getImgIds(**query)), sorted(reference.getImgIds(**query)), query)
+
+            ids = reference.getAnnIds()
+            self.assertEqual(coco.loadAnns(ids), reference.loadAnns(ids))
+            self.assertEqual(coco.loadAnns(ids[3]), reference.loadAnns(ids[3]))
+            self.assertEqual(len(coco.anns), len(reference.anns))
+            self.assertEqual(coco.anns[ids[5]], reference.anns[ids[5]])
+            self.assertEqual(coco.imgToAnns[4], reference.imgToAnns[4])
+            self.assertEqual(coco.catToImgs[7], reference.catToImgs[7])
+            self.assertEqual(coco.getCatIds(), reference.getCatIds())
+            self.assertEqual(coco.loadImgs([1, 2]), reference.loadImgs([1, 2]))
+            self.assertEqual(coco.annToRLE(coco.anns[ids[0]]), reference.annToRLE(reference.anns[ids[0]]))
+
+
+
+def _make_detections(seed, keypoints=False):
+    rng = random.Random(seed)
+    images = [{'id': i, 'width': 200, 'height': 200} for i in range(1, 31)]
+    categories = [{'id': c, 'name': str(c)} for c in (1, 2, 5)]
+    gts, dts = list(), list()
+
+    def box():
+        x, y = rng.uniform(0, 150), rng.uniform(0, 150)
+        w, h = rng.choice([rng.uniform(2, 30), rng.uniform(20, 120)]), rng.uniform(2, 80)
+        return [round(x, 1), round(y, 1), round(w, 1), round(h, 1)]
+
+    def kps(x, y, w, h, v):
+        return sum([[rng.uniform(x, x + w), rng.uniform(y, y + h), v] for _ in range(17)], [])
+
+    for image in images:
+        for _ in range(rng.randint(0, 6)):
+            b = box()
+            x, y, w, h = b
+            gt = {
+                'id': len(gts) + 1, 'image_id': image['id'], 'category_id': rng.choice([1, 2, 5]), 'bbox': b,
+                'area': w * h, 'iscrowd': int(rng.random() < 0.15),
+                'segmentation': [[x, y, x + w, y, x + w, y + h, x, y + h]]
+            }
+            if keypoints:
+                gt['keypoints'] = kps(x, y, w, h, 2)
+                gt['num_keypoints'] = 17
+            gts.append(gt)
+            for _ in range(rng.randint(0, 3)):
+                nb = [v + rng.uniform(-5, 5) for v in b]
+                nb[2], nb[3] = abs(nb[2]) + 1, abs(nb[3]) + 1
+                category = gt['category_id'] if rng.random() < 0.8 else rng.choice([1, 2, 5])
+                dt = {'image_id': image['id'], 'category_id': category, 'bbox': nb, 'score': round(rng.random(), 2)}
+                if keypoints:
+                    dt['keypoints'] = [
+                        v + rng.uniform(-3, 3) if i % 3 < 2 else v for i, v in enumerate(gt['keypoints'])
+                    ]
+                dts.append(dt)
+        for _ in range(rng.randint(0, 3)):
+            dt = {
+                'image_id': image['id'], 'category_id': rng.choice([1, 2, 5]), 'bbox': box(),
+                'score': round(rng.random(), 2)
+            }
+            if keypoints:
+                dt['keypoints'] = kps(0, 0, 200, 200, 1)
+            dts.append(dt)
+    return {'images': images, 'categories': categories, 'annotations': gts}, dts
+
+
+def _reference_accumulate(E):
+    """The per-category loop of COCOeval.accumulate, before it was vectorized."""
+    p = E.params
+    T, R, K, A, M = len(p.iouThrs), len(p.recThrs), len(p.catIds) if p.useCats else 1, len(p.areaRng), len(p.maxDets)
+    precision, recall, scores = -np.ones((T, R, K, A, M)), -np.ones((T, K, A, M)), -np.ones((T, R, K, A, M))
+    I0 = len(p.imgIds)
+    for k in range(K):
+        for a in range(A):
+            for m, maxDet in enumerate(p.maxDets):
+                es = [E.evalImgs[k * A * I0 + a * I0 + i] for i in range(I0)]
+                es = [e for e in es if e is not None]
+                if len(es) == 0:
+                    continue
+                dtScores = np.concatenate([e['dtScores'][0:maxDet] for e in es])
+                inds = np.argsort(-dtScores, kind='mergesort')
+                dtScoresSorted = dtScores[inds]
+                dtm = np.concatenate([e['dtMatches'][:, 0:maxDet] for e in es], axis=1)[:, inds]
+                dtIg = np.concatenate([e['dtIgnore'][:, 0:maxDet] for e in es], axis=1)[:, inds]
+                gtIg = np.concatenate([e['gtIgnore'] for e in es])
+                npig = np.count_nonzero(gtIg == 0)
+                if npig == 0:
+                    continue
+                tp_sum = np.cumsum(np.logical_and(dtm, np.logical_not(dtIg)), axis=1).astype(float)
+                fp_sum = np.cumsum(np.logical_and(np.logical_not(dtm), np.logical_not(dtIg)), axis=1).astype(float)
+                for t, (tp, fp) in enumerate(zip(tp_sum, fp_sum)):
+                    nd = len(tp)
+                    rc = tp / npig
+                    pr = (tp / (fp + tp + np.spacing(1))).tolist()
+                    q, ss = np.zeros((R,)).tolist(), np.zeros((R,))
+                    recall[t, k, a, m] = rc[-1] if nd else 0
+                    for i in range(nd - 1, 0, -1):
+                        if pr[i] > pr[i - 1]:
+                            pr[i - 1] = pr[i]
+                    try:
+                        for ri, pi in enumerate(np.searchsorted(rc, p.recThrs, side='left')):
+                            q[ri] = pr[pi]
+                            ss[ri] = dtScoresSorted[pi]
+                    except IndexError:
+                        pass
+                    precision[t, :, k, a, m] = np.array(q)
+                    scores[t, :, k, a, m] = ss
+    return precision, recall, scores
+
+
+@unittest.skipIf(COCO is None, 'The COCO API extension is not built.')
+class TestCOCOeval(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _load(self, seed, keypoints):
+        dataset, detections = _make_detections(seed, keypoints)
+        with open(osp.join(self.tmpdir, 'gt.json'), 'w') as f:
+            json.dump(dataset, f)
+        with open(osp.join(self.tmpdir, 'dt.json'), 'w') as f:
+            json.dump(detections, f)
+        with contextlib.redirect_stdout(io.StringIO()):
+            gt = COCO(osp.join(self.tmpdir, 'gt.json'))
+            dt = gt.loadRes(osp.join(self.tmpdir, 'dt.json'))
+        return gt, dt
+
+    def _evaluate(self, gt, dt, iou_type, use_cats, accumulate=True, **kwargs):
+        E = COCOeval(copy.deepcopy(gt), copy.deepcopy(dt), iou_type)
+        E.params.useCats = use_cats
+        with contextlib.redirect_stdout(io.StringIO()):
+            E.evaluate(**kwargs)
+            if accumulate:
+                E.accumulate()
+                E.summarize()
+        return E
+
+    def assertEvalImgEqual(self, a, b):
+        self.assertEqual(a is None, b is None)
+        if a is not None:
+            self.assertEqual(set(a.keys()), set(b.keys()))
+            for k in a:
+                np.testing.assert_array_equal(np.asarray(a[k]), np.asarray(b[k]), err_msg=k)
+
+    def test_batch_iou(self):
+        gt, dt = self._load(0, False)
+        for use_cats in (1, 0):
+            E = self._evaluate(gt, dt, 'bbox', use_cats)
+            keys = list(E.ious.keys())
+            batched = E.computeBatchIoU(keys)
+            for k in keys:
+                np.testing.assert_allclose(np.asarray(batched[k]), np.asarray(E.computeIoU(*k)), err_msg=str(k))
+
+    def test_evaluate(self):
+        for seed in range(2):
+            for iou_type, keypoints in (('bbox', False), ('segm', False), ('keypoints', True)):
+                gt, dt = self._load(seed, keypoints)
+                for use_cats in ((1, 0) if iou_type != 'keypoints' else (1, )):
+                    # accumulate() overwrites params.catIds when useCats == 0, so check the per-image results first.
+                    E = self._evaluate(gt, dt, iou_type, use_cats, accumulate=False)
+                    p = E.params
+                    cat_ids = p.catIds if use_cats else [-1]
+                    I, A = len(p.imgIds), len(p.areaRng)
+                    for k, cat_id in enumerate(cat_ids):
+                        for a, area_range in enumerate(p.areaRng):
+                            for i, img_id in enumerate(p.imgIds):
+                                self.assertEvalImgEqual(
+                                    E.evalImgs[k * A * I + a * I + i],
+                                    E.evaluateImg(img_id, cat_id, area_range, p.maxDets[-1])
+                                )
+
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        E.accumulate()
+                    precision, recall, scores = _reference_accumulate(E)
+                    np.testing.assert_array_equal(E.eval['precision'], precision)
+                    np.testing.assert_array_equal(E.eval['recall'], recall)
+                    np.testing.assert_array_equal(E.eval['scores'], scores)
+
+    def test_parallel_evaluate(self):
+        gt, dt = self._load(1, False)
+        serial = self._evaluate(gt, dt, 'bbox', 1)
+        parallel = self._evaluate(gt, dt, 'bbox', 1, nrWorkers=2)
+        self.assertEqual(len(serial.evalImgs), len(parallel.evalImgs))
+        for a, b in zip(serial.evalImgs, parallel.evalImgs):
+            self.assertEvalImgEqual(a, b)
+        np.testing.assert_array_equal(serial.eval['precision'], parallel.eval['precision'])
+        np.testing.assert_array_equal(serial.stats, parallel.stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
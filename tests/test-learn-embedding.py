@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-learn-embedding.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import os
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import jaclearn.embedding.word_embedding as word_embedding
+
+
+class TestWordEmbedding(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = osp.join(self.tmpdir, 'embedding.txt')
+        rng = np.random.RandomState(0)
+        lines = []
+        for i in range(237):
+            lines.append('word{} '.format(i) + ' '.join('{:.6f}'.format(x) for x in rng.randn(5)))
+        lines.insert(17, 'broken 1.0 2.0')  # invalid entry (vector length)
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_binary_cache(self):
+        embeddings, word2idx = word_embedding.load(self.path)
+        for chunk_size in (1, 10, 64, 1000):
+            prefix = osp.join(self.tmpdir, 'chunk{}'.format(chunk_size))
+            word_embedding.convert_to_binary(self.path, prefix, chunk_size=chunk_size)
+            cached_embeddings, cached_word2idx = word_embedding.load_binary(prefix)
+            self.assertEqual(cached_word2idx, word2idx)
+            np.testing.assert_allclose(cached_embeddings, embeddings, rtol=1e-6)
+
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), sorted(
+            ['embedding.txt'] + ['chunk{}{}'.format(c, s) for c in (1, 10, 64, 1000) for s in ('.npy', '.vocab.txt')]
+        ))
+
+    def test_load_cache(self):
+        embeddings, word2idx = word_embedding.load(self.path)
+        for _ in range(2):  # convert, then reuse the cache.
+            cached_embeddings, cached_word2idx = word_embedding.load(self.path, cache=True)
+            self.assertEqual(cached_word2idx, word2idx)
+            np.testing.assert_allclose(cached_embeddings, embeddings, rtol=1e-6)
+        self.assertEqual(word_embedding.load(self.path, word_index_only=True, cache=True), word2idx)
+
+    def test_shifted_rows(self):
+        with open(self.path, 'w') as f:
+            f.write('a 1 2 3\nb 4 5 6 7\nc 8 9\nd 10 11 12\n')
+        cached_embeddings, cached_word2idx = word_embedding.load(self.path, cache=True)
+        self.assertEqual(cached_word2idx, {'a': 1, 'd': 2, word_embedding.EBD_ALL_ZEROS: 0, word_embedding.EBD_UNKNOWN: 3})
+        np.testing.assert_allclose(cached_embeddings[1:3], [[1, 2, 3], [10, 11, 12]])
+
+
+class TestWordIndexMapper(unittest.TestCase):
+    def setUp(self):
+        words = ['the', 'fox', 'Jumps', '0', '0.5', 'dog', '–']
+        self.word2idx = {w: i + 1 for i, w in enumerate(words)}
+        self.word2idx[word_embedding.EBD_ALL_ZEROS] = 0
+        self.word2idx[word_embedding.EBD_UNKNOWN] = len(words) + 1
+        self.corpus = ['The', 'fox', 'fox.', '"dog"', 'Jumps', 'JUMPS', '12', '3.14', '&ndash;', 'cat', 'the', '', 'FOX']
+
+    def test_map(self):
+        reference = word_embedding.map_sequence(self.corpus, self.word2idx)
+        for max_cache_size in (None, 3):
+            mapper = word_embedding.WordIndexMapper(self.word2idx, max_cache_size=max_cache_size)
+            for _ in range(2):  # the second pass hits the cache.
+                self.assertEqual(mapper.map_sequence(self.corpus).tolist(), reference)
+                self.assertEqual([mapper.map(w) for w in self.corpus], reference)
+
+    def test_map_batch(self):
+        mapper = word_embedding.WordIndexMapper(self.word2idx)
+        batch = [self.corpus[:3], [], self.corpus[3:]]
+        for max_length in (None, 4):
+            output, lengths = mapper.map_batch(batch, max_length=max_length)
+            self.assertEqual(output.shape, (3, max_length or len(self.corpus) - 3))
+            for i, seq in enumerate(batch):
+                seq = seq[:output.shape[1]]
+                self.assertEqual(lengths[i], len(seq))
+                self.assertEqual(output[i, :len(seq)].tolist(), word_embedding.map_sequence(seq, self.word2idx))
+                self.assertTrue((output[i, len(seq):] == 0).all())
+
+    def test_build_submatrix(self):
+        embeddings = np.random.RandomState(0).randn(len(self.word2idx), 4)
+        mapper = word_embedding.WordIndexMapper(self.word2idx)
+        submatrix, word2idx = mapper.build_submatrix(embeddings, self.corpus)
+        self.assertEqual(word2idx[word_embedding.EBD_ALL_ZEROS], 0)
+        self.assertEqual(word2idx[word_embedding.EBD_UNKNOWN], len(submatrix) - 1)
+        np.testing.assert_equal(submatrix[-1], embeddings[-1])
+        for w in self.corpus:
+            np.testing.assert_equal(submatrix[word2idx[w]], embeddings[word_embedding.map(w, self.word2idx)])
+
+
+if __name__ == '__main__':
+    unittest.main()
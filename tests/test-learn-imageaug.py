@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-learn-imageaug.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import unittest
+
+import numpy as np
+
+from jacinle.image import imgproc
+from jaclearn.imageaug.batch import compose_color_transform, sample_color_transform, batch_color_augment
+
+
+def _reference_transform(imgs, matrix, offset):
+    out = np.einsum('nhwc,ndc->nhwd', imgs.astype('float64'), matrix) + offset[:, None, None]
+    return np.clip(out, 0, 255)
+
+
+class TestColorTransform(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.imgs = rng.randint(0, 256, size=(6, 20, 30, 3)).astype('uint8')
+        self.matrix = 1 + 0.3 * rng.randn(6, 3, 3)
+        self.offset = 10 * rng.randn(6, 3)
+
+    def test_compose(self):
+        # the composed transform equals the (unclipped) jitters of imgproc, applied one after another.
+        rng = np.random.RandomState(1)
+        imgs = self.imgs.astype('float64')
+        n = len(imgs)
+        brightness, contrast, saturation = [1 + 0.4 * (rng.rand(n) * 2 - 1) for _ in range(3)]
+        order = np.argsort(rng.rand(n, 3), axis=1)
+        lighting = rng.randn(n, 3)
+        ops = [
+            (imgproc.brightness.__wrapped__, brightness),
+            (imgproc.contrast.__wrapped__, contrast),
+            (imgproc.saturation.__wrapped__, saturation)
+        ]
+
+        means = imgs.reshape(n, -1, 3).mean(axis=1)
+        matrix, offset = compose_color_transform(means, brightness, contrast, saturation, order, lighting)
+        for i in range(n):
+            y = imgs[i]
+            for op in order[i]:
+                func, alpha = ops[op]
+                y = func(y, alpha[i])
+            y = y + lighting[i]
+            np.testing.assert_allclose(imgs[i] @ matrix[i].T + offset[i], y)
+
+    def test_color_transform(self):
+        out = imgproc.color_transform(self.imgs, self.matrix, self.offset, chunk_size=4)
+        self.assertEqual(out.dtype, np.uint8)
+        ref = _reference_transform(self.imgs, self.matrix, self.offset).astype('uint8')
+        self.assertLessEqual(np.abs(out.astype('int64') - ref).max(), 1)
+
+        out = np.empty(self.imgs.shape, dtype='float32')
+        out = imgproc.color_transform(self.imgs, self.matrix, self.offset, out=out)
+        self.assertEqual(out.dtype, np.float32)
+        np.testing.assert_allclose(out, _reference_transform(self.imgs, self.matrix, self.offset), atol=1e-3)
+
+        single = imgproc.color_transform(self.imgs[2], self.matrix[2], self.offset[2])
+        self.assertEqual(single.shape, self.imgs[2].shape)
+        np.testing.assert_array_equal(single, imgproc.color_transform(self.imgs, self.matrix, self.offset)[2])
+
+    def test_color_transform_lut(self):
+        # diagonal matrices on uint8 images use the lookup tables.
+        matrix = np.stack([np.diag(np.diag(m)) for m in self.matrix])
+        out = imgproc.color_transform(self.imgs, matrix, self.offset)
+        ref = _reference_transform(self.imgs, matrix, self.offset).astype('uint8')
+        self.assertLessEqual(np.abs(out.astype('int64') - ref).max(), 1)
+
+        imgs = self.imgs.copy()
+        result = imgproc.color_transform(imgs, matrix, self.offset, out=imgs)
+        self.assertIs(result, imgs)
+        np.testing.assert_array_equal(imgs, out)
+
+    def test_batch_color_augment(self):
+        means = self.imgs.reshape(len(self.imgs), -1, 3).mean(axis=1)
+        matrix, offset = sample_color_transform(means, rng=np.random.RandomState(2))
+        out = batch_color_augment(self.imgs, rng=np.random.RandomState(2))
+        self.assertEqual(out.shape, self.imgs.shape)
+        self.assertEqual(out.dtype, np.uint8)
+        np.testing.assert_array_equal(out, imgproc.color_transform(self.imgs, matrix, offset))
+
+        out = batch_color_augment(self.imgs, brightness=0, contrast=0, saturation=0, lighting=0)
+        np.testing.assert_array_equal(out, self.imgs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,6 +33,21 @@ class TestPTBFormat(unittest.TestCase):
         self.assertEqual(t.to_sentence(), binarized.to_sentence())
         self.assertEqual(t.to_sentence(), balanced.to_sentence())
 
+    def test_flat_tree(self):
+        t = tree.PTBNode.from_string(PTB_TESTCASE)
+        f = tree.FlatTree.from_string(PTB_TESTCASE)
+        self.assertEqual(f.to_string(), PTB_TESTCASE)
+        self.assertEqual(f.to_node().to_string(), PTB_TESTCASE)
+        self.assertEqual(f.to_sentence(), t.to_sentence())
+        self.assertEqual(f.max_depth, t.depth)
+
+        binarized = constituency.binarize_tree(t)
+        self.assertEqual(f.binarize().to_string(), binarized.to_string())
+        self.assertEqual(f.binarize().max_depth, binarized.depth)
+
+        post = [x.to_string() for x in tree.traversal(t, 'post')]
+        self.assertEqual([f.subtree(i).to_string() for i in f.traversal('post')], post)
+
     def test_ptb_mask(self):
         t = tree.PTBNode.from_string(PTB_TESTCASE)
         t = constituency.binarize_tree(t)
@@ -47,6 +62,19 @@ class TestPTBFormat(unittest.TestCase):
 
         self.assertEqual(len(tokens), 1)
         self.assertEqual(tokens[0].to_string(vtype=False), t.to_string(vtype=False))
+
+    def test_ptb_mask_batch(self):
+        t = constituency.binarize_tree(tree.PTBNode.from_string(PTB_TESTCASE))
+        balanced = constituency.make_balanced_binary_tree(['a', 'b', 'c'])
+        positions, masks, lengths = constituency.batch_compose_binary_tree_step_masks([t, balanced])
+
+        self.assertEqual(masks.shape, (2, lengths[0] - 1, lengths[0]))
+        for i, x in enumerate([t, balanced]):
+            answer = constituency.compose_bianry_tree_step_masks(x)
+            self.assertEqual(positions[i, :len(answer)].tolist(), [p for p, _ in answer])
+            for j, (_, mask) in enumerate(answer):
+                self.assertEqual(masks[i, j, :len(mask)].tolist(), mask)
+                self.assertEqual(masks[i, j, len(mask):].sum(), 0)
         
 
 if __name__ == '__main__':
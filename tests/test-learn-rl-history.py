@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-learn-rl-history.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import unittest
+import collections
+
+import numpy as np
+
+from jaclearn.rl.history import FrameHistory
+
+
+def _reference_stack(history, history_length, axis):
+    history = list(history)
+    while len(history) < history_length:
+        history.insert(0, np.zeros_like(history[-1]))
+    return np.concatenate(history, axis=axis)
+
+
+class TestFrameHistory(unittest.TestCase):
+    def _test_mode(self, mode, axis):
+        history = FrameHistory(4, axis=axis, mode=mode)
+        reference = collections.deque(maxlen=4)
+        for i in range(11):
+            frame = np.random.rand(3, 5, 2).astype('float32')
+            history.push(frame)
+            reference.append(frame)
+            np.testing.assert_array_equal(np.asarray(history.get()), _reference_stack(reference, 4, axis))
+            if i == 6:
+                history.clear()
+                reference.clear()
+
+    def test_modes(self):
+        for mode in ('copy', 'view', 'lazy'):
+            for axis in (0, 1, -1):
+                self._test_mode(mode, axis)
+
+    def test_stack(self):
+        history = FrameHistory(3, axis=0, concat=False, mode='view')
+        frames = [np.full((2, 2), i) for i in range(5)]
+        for f in frames:
+            history.push(f)
+        np.testing.assert_array_equal(history.get(), np.stack(frames[-3:], axis=0))
+
+    def test_batched(self):
+        for mode in ('copy', 'view', 'lazy'):
+            history = FrameHistory(3, batched=True, mode=mode)
+            frames = [np.random.rand(4, 2, 2) for _ in range(4)]
+            for f in frames:
+                history.push(f)
+            history.clear(indices=[1, 2], keep_last=True)
+            output = np.asarray(history.get())
+            self.assertEqual(output.shape, (4, 2, 6))
+            np.testing.assert_array_equal(output[0], np.concatenate([f[0] for f in frames[-3:]], axis=-1))
+            np.testing.assert_array_equal(output[1, :, :4], 0)
+            np.testing.assert_array_equal(output[1, :, 4:], frames[-1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
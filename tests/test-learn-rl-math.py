@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-learn-rl-math.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import unittest
+
+import numpy as np
+
+from jaclearn.rl.algo.math import discount_cumsum, compute_gae
+from jaclearn.rl.algo.math import batch_discount_cumsum, batch_compute_gae, flat_to_padded, padded_to_flat
+
+
+class TestBatchedAdvantage(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        lengths = rng.randint(1, 10, size=16)
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.rewards = rng.rand(self.offsets[-1])
+        self.values = rng.rand(self.offsets[-1])
+
+    def _segments(self):
+        return zip(self.offsets[:-1], self.offsets[1:])
+
+    def test_padded(self):
+        rewards, lengths = flat_to_padded(self.rewards, self.offsets)
+        values, _ = flat_to_padded(self.values, self.offsets)
+
+        advantages = padded_to_flat(batch_compute_gae(rewards, values, 0.9, 0.8, lengths=lengths), lengths)
+        returns = padded_to_flat(batch_discount_cumsum(rewards, 0.9, lengths=lengths), lengths)
+
+        ref_advantages = np.concatenate([compute_gae(self.rewards[a:b], self.values[a:b], 0, 0.9, 0.8) for a, b in self._segments()])
+        ref_returns = np.concatenate([discount_cumsum(self.rewards[a:b], 0.9) for a, b in self._segments()])
+        np.testing.assert_allclose(advantages, ref_advantages, rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(returns, ref_returns, rtol=1e-5, atol=1e-5)
+
+    def test_dones(self):
+        dones = np.zeros_like(self.rewards)
+        dones[self.offsets[1:] - 1] = 1
+
+        advantages = batch_compute_gae(self.rewards[np.newaxis], self.values[np.newaxis], 0.9, 0.8, dones=dones[np.newaxis])[0]
+        returns = batch_discount_cumsum(self.rewards[np.newaxis], 0.9, dones=dones[np.newaxis], next_values=[10])[0]
+
+        ref_advantages = np.concatenate([compute_gae(self.rewards[a:b], self.values[a:b], 0, 0.9, 0.8) for a, b in self._segments()])
+        ref_returns = np.concatenate([discount_cumsum(self.rewards[a:b], 0.9) for a, b in self._segments()])
+        np.testing.assert_allclose(advantages, ref_advantages, rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(returns, ref_returns, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
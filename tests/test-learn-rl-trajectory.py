@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-learn-rl-trajectory.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from jaclearn.rl.simulator import TrajectoryStore
+
+
+class TestTrajectoryStore(unittest.TestCase):
+    def test_episodes(self):
+        store = TrajectoryStore(capacity=2)
+        for i in range(5):
+            store.append(observation=np.full((2, 3), i, dtype='float32'), action=i, reward=0.5 * i)
+            if i in (1, 4):
+                store.end_episode(final_observation=np.zeros(3))
+
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store.nr_episodes, 2)
+        self.assertEqual(store.episode_lengths.tolist(), [2, 3])
+        episode = store.get_episode(1)
+        self.assertEqual(episode['observation'].shape, (3, 2, 3))
+        self.assertEqual(episode['action'].tolist(), [2, 3, 4])
+        self.assertEqual(store.episode_of([0, 1, 2, 4]).tolist(), [0, 0, 1, 1])
+
+        steps, indices = store.sample(8)
+        np.testing.assert_allclose(steps['reward'], 0.5 * indices)
+
+    def test_mixed_numeric(self):
+        store = TrajectoryStore(capacity=2)
+        store.append(reward=1, done=False)
+        store.append(reward=0.5, done=True)
+        store.extend(reward=np.array([2.25, 3.0]), done=np.array([0, 1]))
+        self.assertEqual(store.get_field('reward').dtype, np.float64)
+        self.assertEqual(store.get_field('reward').tolist(), [1, 0.5, 2.25, 3.0])
+        self.assertEqual(store.get_field('done').tolist(), [0, 1, 0, 1])
+
+    def test_object_fallback(self):
+        store = TrajectoryStore(capacity=2)
+        store.append(value=1.5, info=None)
+        store.append(value=None, info={'lives': 3})
+        store.append(value=np.zeros(2), info=None)
+        store.extend(value=[2, 3], info=[None, None])
+        value = store.get_field('value')
+        self.assertEqual(value.dtype, object)
+        self.assertEqual(value[0], 1.5)
+        self.assertIsNone(value[1])
+        self.assertEqual(value[2].tolist(), [0, 0])
+        self.assertEqual(value[3:].tolist(), [2, 3])
+        self.assertEqual(store.get_field('info')[1], {'lives': 3})
+
+    def test_dump_load(self):
+        store = TrajectoryStore()
+        store.extend(observation=np.arange(12).reshape(4, 3), info=[None, {}, None, {'a': 1}])
+        store.end_episode()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for filename in ('store.npz', 'store'):
+                loaded = TrajectoryStore.load(store.dump(osp.join(tmpdir, filename)))
+                np.testing.assert_equal(loaded.get_field('observation'), store.get_field('observation'))
+                self.assertEqual(loaded.get_field('info').tolist(), store.get_field('info').tolist())
+                self.assertEqual(loaded.episode_lengths.tolist(), [4])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,12 +8,15 @@
 # This file is part of Jacinle.
 # Distributed under terms of the MIT license.
 
+import os
+import queue
+import threading
 import unittest
 
 import numpy as np
 import torch.nn as nn
 
-from jactorch.quickstart.inference import ModelInferencer, AsyncModelInferencer, BatchedAsyncModelInferencer
+from jactorch.quickstart.inference import ModelInferencer, AsyncModelInferencer, BatchedAsyncModelInferencer, MultiProcessModelInferencer
 
 
 class SimpleModel(nn.Module):
@@ -21,12 +24,48 @@ class SimpleModel(nn.Module):
         return feed_dict['input'] + 1
 
 
+class BlockingModel(nn.Module):
+    """A model that records its inputs, and blocks until released when the input is negative."""
+
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.released = threading.Event()
+        self.inputs = []
+
+    def forward(self, feed_dict):
+        x = feed_dict['input']
+        if (x < 0).any():
+            self.entered.set()
+            self.released.wait()
+        self.inputs.extend(x.flatten().tolist())
+        if (x > 100).any():
+            raise ValueError('Invalid input.')
+        return x + 1
+
+
+class CustomError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class FailingModel(nn.Module):
+    def forward(self, feed_dict):
+        x = feed_dict['input']
+        if (x < 0).any():
+            os._exit(1)
+        if (x > 100).any():
+            raise CustomError('Invalid input.', 1)
+        return x + 1
+
+
 class TestTorchInferencer(unittest.TestCase):
     def test_basic_inference(self):
         inferencer = ModelInferencer(SimpleModel())
         with inferencer.activate():
             result = inferencer.inference(dict(input=np.zeros(1, dtype='float32')))
-        self.assertEqual(float(result), 1)
+        self.assertEqual(float(result[0]), 1)
 
     def test_async_inference(self):
         inferencer = AsyncModelInferencer(SimpleModel())
@@ -35,7 +74,7 @@ class TestTorchInferencer(unittest.TestCase):
             for i in range(16):
                 results.append(inferencer.inference(dict(input=np.zeros(1, dtype='float32') + i)))
         for i, r in enumerate(results):
-            self.assertEqual(float(r.get_result()), 1 + i)
+            self.assertEqual(float(r.get_result()[0]), 1 + i)
 
     def test_batched_async_inference(self):
         inferencer = BatchedAsyncModelInferencer(SimpleModel())
@@ -44,7 +83,99 @@ class TestTorchInferencer(unittest.TestCase):
             for i in range(16):
                 results.append(inferencer.inference(dict(input=np.zeros(1, dtype='float32') + i)))
         for i, r in enumerate(results):
-            self.assertEqual(float(r.get_result()), 1 + i)
+            self.assertEqual(float(r.get_result()[0]), 1 + i)
+
+    def test_batched_async_inference_padding(self):
+        inferencer = BatchedAsyncModelInferencer(SimpleModel(), batch_size=4, pad_value=0, unpad={None: ('input', 1)})
+        results = []
+        with inferencer.activate():
+            for i in range(16):
+                results.append(inferencer.inference(dict(input=np.zeros(i + 1, dtype='float32') + i), priority=i % 2))
+        for i, r in enumerate(results):
+            result = r.get_result()
+            self.assertEqual(result.shape, (i + 1, ))
+            self.assertTrue(np.all(result == 1 + i))
+        self.assertEqual(inferencer.get_stat()['nr_requests'], 16)
+
+    def test_batched_async_inference_priority(self):
+        model = BlockingModel()
+        inferencer = BatchedAsyncModelInferencer(model, batch_size=1, max_queue_size=4)
+        with inferencer.activate():
+            first = inferencer.inference(dict(input=np.full(1, -1, dtype='float32')))
+            model.entered.wait()
+            results = [inferencer.inference(dict(input=np.full(1, i, dtype='float32')), priority=p) for i, p in enumerate([2, 1, 2, 0])]
+            with self.assertRaises(queue.Full):
+                inferencer.inference(dict(input=np.zeros(1, dtype='float32')), block=False)
+            model.released.set()
+            first.get_result()
+            for i, r in enumerate(results):
+                self.assertEqual(float(r.get_result()[0]), 1 + i)
+        self.assertEqual(model.inputs, [-1, 3, 1, 0, 2])
+
+    def test_batched_async_inference_error(self):
+        model = BlockingModel()
+        inferencer = BatchedAsyncModelInferencer(model, batch_size=2, latency=1000)
+        with inferencer.activate():
+            results = [inferencer.inference(dict(input=np.full(1, x, dtype='float32'))) for x in (1, 101)]
+            mismatched = [inferencer.inference(dict(input=np.zeros(n, dtype='float32'))) for n in (1, 2)]
+            ok = inferencer.inference(dict(input=np.zeros(1, dtype='float32')))
+            for r in results:
+                with self.assertRaisesRegex(ValueError, 'Invalid input'):
+                    r.get_result()
+            for r in mismatched:
+                with self.assertRaises(Exception):
+                    r.get_result()
+            self.assertEqual(float(ok.get_result()[0]), 1)
+
+    def test_batched_async_inference_adaptation(self):
+        def update(batch_size, latency, exec_time, nr_requests=None):
+            nr_requests = nr_requests or batch_size
+            inferencer._update_stat([0] * nr_requests, [latency / 1000] * nr_requests, exec_time / 1000)
+            return inferencer.batch_size
+
+        def make(batch_size):
+            return BatchedAsyncModelInferencer(SimpleModel(), batch_size=batch_size, target_latency=100, max_batch_size=64, adapt_interval=1)
+
+        inferencer = make(8)
+        self.assertEqual(update(8, 200, 80), 5)  # slow execution: shrink to fit the budget (50ms).
+        inferencer = make(8)
+        self.assertEqual(update(8, 200, 10), 10)  # queueing: grow.
+        inferencer = make(8)
+        self.assertEqual(update(8, 200, 45), 8)  # queueing, but a larger batch would exceed the budget.
+        inferencer = make(8)
+        self.assertEqual(update(8, 50, 10), 9)  # well below the target: grow slowly.
+        self.assertEqual(update(9, 50, 10, nr_requests=3), 9)  # batches are not full.
+        self.assertEqual(update(9, 80, 10), 9)  # close to the target.
+
+        # Under overload, the batch size converges to the largest size that fits the budget.
+        inferencer = make(2)
+        sizes = [update(inferencer.batch_size, 200, 4 * inferencer.batch_size) for _ in range(32)]
+        self.assertEqual(sizes[-16:], [12] * 16)
+
+        stat = inferencer.get_stat()
+        self.assertEqual(stat['batch_size'], 12)
+        self.assertAlmostEqual(stat['latency_p99'], 200)
+        self.assertEqual(stat['nr_batches'], 32)
+
+    def test_multiprocess_inference(self):
+        inferencer = MultiProcessModelInferencer(SimpleModel(), nr_workers=2, nr_threads=1)
+        results = []
+        with inferencer.activate():
+            for i in range(16):
+                results.append(inferencer.inference(dict(input=np.zeros(1, dtype='float32') + i)))
+            for i, r in enumerate(results):
+                self.assertEqual(float(r.get_result()[0]), 1 + i)
+
+    def test_multiprocess_inference_error(self):
+        inferencer = MultiProcessModelInferencer(FailingModel(), nr_workers=2, nr_threads=1)
+        inferencer.POLL_INTERVAL = 0.1
+        with inferencer.activate():
+            with self.assertRaisesRegex(RuntimeError, 'CustomError: Invalid input.'):
+                inferencer.inference(dict(input=np.full(1, 101, dtype='float32'))).get_result()
+            self.assertEqual(float(inferencer.inference(dict(input=np.zeros(1, dtype='float32'))).get_result()[0]), 1)
+            with self.assertRaisesRegex(RuntimeError, 'died'):
+                inferencer.inference(dict(input=np.full(1, -1, dtype='float32'))).get_result()
+            self.assertEqual(float(inferencer.inference(dict(input=np.zeros(1, dtype='float32'))).get_result()[0]), 1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-torch-kernel.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import unittest
+
+import torch
+import jactorch.functional as F
+
+
+def _expand(f_lookup, f):
+    n, m, k = f_lookup.size(-2), f.size(-2), f.size(-1)
+    return f_lookup.unsqueeze(-2).expand(*f_lookup.size()[:-2], n, m, k), f.unsqueeze(-3).expand(*f.size()[:-2], n, m, k)
+
+
+def _reference(f_lookup, f, kernel, p=2, eps=1e-8, gamma=None):
+    if kernel == 'dot':
+        return f_lookup.matmul(f.transpose(-1, -2))
+    if kernel == 'cosine':
+        return F.normalize(f_lookup, 2, dim=-1).matmul(F.normalize(f, 2, dim=-1).transpose(-1, -2))
+    a, b = _expand(f_lookup, f)
+    if kernel == 'rbf':
+        return torch.exp(-gamma * ((a - b) ** 2).sum(dim=-1))
+    dist = (a - b).norm(p, dim=-1)
+    if kernel == 'distance':
+        return dist
+    return 1. / dist.clamp(min=eps)
+
+
+class TestTorchKernel(unittest.TestCase):
+    def _test_kernel(self, kernel, batch_size=None, memory_budget=None, **kwargs):
+        shape = (batch_size, ) if batch_size is not None else tuple()
+        f_lookup = torch.randn(*shape, 37, 6, dtype=torch.float64, requires_grad=True)
+        f = torch.randn(*shape, 29, 6, dtype=torch.float64, requires_grad=True)
+
+        out = F.pairwise_kernel(f_lookup, f, kernel, memory_budget=memory_budget, **kwargs)
+        ref = _reference(f_lookup, f, kernel, **kwargs)
+        self.assertEqual(out.size(), ref.size())
+        self.assertTrue(torch.allclose(out, ref, atol=1e-6))
+
+        grad = torch.randn_like(out)
+        grads = torch.autograd.grad(out, (f_lookup, f), grad)
+        ref_grads = torch.autograd.grad(ref, (f_lookup, f), grad)
+        for g, r in zip(grads, ref_grads):
+            self.assertTrue(torch.allclose(g, r, atol=1e-6))
+
+    def test_kernels(self):
+        for memory_budget in (None, 1024):
+            for batch_size in (None, 3):
+                self._test_kernel('dot', batch_size, memory_budget)
+                self._test_kernel('cosine', batch_size, memory_budget)
+                self._test_kernel('distance', batch_size, memory_budget, p=2)
+                self._test_kernel('distance', batch_size, memory_budget, p=1)
+                self._test_kernel('inverse_distance', batch_size, memory_budget, p=2)
+                self._test_kernel('inverse_distance', batch_size, memory_budget, p=3)
+                self._test_kernel('rbf', batch_size, memory_budget, gamma=0.1)
+
+    def test_inverse_distance(self):
+        f_lookup, f = torch.randn(10, 4), torch.randn(12, 4)
+        ref = _reference(f_lookup, f, 'inverse_distance')
+        self.assertTrue(torch.allclose(F.inverse_distance(f_lookup, f), ref, rtol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-torch-loglinear.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import unittest
+
+import torch
+import jactorch.functional as F
+
+
+def _reference(mat1, mat2):
+    """The broadcasting implementation, which materializes the [n, k, m] intermediate."""
+    return torch.logsumexp(mat1.unsqueeze(-1) + mat2.unsqueeze(-3), dim=-2)
+
+
+class TestLogMatMulExp(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+
+    def test_forward(self):
+        mat1, mat2 = torch.randn(5, 7, dtype=torch.float64) * 10, torch.randn(7, 3, dtype=torch.float64) * 10
+        reference = _reference(mat1, mat2)
+        # Small budgets: the rows and the contraction dimension are both chunked.
+        for memory_budget in (None, 8, 64, 200):
+            self.assertTrue(torch.allclose(F.logmatmulexp(mat1, mat2, memory_budget=memory_budget), reference))
+        self.assertTrue(torch.allclose(F.logmatmulexp(mat1, mat2, use_mm=True), reference))
+
+        mat1 = torch.randn(2, 4, 3, 6, dtype=torch.float64)
+        mat2 = torch.randn(6, 5, dtype=torch.float64)
+        self.assertTrue(torch.allclose(F.logmatmulexp(mat1, mat2, memory_budget=64), _reference(mat1, mat2)))
+
+    def test_batch_forward(self):
+        mat1, mat2 = torch.randn(3, 5, 7, dtype=torch.float64), torch.randn(3, 7, 4, dtype=torch.float64)
+        reference = _reference(mat1, mat2)
+        for memory_budget in (None, 64):
+            self.assertTrue(torch.allclose(F.batch_logmatmulexp(mat1, mat2, memory_budget=memory_budget), reference))
+        self.assertTrue(torch.allclose(F.batch_logmatmulexp(mat1, mat2, use_mm=True), reference))
+
+    def test_gradcheck(self):
+        mat1 = torch.randn(4, 6, dtype=torch.float64, requires_grad=True)
+        mat2 = torch.randn(6, 3, dtype=torch.float64, requires_grad=True)
+        for memory_budget in (None, 16, 64):
+            self.assertTrue(torch.autograd.gradcheck(lambda a, b: F.logmatmulexp(a, b, memory_budget=memory_budget), (mat1, mat2)))
+
+        mat1 = torch.randn(2, 4, 6, dtype=torch.float64, requires_grad=True)
+        mat2 = torch.randn(2, 6, 3, dtype=torch.float64, requires_grad=True)
+        self.assertTrue(torch.autograd.gradcheck(lambda a, b: F.batch_logmatmulexp(a, b, memory_budget=32), (mat1, mat2)))
+
+    def test_gradgradcheck(self):
+        mat1 = torch.randn(4, 6, dtype=torch.float64, requires_grad=True)
+        mat2 = torch.randn(6, 3, dtype=torch.float64, requires_grad=True)
+        for memory_budget in (None, 16):
+            self.assertTrue(torch.autograd.gradgradcheck(lambda a, b: F.logmatmulexp(a, b, memory_budget=memory_budget), (mat1, mat2)))
+
+        mat1 = torch.randn(2, 4, 6, dtype=torch.float64, requires_grad=True)
+        mat2 = torch.randn(2, 6, 3, dtype=torch.float64, requires_grad=True)
+        self.assertTrue(torch.autograd.gradgradcheck(lambda a, b: F.batch_logmatmulexp(a, b, memory_budget=32), (mat1, mat2)))
+
+    def test_inf(self):
+        mat1 = torch.randn(4, 6, dtype=torch.float64)
+        mat2 = torch.randn(6, 3, dtype=torch.float64)
+        mat1[0] = float('-inf')  # an all -inf row.
+        mat1[1, :4] = float('-inf')  # -inf in the first chunks only.
+        mat2[:, 2] = float('-inf')  # an all -inf column.
+        mat1.requires_grad_()
+        mat2.requires_grad_()
+
+        output = F.logmatmulexp(mat1, mat2, memory_budget=16)
+        reference = _reference(mat1.detach(), mat2.detach())
+        self.assertTrue(torch.equal(torch.isinf(output), torch.isinf(reference)))
+        finite = torch.isfinite(reference)
+        self.assertTrue(torch.allclose(output[finite], reference[finite]))
+
+        output.masked_fill(torch.isinf(output), 0).sum().backward()
+        self.assertFalse(torch.isnan(mat1.grad).any() or torch.isnan(mat2.grad).any())
+        self.assertEqual(mat1.grad[0].abs().sum().item(), 0)
+        self.assertEqual(mat2.grad[:, 2].abs().sum().item(), 0)
+
+        # The gradients of the finite part match the reference.
+        a, b = mat1.detach()[1:].requires_grad_(), mat2.detach()[:, :2].requires_grad_()
+        _reference(a, b).sum().backward()
+        self.assertTrue(torch.allclose(mat1.grad[1:], a.grad))
+        self.assertTrue(torch.allclose(mat2.grad[:, :2], b.grad))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-torch-mask.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import unittest
+
+import torch
+import jactorch.functional as F
+
+LENGTHS = [5, 3, 0, 1, 6]
+
+
+def _per_sequence(tensor, lengths, dim, func):
+    """Apply `func(seq)` to the valid part of each sequence (moved to the first dimension), one by one."""
+    output = tensor.clone()
+    for i, length in enumerate(lengths):
+        seq = tensor[i].transpose(0, dim - 1)[:length]
+        output[i].transpose(0, dim - 1)[:length] = func(seq)
+    return output
+
+
+class TestLengthMasked(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.inputs = [(torch.randn(5, 6, 3), 1), (torch.randn(5, 2, 6), 2)]
+
+    def test_reversed(self):
+        for tensor, dim in self.inputs:
+            reference = _per_sequence(tensor, LENGTHS, dim, lambda x: x.flip(0))
+            self.assertTrue(torch.equal(F.length_masked_reversed(tensor, torch.tensor(LENGTHS), dim=dim), reference))
+
+    def test_shift_roll(self):
+        def shift(x, s):
+            output = torch.full_like(x, -1)
+            if s >= 0:
+                output[s:] = x[:max(len(x) - s, 0)]
+            else:
+                output[:s] = x[-s:]
+            return output
+
+        for tensor, dim in self.inputs:
+            for s in (-2, 0, 1, 7):
+                reference = _per_sequence(tensor, LENGTHS, dim, lambda x: shift(x, s))
+                # The paddings are also filled.
+                reference = torch.where(F.length2mask(torch.tensor(LENGTHS), 6).bool().view(
+                    [5] + [6 if d == dim else 1 for d in range(1, 3)]), reference, torch.full_like(reference, -1))
+                self.assertTrue(torch.equal(F.length_masked_shift(tensor, LENGTHS, s, dim=dim, fill=-1), reference))
+
+                reference = _per_sequence(tensor, LENGTHS, dim, lambda x: x.roll(s, 0))
+                self.assertTrue(torch.equal(F.length_masked_roll(tensor, LENGTHS, s, dim=dim), reference))
+
+    def test_gather_scatter_last(self):
+        for tensor, dim in self.inputs:
+            output = F.length_masked_gather_last(tensor, LENGTHS, dim=dim)
+            for i, length in enumerate(LENGTHS):
+                self.assertTrue(torch.equal(output[i], tensor[i].select(dim - 1, max(length - 1, 0))))
+
+            values = torch.randn_like(output)
+            output = F.length_masked_scatter_last(tensor, LENGTHS, values, dim=dim)
+            reference = tensor.clone()
+            for i, length in enumerate(LENGTHS):
+                if length > 0:
+                    reference[i].select(dim - 1, length - 1).copy_(values[i])
+            self.assertTrue(torch.equal(output, reference))
+
+    def test_cached_length2mask(self):
+        mask = F.cached_length2mask(torch.tensor(LENGTHS), 6)
+        self.assertTrue(torch.equal(mask, F.length2mask(torch.tensor(LENGTHS), 6)))
+        self.assertIs(F.cached_length2mask(LENGTHS, 6), mask)
+        self.assertIsNot(F.cached_length2mask(LENGTHS, 7), mask)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-torch-monitor.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import unittest
+
+import torch
+import torch.nn as nn
+
+from jacinle.utils.meter import GroupMeters
+from jactorch.train.monitor import monitor_param_rms, monitor_param_gradrms, monitor_param_gradrms_ratio, ParamStatMonitor
+
+
+def _rms(t):
+    return float((t ** 2).mean() ** 0.5)
+
+
+def _cat(tensors):
+    return torch.cat([t.reshape(-1) for t in tensors])
+
+
+class TestParamStatMonitor(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = nn.Sequential(nn.Linear(4, 8), nn.ReLU(), nn.Linear(8, 2))
+        self.model(torch.randn(3, 4)).sum().backward()
+        self.model[2].bias.grad = None
+
+    def test_functions(self):
+        rms, gradrms, ratio = monitor_param_rms(self.model), monitor_param_gradrms(self.model), monitor_param_gradrms_ratio(self.model)
+        for name, p in self.model.named_parameters():
+            self.assertAlmostEqual(rms['param/rms/' + name], _rms(p), places=5)
+            if p.grad is not None:
+                self.assertAlmostEqual(gradrms['param/gradrms/' + name], _rms(p.grad), places=5)
+                self.assertAlmostEqual(ratio['param/gradrmsratio/' + name], _rms(p.grad) / _rms(p), places=4)
+            else:
+                self.assertNotIn('param/gradrms/' + name, gradrms)
+                self.assertNotIn('param/gradrmsratio/' + name, ratio)
+
+    def test_per_param(self):
+        monitor = ParamStatMonitor(self.model, stats=ParamStatMonitor.__stats__)
+        output = monitor()
+        for name, p in self.model.named_parameters():
+            self.assertAlmostEqual(output['param/rms/' + name], _rms(p), places=5)
+            self.assertAlmostEqual(output['param/norm/' + name], float(p.norm()), places=5)
+            if p.grad is not None:
+                self.assertAlmostEqual(output['param/gradnorm/' + name], float(p.grad.norm()), places=5)
+                self.assertAlmostEqual(output['param/gradrmsratio/' + name], _rms(p.grad) / _rms(p), places=4)
+            else:
+                self.assertNotIn('param/gradrms/' + name, output)
+
+    def test_groups(self):
+        monitor = ParamStatMonitor(
+            self.model, interval=2, groups={'first': '0.*', 'second': ['2.weight', '2.bias']},
+            stats=ParamStatMonitor.__stats__
+        )
+        meters = GroupMeters()
+        output = monitor(meters)
+        self.assertIsNone(monitor(meters))
+        self.assertIsNotNone(monitor(meters))
+        self.assertIn('param/rms/first', meters.val)
+
+        first, second = self.model[0], self.model[2]
+        self.assertAlmostEqual(output['param/rms/first'], _rms(_cat(first.parameters())), places=5)
+        self.assertAlmostEqual(output['param/rms/second'], _rms(_cat(second.parameters())), places=5)
+        self.assertAlmostEqual(output['param/gradrms/second'], _rms(second.weight.grad), places=5)
+        # Only the parameters with gradients are used in the ratio.
+        self.assertAlmostEqual(output['param/gradrmsratio/second'], _rms(second.weight.grad) / _rms(second.weight), places=4)
+
+    def test_refresh(self):
+        monitor = ParamStatMonitor(self.model, groups={'second': '2.*'}, stats=('rms', ))
+        self.model[2] = nn.Linear(8, 2)
+        self.assertAlmostEqual(monitor()['param/rms/second'], _rms(_cat(self.model[2].parameters())), places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
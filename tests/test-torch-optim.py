@@ -0,0 +1,193 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-torch-optim.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import io
+import unittest
+
+import torch
+import torch.nn as nn
+
+from jactorch.optim import AccumGrad, AdamW
+
+
+class _Model(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.fc1 = nn.Linear(4, 8)
+        self.fc2 = nn.Linear(8, 2)
+        self.unused = nn.Parameter(torch.ones(3))
+
+    def forward(self, x):
+        return self.fc2(self.fc1(x).relu())
+
+
+def _make_model():
+    torch.manual_seed(1)
+    return _Model()
+
+
+class TestAccumGrad(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.data = [torch.randn(3, 4) for _ in range(12)]
+
+    def _run_reference(self, model, optimizer, nr_acc, max_grad_norm=None):
+        for i in range(0, len(self.data), nr_acc):
+            optimizer.zero_grad()
+            for x in self.data[i:i + nr_acc]:
+                (model(x).sum() / nr_acc).backward()
+            if max_grad_norm is not None:
+                nn.utils.clip_grad_norm_(model.parameters(), max_grad_norm)
+            optimizer.step()
+
+    def _run_accum(self, model, optimizer):
+        for x in self.data:
+            optimizer.zero_grad()
+            model(x).sum().backward()
+            optimizer.step()
+
+    def _assert_same(self, m1, m2):
+        for (name, a), b in zip(m1.named_parameters(), m2.parameters()):
+            self.assertTrue(torch.allclose(a, b, atol=1e-6), name)
+
+    def test_accum_grad(self):
+        for max_grad_norm in (None, 0.5):
+            m1, m2 = _make_model(), _make_model()
+            self._run_reference(m1, torch.optim.SGD(m1.parameters(), lr=0.1, weight_decay=0.5), 3, max_grad_norm)
+            self._run_accum(m2, AccumGrad(torch.optim.SGD(m2.parameters(), lr=0.1, weight_decay=0.5), 3, max_grad_norm=max_grad_norm))
+            self._assert_same(m1, m2)
+            # The unused parameter is not touched by the weight decay.
+            self.assertEqual(m2.unused.tolist(), [1, 1, 1])
+            self.assertIsNone(m2.unused.grad)
+
+    def test_state_dict(self):
+        m1, m2 = _make_model(), _make_model()
+        self._run_accum(m1, AccumGrad(torch.optim.SGD(m1.parameters(), lr=0.1), 3))
+
+        optimizer = AccumGrad(torch.optim.SGD(m2.parameters(), lr=0.1), 3)
+        data = self.data
+        self.data = data[:4]
+        self._run_accum(m2, optimizer)
+        state_dict = optimizer.state_dict()
+        optimizer = AccumGrad(torch.optim.SGD(m2.parameters(), lr=0.1), 3)
+        optimizer.load_state_dict(state_dict)
+        # Re-save the loaded state before any step: the accumulated gradients are kept.
+        state_dict = optimizer.state_dict()
+        self.assertIsNotNone(state_dict['grad_buffers'])
+        optimizer = AccumGrad(torch.optim.SGD(m2.parameters(), lr=0.1), 3)
+        optimizer.load_state_dict(state_dict)
+        self.data = data[4:]
+        self._run_accum(m2, optimizer)
+        self._assert_same(m1, m2)
+
+    def test_param_change(self):
+        m1, m2 = _make_model(), _make_model()
+        o1 = torch.optim.SGD(m1.fc1.parameters(), lr=0.1)
+        o2 = AccumGrad(torch.optim.SGD(m2.fc1.parameters(), lr=0.1), 3)
+        self._run_reference(m1, o1, 3)
+        self._run_accum(m2, o2)
+        # Same number of parameters, but different tensors.
+        o1.param_groups[0]['params'] = list(m1.fc2.parameters())
+        o2.param_groups[0]['params'] = list(m2.fc2.parameters())
+        self._run_reference(m1, o1, 3)
+        self._run_accum(m2, o2)
+        self._assert_same(m1, m2)
+
+
+def _make_mlp():
+    torch.manual_seed(1)
+    return nn.Sequential(nn.Linear(4, 8), nn.ReLU(), nn.Linear(8, 2)).double()
+
+
+def _param_groups(model, cls, **kwargs):
+    groups = [{'params': list(model[0].parameters())}, {'params': list(model[2].parameters()), 'lr': 1e-2}]
+    return cls(groups, **kwargs)
+
+
+class TestAdamW(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.data = [torch.randn(3, 4).double() for _ in range(10)]
+
+    def _run(self, model, optimizer, skip_grads=True, reload_at=None, reload_foreach=None):
+        for k, x in enumerate(self.data):
+            optimizer.zero_grad()
+            model(x).sum().backward()
+            if skip_grads and k % 3 == 1:
+                model[2].bias.grad = None
+            optimizer.step()
+            if k == reload_at:
+                f = io.BytesIO()
+                torch.save(optimizer.state_dict(), f)
+                f.seek(0)
+                optimizer = _param_groups(model, AdamW, weight_decay=0.1, foreach=reload_foreach)
+                optimizer.load_state_dict(torch.load(f))
+        return optimizer
+
+    def test_torch_adamw(self):
+        # without weight decay, the update is the same as torch.optim.AdamW (whose weight decay is applied before the
+        # update instead of after), up to where eps is added (torch adds it after the bias correction of the
+        # denominator); a tiny eps removes the difference.
+        for foreach in (False, True):
+            model, reference = _make_mlp(), _make_mlp()
+            optimizer = self._run(model, _param_groups(model, AdamW, eps=1e-16, foreach=foreach), skip_grads=False)
+            ref_optimizer = _param_groups(reference, torch.optim.AdamW, eps=1e-16, weight_decay=0)
+            ref_optimizer = self._run(reference, ref_optimizer, skip_grads=False)
+            for p, q in zip(model.parameters(), reference.parameters()):
+                self.assertTrue(torch.allclose(p, q, atol=1e-12))
+                self.assertEqual(optimizer.state[p]['step'], int(ref_optimizer.state[q]['step']))
+                self.assertTrue(torch.allclose(optimizer.state[p]['exp_avg'], ref_optimizer.state[q]['exp_avg']))
+
+    def test_foreach(self):
+        single, foreach = _make_mlp(), _make_mlp()
+        single_optimizer = self._run(single, _param_groups(single, AdamW, weight_decay=0.1, foreach=False))
+        foreach_optimizer = self._run(foreach, _param_groups(foreach, AdamW, weight_decay=0.1, foreach=True))
+        for p, q in zip(single.parameters(), foreach.parameters()):
+            self.assertTrue(torch.allclose(p, q, atol=1e-12))
+            # the step counts are in sync after each step, not only in the state dict.
+            self.assertEqual(single_optimizer.state[p]['step'], foreach_optimizer.state[q]['step'])
+        self.assertIsInstance(foreach_optimizer.state[foreach[2].bias]['step'], int)
+        self.assertEqual(foreach_optimizer.state[foreach[2].bias]['step'], 7)
+        self.assertEqual(foreach_optimizer.state[foreach[2].weight]['step'], 10)
+
+    def test_state_dict(self):
+        results = list()
+        for foreach in (False, True):
+            model = _make_mlp()
+            optimizer = _param_groups(model, AdamW, weight_decay=0.1, foreach=foreach)
+            self._run(model, optimizer, reload_at=5, reload_foreach=not foreach)
+            results.append(list(model.parameters()))
+        reference = _make_mlp()
+        self._run(reference, _param_groups(reference, AdamW, weight_decay=0.1, foreach=False))
+        for p, q, r in zip(*results, reference.parameters()):
+            self.assertTrue(torch.allclose(p, r, atol=1e-12))
+            self.assertTrue(torch.allclose(q, r, atol=1e-12))
+
+
+    def test_param_change(self):
+        for foreach in (False, True):
+            single, model = _make_mlp(), _make_mlp()
+            o1 = AdamW(single[0].parameters(), weight_decay=0.1, foreach=False)
+            o2 = AdamW(model[0].parameters(), weight_decay=0.1, foreach=foreach)
+            self._run(single, o1, skip_grads=False)
+            self._run(model, o2, skip_grads=False)
+            weight = model[2].weight.detach().clone()
+            # Same number of parameters, but different tensors.
+            o1.param_groups[0]['params'] = list(single[2].parameters())
+            o2.param_groups[0]['params'] = list(model[2].parameters())
+            self._run(single, o1)
+            self._run(model, o2)
+            self.assertFalse(torch.equal(model[2].weight, weight))
+            for p, q in zip(single.parameters(), model.parameters()):
+                self.assertTrue(torch.allclose(p, q, atol=1e-12))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-torch-prefetch.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import time
+import unittest
+import collections
+
+import torch
+
+from jactorch.data.prefetch import BatchPrefetcher, _map_tensors
+
+Batch = collections.namedtuple('Batch', ['image', 'label'])
+
+
+class _Interrupt(BaseException):
+    pass
+
+
+def _generate(n, delay=0, exception=None):
+    for i in range(n):
+        if delay > 0:
+            time.sleep(delay)
+        if exception is not None and i == n - 1:
+            raise exception
+        yield {'x': torch.full((2, ), float(i)), 'meta': (i, 'a')}
+
+
+class TestBatchPrefetcher(unittest.TestCase):
+    def test_staging(self):
+        def transform(batch):
+            batch['y'] = batch['x'] * 2
+            return batch
+
+        prefetcher = BatchPrefetcher(list(_generate(10)), nr_prefetch=3, transforms=[transform])
+        for epoch in range(2):
+            batches = list(prefetcher)
+            self.assertEqual([b['meta'] for b in batches], [(i, 'a') for i in range(10)])
+            self.assertEqual([b['y'][0].item() for b in batches], [2. * i for i in range(10)])
+        self.assertEqual(prefetcher.get_stat()['nr_batches'], 20)
+
+    def test_map_tensors(self):
+        batch = {'a': Batch(torch.zeros(1), 1), 'b': (torch.zeros(1), 'c'), 'c': [torch.zeros(1)]}
+        output = _map_tensors(lambda x: x + 1, batch)
+        self.assertIsInstance(output['a'], Batch)
+        self.assertIsInstance(output['b'], tuple)
+        self.assertIsInstance(output['c'], list)
+        self.assertEqual(output['a'].image.item(), 1)
+        self.assertEqual(output['a'].label, 1)
+        self.assertEqual(output['b'][1], 'c')
+
+    def test_exception(self):
+        for exception in (ValueError('bad batch'), _Interrupt()):
+            prefetcher = BatchPrefetcher(_generate(4, exception=exception))
+            iterator = iter(prefetcher)
+            self.assertEqual([next(iterator)['meta'][0] for _ in range(3)], [0, 1, 2])
+            with self.assertRaises(type(exception)):
+                next(iterator)
+            prefetcher.close()
+
+    def test_close(self):
+        prefetcher = BatchPrefetcher(_generate(100, delay=0.01), nr_prefetch=2)
+        iterator = iter(prefetcher)
+        next(iterator)
+        prefetcher.close()
+        # The old iterator stops instead of waiting for the stopped thread.
+        self.assertLessEqual(len(list(iterator)), 2)
+
+    def test_stat(self):
+        prefetcher = BatchPrefetcher(_generate(5, delay=0.05), nr_prefetch=2)
+        self.assertEqual(len(list(prefetcher)), 5)
+        stat = prefetcher.get_stat()
+        self.assertEqual(stat['nr_batches'], 5)
+        self.assertGreaterEqual(stat['nr_stalls'], 1)
+        self.assertGreater(stat['stall_time'], 0.1)
+        self.assertGreater(stat['produce_time'], 0.2)
+        prefetcher.reset_stat()
+        self.assertEqual(prefetcher.get_stat()['nr_batches'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
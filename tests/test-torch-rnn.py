@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-torch-rnn.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import unittest
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+
+from jactorch.nn.rnn_utils import PackedBatchPlan, rnn_with_length
+
+
+class TestPackedBatchPlan(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+
+    def test_pack(self):
+        for batch_first in (True, False):
+            for lengths in ([5, 3, 7, 1, 3], [7, 5, 3, 3, 1]):
+                x = torch.randn(5, 8, 4) if batch_first else torch.randn(8, 5, 4)
+                plan = PackedBatchPlan(lengths, batch_first=batch_first)
+                packed = plan.pack(x)
+                reference = pack_padded_sequence(
+                    x, torch.tensor(lengths), batch_first=batch_first, enforce_sorted=False
+                )
+                self.assertTrue(torch.equal(packed.data, reference.data))
+                self.assertTrue(torch.equal(packed.batch_sizes, reference.batch_sizes))
+
+                padded, _ = pad_packed_sequence(reference, batch_first=batch_first, total_length=8)
+                self.assertTrue(torch.equal(plan.unpack(packed, total_length=8), padded))
+                padded, _ = pad_packed_sequence(reference, batch_first=batch_first)
+                self.assertTrue(torch.equal(plan.unpack(packed), padded))
+
+    def test_rnn_with_length(self):
+        for batch_first in (True, False):
+            for lengths in ([5, 3, 7, 1, 3], [7, 5, 3, 3, 1]):
+                lengths = torch.tensor(lengths)
+                rnn = nn.LSTM(4, 6, 2, batch_first=batch_first, bidirectional=True)
+                x = torch.randn(5, 8, 4) if batch_first else torch.randn(8, 5, 4)
+                x.requires_grad_()
+                h0 = (torch.randn(4, 5, 6), torch.randn(4, 5, 6))
+
+                output, (h, c) = rnn_with_length(rnn, x, lengths, h0, batch_first=batch_first)
+                packed = pack_padded_sequence(x, lengths, batch_first=batch_first, enforce_sorted=False)
+                packed_output, (ref_h, ref_c) = rnn(packed, h0)
+                ref_output, _ = pad_packed_sequence(packed_output, batch_first=batch_first)
+                self.assertTrue(torch.allclose(output, ref_output, atol=1e-6))
+                self.assertTrue(torch.allclose(h, ref_h, atol=1e-6))
+                self.assertTrue(torch.allclose(c, ref_c, atol=1e-6))
+
+                grad = torch.randn_like(output)
+                grad1, = torch.autograd.grad(output, x, grad)
+                grad2, = torch.autograd.grad(ref_output, x, grad)
+                self.assertTrue(torch.allclose(grad1, grad2, atol=1e-6))
+
+    def test_shared_plan(self):
+        lengths = torch.tensor([4, 6, 2])
+        rnns = [nn.GRU(3, 3, batch_first=True) for _ in range(2)]
+        x = torch.randn(3, 6, 3)
+        plan = PackedBatchPlan(lengths)
+
+        f, g = x, x
+        for rnn in rnns:
+            f, _ = plan.run(rnn, f, total_length=6)
+            g, _ = rnn_with_length(rnn, g, lengths, None)
+        self.assertTrue(torch.allclose(f, g))
+        self.assertEqual(f.size(), (3, 6, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-utils-cache.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import os
+import time
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from jacinle.utils.cache import cached_property, memoize, stable_hash
+
+
+class TestMemoize(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _make(self, **kwargs):
+        calls = self.calls
+
+        def func(x, k=2):
+            calls.append(x)
+            return np.full(64, x * k)
+        return memoize(**kwargs)(func)
+
+    def test_stable_hash(self):
+        self.assertEqual(stable_hash({'x': 1, 'y': [1, 2]}), stable_hash({'y': [1, 2], 'x': 1}))
+        self.assertNotEqual(stable_hash(np.arange(3)), stable_hash(np.arange(3.)))
+        self.assertNotEqual(stable_hash(1), stable_hash(1.0))
+
+        dates = np.array(['2026-01-01', '2026-10-19'], dtype='datetime64[D]')
+        self.assertEqual(stable_hash(dates), stable_hash(dates.copy()))
+        self.assertNotEqual(stable_hash(dates), stable_hash(dates.view(np.int64)))
+        self.assertNotEqual(stable_hash(dates), stable_hash(dates.astype('datetime64[s]')))
+        self.assertNotEqual(stable_hash(dates[::-1]), stable_hash(dates))
+        self.assertEqual(stable_hash(np.diff(dates)), stable_hash(np.array([291], dtype='timedelta64[D]')))
+
+    def test_memory(self):
+        f = self._make(maxsize=2)
+        f(1), f(1, 2), f(x=1, k=2)
+        self.assertEqual(self.calls, [1])
+        f(2), f(3), f(1)  # 1 has been evicted by the LRU.
+        self.assertEqual(self.calls, [1, 2, 3, 1])
+        f.invalidate(1)
+        f(1)
+        self.assertEqual(self.calls, [1, 2, 3, 1, 1])
+        self.assertEqual(f.cache_info().hits, 2)
+
+    def test_disk_ttl(self):
+        f = self._make(maxsize=0, disk_dir=self.tmpdir, disk_ttl=0.2)
+        f(1)
+        time.sleep(0.12)
+        f(1)  # a hit does not extend the lifetime of the entry.
+        self.assertEqual(self.calls, [1])
+        time.sleep(0.12)
+        f(1)
+        self.assertEqual(self.calls, [1, 1])
+        self.assertEqual(f.cache_info().disk_hits, 1)
+
+    def test_disk_lru(self):
+        f = self._make(maxsize=0, disk_dir=self.tmpdir)
+        f(1)
+        size = sum(e.stat().st_size for e in os.scandir(self.tmpdir))
+        f = self._make(maxsize=0, disk_dir=self.tmpdir, disk_max_size=int(2.5 * size))
+        for x in (2, 1, 3):  # 1 is accessed after 2, so 2 is evicted.
+            time.sleep(0.02)
+            f(x)
+        self.assertEqual(len(os.listdir(self.tmpdir)), 2)
+        f(1), f(3)
+        self.assertEqual(self.calls, [1, 2, 3])
+        f(2)
+        self.assertEqual(self.calls, [1, 2, 3, 2])
+
+    def test_disk_version(self):
+        f = self._make(maxsize=0, disk_dir=self.tmpdir, version=1)
+        f(1)
+        self._make(maxsize=0, disk_dir=self.tmpdir, version=2)(1)
+        self.assertEqual(self.calls, [1, 1])
+        np.testing.assert_equal(self._make(maxsize=0, disk_dir=self.tmpdir, version=1)(1), f(1))
+        self.assertEqual(self.calls, [1, 1])
+
+
+
+class _Counter(object):
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+
+    @cached_property
+    def value(self):
+        """The value."""
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.calls * 10
+
+
+class _Failing(object):
+    def __init__(self):
+        self.fail = True
+
+    @cached_property
+    def value(self):
+        if self.fail:
+            raise ValueError()
+        return 1
+
+
+class TestCachedProperty(unittest.TestCase):
+    def test_cached_property(self):
+        self.assertIsInstance(_Counter.value, cached_property)
+        self.assertEqual(_Counter.value.__doc__, 'The value.')
+
+        obj = _Counter()
+        self.assertEqual(obj.value, 10)
+        self.assertEqual(obj.value, 10)
+        self.assertEqual(obj.calls, 1)
+        self.assertEqual(obj.__dict__['value'], 10)
+        self.assertEqual([k for k in obj.__dict__ if k.startswith('__cached_property_lock')], [])
+
+        _Counter.value.reset(obj)
+        self.assertNotIn('value', obj.__dict__)
+        self.assertEqual(obj.value, 20)
+        self.assertEqual(obj.calls, 2)
+        _Counter.value.reset(obj)
+        _Counter.value.reset(obj)
+
+        other = _Counter()
+        self.assertEqual(other.value, 10)
+        self.assertEqual(obj.value, 30)
+
+    def test_error(self):
+        obj = _Failing()
+        with self.assertRaises(ValueError):
+            obj.value
+        self.assertEqual([k for k in obj.__dict__ if k.startswith('__cached_property_lock')], [])
+        obj = pickle.loads(pickle.dumps(obj))
+        obj.fail = False
+        self.assertEqual(obj.value, 1)
+
+    def test_thread_safety(self):
+        obj = _Counter(delay=0.05)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(obj.value)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [10] * 8)
+        self.assertEqual(obj.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
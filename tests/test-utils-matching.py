@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File   : test-utils-matching.py
+# Author : Jiayuan Mao
+# Email  : maojiayuan@gmail.com
+# Date   : 10/19/2026
+#
+# This file is part of Jacinle.
+# Distributed under terms of the MIT license.
+
+import re
+import random
+import fnmatch
+import unittest
+
+from jacinle.utils.matching import NameMatcher
+
+_RULE_ATOMS = ['conv', 'bn', 'fc', 'weight', 'bias', 'layer1', 'Layer2', '*', '?', '[ab]*']
+_NAME_ATOMS = ['conv', 'bn', 'fc', 'weight', 'bias', 'layer1', 'layer2', 'a', 'b']
+
+
+def _sequential_match(rules, name):
+    """The reference: try the rules one by one."""
+    for r, v in rules:
+        if re.match(fnmatch.translate(r), name, flags=re.IGNORECASE):
+            return v
+    return None
+
+
+class TestNameMatcher(unittest.TestCase):
+    def test_sequential(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            rules = [('.'.join(rng.choice(_RULE_ATOMS) for _ in range(rng.randint(1, 3))), i) for i in range(rng.randint(0, 8))]
+            names = ['.'.join(rng.choice(_NAME_ATOMS) for _ in range(rng.randint(1, 4))) for _ in range(30)]
+            reference = [_sequential_match(rules, n) for n in names]
+            unused = {r for r, v in rules if v not in reference}
+
+            matcher = NameMatcher(rules)
+            with matcher:
+                self.assertEqual(matcher.match_all(names), reference)
+            self.assertEqual(matcher.get_last_stat()[1], unused)
+            with matcher:
+                self.assertEqual([matcher.match(n) for n in names], reference)
+            self.assertEqual(matcher.get_last_stat()[1], unused)
+
+    def test_rule_change(self):
+        matcher = NameMatcher([('encoder.*', 'enc')])
+        with matcher:
+            self.assertEqual(matcher.match('encoder.weight'), 'enc')
+            matcher.append_rule(('decoder.*', 'dec'))
+            matcher.append_rule(('head.*', 'head'))
+            self.assertEqual(matcher.match('decoder.weight'), 'dec')
+            self.assertIsNone(matcher.match('other.weight'))
+        matched, unused = matcher.get_last_stat()
+        self.assertEqual([m[2] for m in matched], ['enc', 'dec'])
+        self.assertEqual(unused, {'head.*'})
+
+        with matcher:
+            matcher.insert_rule(0, ('*.weight', 'weight'))
+            self.assertEqual(matcher.match_all(['encoder.weight', 'head.bias']), ['weight', 'head'])
+        self.assertEqual(matcher.get_last_stat()[1], {'encoder.*', 'decoder.*'})
+
+        with matcher:
+            matcher.pop_rule(0)
+        self.assertEqual(matcher.get_last_stat()[1], {'encoder.*', 'decoder.*', 'head.*'})
+
+
+if __name__ == '__main__':
+    unittest.main()